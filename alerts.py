@@ -0,0 +1,223 @@
+# alerts.py
+# Сповіщення про курс (/alert): користувач задає поріг для пари, і бот пише,
+# щойно курс банку перетне його.  Пороги зберігаються в SQLite, а в пам'яті
+# для кожної пари тримаються два відсортовані списки (вище/нижче порога).
+# Після оновлення курсів (слухач api.add_refresh_listener) спрацьовані пороги
+# знаходяться бінарним пошуком і відрізаються з краю списку, тож перевірка
+# коштує O(log n) на пару плюс кількість спрацьованих сповіщень, а не
+# перебір усіх підписників.  Повідомлення надсилає планувальник sender.py.
+import bisect
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+import db
+import metrics
+
+ALERTS_PER_CHAT = int(os.getenv("ALERTS_PER_CHAT", 10))  # Скільки сповіщень може мати один чат
+
+# Напрямок порога: 'above' - курс піднявся до порога або вище, 'below' - опустився до порога або нижче
+DIRECTIONS = {'>': 'above', '>=': 'above', 'ABOVE': 'above', 'ВИЩЕ': 'above',
+              '<': 'below', '<=': 'below', 'BELOW': 'below', 'НИЖЧЕ': 'below'}
+_CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+
+logger = logging.getLogger(__name__)
+
+Alert = namedtuple("Alert", ["id", "chat_id", "source", "from_currency", "to_currency", "direction", "threshold"])
+
+
+def is_triggered(direction, threshold, rate):
+    """Чи виконується умова сповіщення для курсу rate."""
+    return rate >= threshold if direction == 'above' else rate <= threshold
+
+
+def parse_alert_args(text):
+    """
+    Розбирає аргументи команди /alert.
+
+    Підтримуються форми:
+        /alert                      - список сповіщень
+        /alert USD UAH > 42.5       - нове сповіщення (також USD/UAH, above/below, вище/нижче)
+        /alert del 3                - видалити сповіщення з номером 3
+        /alert clear                - видалити всі сповіщення чату
+
+    Returns:
+        ('list',), ('add', from, to, direction, threshold), ('delete', id),
+        ('clear',) або None, якщо аргументи не розпізнано.
+    """
+    parts = text.upper().replace("/", " ").split()[1:]
+    if not parts:
+        return ('list',)
+    if parts[0] in ("DEL", "DELETE") and len(parts) == 2 and parts[1].isdigit():
+        return ('delete', int(parts[1]))
+    if parts == ["CLEAR"]:
+        return ('clear',)
+    if len(parts) != 4 or not (_CURRENCY_RE.match(parts[0]) and _CURRENCY_RE.match(parts[1])):
+        return None
+    direction = DIRECTIONS.get(parts[2])
+    try:
+        threshold = float(parts[3].replace(",", "."))
+    except ValueError:
+        return None
+    if direction is None or not threshold > 0 or math.isinf(threshold) or parts[0] == parts[1]:
+        return None
+    return ('add', parts[0], parts[1], direction, threshold)
+
+
+class AlertIndex:
+    """
+    Активні сповіщення: SQLite як постійне сховище і відсортований індекс порогів у пам'яті.
+
+    Args:
+        notify: Функція notify(alert, rate), яка викликається для кожного спрацьованого
+            сповіщення (після того, як його видалено з індексу і бази).
+    """
+
+    def __init__(self, notify):
+        self.notify = notify
+        self._alerts = {}  # id -> Alert
+        self._by_chat = {}  # chat_id -> set(id)
+        # source -> {(from, to): {'above': [(threshold, id), ...], 'below': [...]}}, списки відсортовані
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def _insert(self, alert):
+        self._alerts[alert.id] = alert
+        self._by_chat.setdefault(alert.chat_id, set()).add(alert.id)
+        pairs = self._index.setdefault(alert.source, {})
+        sides = pairs.setdefault((alert.from_currency, alert.to_currency), {'above': [], 'below': []})
+        bisect.insort(sides[alert.direction], (alert.threshold, alert.id))
+
+    def _forget(self, alert_id):
+        """Видаляє сповіщення зі словників (але не зі списку порогів); повертає Alert."""
+        alert = self._alerts.pop(alert_id)
+        chat_alerts = self._by_chat[alert.chat_id]
+        chat_alerts.discard(alert_id)
+        if not chat_alerts:
+            del self._by_chat[alert.chat_id]
+        return alert
+
+    def _discard(self, alert_id):
+        """Видаляє сповіщення з пам'яті (під self._lock); повертає Alert або None."""
+        if alert_id not in self._alerts:
+            return None
+        alert = self._forget(alert_id)
+        pairs = self._index[alert.source]
+        key = (alert.from_currency, alert.to_currency)
+        thresholds = pairs[key][alert.direction]
+        position = bisect.bisect_left(thresholds, (alert.threshold, alert_id))
+        if position < len(thresholds) and thresholds[position] == (alert.threshold, alert_id):
+            del thresholds[position]
+        if not pairs[key]['above'] and not pairs[key]['below']:
+            del pairs[key]
+        return alert
+
+    def load(self):
+        """Завантажує сповіщення з бази (при старті бота)."""
+        try:
+            rows = db.load_alerts()
+        except sqlite3.Error as e:
+            logger.warning("Не вдалося завантажити сповіщення: %s", e)
+            return
+        with self._lock:
+            for row in rows:
+                self._insert(Alert(*row))
+        logger.info("Завантажено сповіщень: %d", len(rows))
+
+    def add(self, chat_id, source, from_currency, to_currency, direction, threshold):
+        """
+        Додає сповіщення.
+
+        Returns:
+            Нове сповіщення (Alert) або None, якщо чат уже має ALERTS_PER_CHAT сповіщень.
+        """
+        with self._lock:
+            if len(self._by_chat.get(chat_id, ())) >= ALERTS_PER_CHAT:
+                return None
+        # Запис у базу - без блокування, щоб не затримувати check()
+        alert_id = db.add_alert(chat_id, source, from_currency, to_currency, direction, threshold)
+        alert = Alert(alert_id, chat_id, source, from_currency, to_currency, direction, threshold)
+        with self._lock:
+            # Поки ми писали в базу, паралельний /alert цього чату міг зайняти останнє місце
+            full = len(self._by_chat.get(chat_id, ())) >= ALERTS_PER_CHAT
+            if not full:
+                self._insert(alert)
+        if full:
+            db.delete_alerts([alert_id])
+            return None
+        return alert
+
+    def remove(self, chat_id, alert_id):
+        """Видаляє сповіщення чату; повертає False, якщо такого немає."""
+        with self._lock:
+            alert = self._alerts.get(alert_id)
+            if alert is None or alert.chat_id != chat_id:
+                return False
+            self._discard(alert_id)
+        db.delete_alerts([alert_id])
+        return True
+
+    def clear(self, chat_id):
+        """Видаляє всі сповіщення чату; повертає їх кількість."""
+        with self._lock:
+            alert_ids = list(self._by_chat.get(chat_id, ()))
+            for alert_id in alert_ids:
+                self._discard(alert_id)
+        if alert_ids:
+            db.delete_alerts(alert_ids)
+        return len(alert_ids)
+
+    def chat_alerts(self, chat_id):
+        """Сповіщення чату, відсортовані за номером."""
+        with self._lock:
+            return sorted((self._alerts[alert_id] for alert_id in self._by_chat.get(chat_id, ())),
+                          key=lambda alert: alert.id)
+
+    def check(self, source, entry):
+        """
+        Слухач оновлення кешу: знаходить сповіщення, чий поріг перетнув новий курс.
+
+        Перевіряються лише пари, для яких є сповіщення.  Спрацьовані сповіщення
+        видаляються (вони одноразові) і передаються в notify.  Курси, відновлені
+        зі знімка при старті, можуть бути застарілими, тож за ними сповіщення не спрацьовують.
+        """
+        if entry.get('restored'):
+            return
+        rate_index = entry['index']
+        fired = []
+        with self._lock:
+            pairs = self._index.get(source)
+            if not pairs:
+                return
+            for key, sides in list(pairs.items()):
+                quote = rate_index.get(key)
+                if quote is None:
+                    continue
+                above, below = sides['above'], sides['below']
+                # Спрацьовані пороги - префікс списку "вище" і суфікс списку "нижче"
+                end = bisect.bisect_right(above, (quote.rate, math.inf))
+                start = bisect.bisect_left(below, (quote.rate, -math.inf))
+                crossed = above[:end] + below[start:]
+                if not crossed:
+                    continue
+                del above[:end], below[start:]
+                if not above and not below:
+                    del pairs[key]
+                fired.extend((self._forget(alert_id), quote.rate) for _, alert_id in crossed)
+        if not fired:
+            return
+        try:
+            db.delete_alerts([alert.id for alert, _ in fired])
+        except sqlite3.Error as e:
+            logger.warning("Не вдалося видалити спрацьовані сповіщення: %s", e)
+        metrics.inc("alerts_fired_total", len(fired), source=source)
+        for alert, rate in fired:
+            self.notify(alert, rate)
+
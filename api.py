@@ -1,89 +1,751 @@
 import requests  # Для виконання HTTP-запитів до API
+import asyncio  # Для асинхронного режиму роботи бота
+from requests.adapters import HTTPAdapter  # Пул з'єднань і повтори для сесії requests
+from urllib3.util.retry import Retry  # Політика повторних запитів з паузами між ними
+from urllib.parse import urlsplit  # Для визначення хоста API банку
 import json  # Для обробки JSON-відповідей від API
 import os  # Для доступу до змінних оточення
 import time  # Імпорт модуля time для роботи з часом (для кешування)
+import logging  # Для журналювання оновлень кешу
+import threading  # Для блокувань при одночасному оновленні кешу
+import random  # Для випадкового зсуву (jitter) часу фонового оновлення
+import sqlite3  # Для обробки помилок збереження знімків курсів
+import itertools  # Лічильник поколінь кешу курсів
+import functools  # Для прив'язки назви банку до функції запиту
+import abc  # Абстрактний базовий клас адаптера банку
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures  # Паралельні запити в режимі порівняння
 from dotenv import load_dotenv  # Для завантаження змінних оточення з .env
 
+import db  # Для збереження знімків курсів між перезапусками
+import metrics  # Лічильники кешу та затримки запитів до банків
+from rates import build_rate_index, get_index_currencies, compare_quotes, EMPTY_INDEX  # Індекс пар валют для швидкого пошуку курсу
+from utils import CURRENCY_NAMES_MONOBANK, CURRENCY_NAMES_PRIVATBANK  # Коди валют у відповідях банків
+
 load_dotenv()  # Завантажуємо змінні оточення
 
-# Отримуємо URL API Monobank з змінної оточення
-MONOBANK_API_URL = os.getenv("MONOBANK_API_URL")
-if MONOBANK_API_URL is None:
-    raise ValueError("MONOBANK_API_URL is not set in .env file")
+# Отримуємо URL API Monobank з змінної оточення (за замовчуванням - публічний API)
+MONOBANK_API_URL = os.getenv("MONOBANK_API_URL", "https://api.monobank.ua/bank/currency")
 
 # URL API ПриватБанку (готівковий курс)
-PRIVATBANK_API_URL = "https://api.privatbank.ua/p24api/pubinfo?exchange&coursid=5"
+PRIVATBANK_API_URL = os.getenv("PRIVATBANK_API_URL", "https://api.privatbank.ua/p24api/pubinfo?exchange&coursid=5")
 # PRIVATBANK_API_URL = "https://api.privatbank.ua/p24api/pubinfo?exchange&coursid=11"  # Безготівковий (закоментовано)
 
-# Словник для кешування курсів валют.  Ключі - назви банків, значення - словники з даними і часом.
+# Словник для кешування курсів валют.  Ключі - назви банків, значення - словники з даними,
+# часом та індексом пар.  Запис для банку завжди замінюється цілком (одним присвоєнням),
+# тому обробники ніколи не бачать дані з одного запиту, а індекс - з іншого.
 cached_rates = {}
 CACHE_LIFETIME = 900  # Час життя кешу в секундах (15 хвилин)
-def get_monobank_rates(cached=True):
-    """Отримує курси валют з API Monobank, використовуючи кеш."""
-    now = time.time()  # Поточний час (в секундах з початку епохи)
+_generations = itertools.count(1)  # Кожне оновлення кешу отримує новий номер покоління
+_refresh_listeners = []  # Функції (source, entry), які викликаються після кожного оновлення кешу
+COMPARE_DEADLINE = float(os.getenv("COMPARE_DEADLINE", 2.5))  # Скільки секунд чекати на банки в режимі порівняння
+
+
+def _source_config(prefix, url, refresh_interval, max_stale_minutes, jitter):
+    """Зчитує налаштування кешу та HTTP-клієнта для банку зі змінних оточення з префіксом prefix."""
+    return {
+        'url': url,
+        # Скільки секунд дані вважаються актуальними
+        'cache_lifetime': float(os.getenv(f"{prefix}_CACHE_LIFETIME", CACHE_LIFETIME)),
+        # Через скільки секунд після запиту фоновий потік оновлює дані (має бути менше cache_lifetime)
+        'refresh_interval': float(os.getenv(f"{prefix}_REFRESH_INTERVAL", refresh_interval)),
+        # Випадковий зсув часу оновлення (+/- секунд), щоб кілька копій бота не йшли в API одночасно
+        'refresh_jitter': float(os.getenv(f"{prefix}_REFRESH_JITTER", jitter)),
+        # Максимальний вік даних (у хвилинах), які ще можна віддавати, якщо оновлення не вдається
+        'max_stale': float(os.getenv(f"{prefix}_MAX_STALE_MINUTES", max_stale_minutes)) * 60,
+        # Тайм-аути з'єднання та читання відповіді (секунди)
+        'connect_timeout': float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", 3.05)),
+        'read_timeout': float(os.getenv(f"{prefix}_READ_TIMEOUT", 10)),
+        # Кількість повторів при мережевих помилках і відповідях 5xx та множник паузи між ними
+        'retries': int(os.getenv(f"{prefix}_RETRIES", 2)),
+        'retry_backoff': float(os.getenv(f"{prefix}_RETRY_BACKOFF", 0.5)),
+        # Після скількох невдалих запитів поспіль перестаємо звертатися до API і на скільки секунд
+        'circuit_failures': int(os.getenv(f"{prefix}_CIRCUIT_FAILURES", 3)),
+        'circuit_reset': float(os.getenv(f"{prefix}_CIRCUIT_RESET", 120)),
+    }
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Запобіжник для API банку: після кількох невдалих запитів поспіль перестає
+    звертатися до API на reset_timeout секунд, і бот одразу віддає дані з кешу.
+    Після паузи пропускає один пробний запит.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None  # Час, коли запобіжник спрацював (None - запити дозволені)
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Чи можна зараз робити запит до API."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at < self.reset_timeout:
+                return False
+            self.opened_at = time.time()  # Пробний запит; інші чекають ще reset_timeout
+            return True
+
+    def is_open(self):
+        """Чи заблоковані зараз запити до API."""
+        with self._lock:
+            return self.opened_at is not None and time.time() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+def _mount_retries(session, config):
+    """Налаштовує для хоста банку пул з'єднань і повтори запитів."""
+    retry = Retry(total=config['retries'], backoff_factor=config['retry_backoff'],
+                  status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset(['GET']),
+                  raise_on_status=False)
+    parts = urlsplit(config['url'])
+    session.mount(f"{parts.scheme}://{parts.netloc}/", HTTPAdapter(max_retries=retry))
+
+
+def _create_session():
+    """
+    Створює спільну сесію requests з пулом з'єднань (keep-alive) і повторами
+    запитів, налаштованими окремо для хоста кожного банку.
+    """
+    session = requests.Session()
+    for config in SOURCE_CONFIG.values():
+        _mount_retries(session, config)
+    return session
+
+
+_session = None  # Сесія requests створюється при першому запиті (див. _get_session)
+_session_lock = threading.Lock()
+
+
+class RateSource(abc.ABC):
+    """
+    Адаптер джерела курсів.  Щоб додати банк, достатньо описати підклас з
+    назвою, URL і розбором відповіді API та зареєструвати його через
+    register_source: кеш, запобіжник, фонове оновлення, вибір банку в /source
+    і порівняння банків підхоплять його без змін в обробниках.
+
+    Налаштування кешу та HTTP-клієнта зчитуються зі змінних оточення з
+    префіксом env_prefix (див. _source_config).  Підклас без pairs не
+    вдасться створити (TypeError ще при реєстрації).
+    """
+    name = None  # Ключ джерела в кеші, сесіях і базі ('monobank')
+    title = None  # Напис на кнопці вибору банку
+    display_name = None  # Назва банку в повідомленнях бота
+    env_prefix = None  # Префікс змінних оточення (MONOBANK_CACHE_LIFETIME, ...)
+    url = None  # URL API з курсами
+    refresh_interval = 600
+    max_stale_minutes = 60
+    refresh_jitter = 30
+
+    def __init__(self):
+        self.config = _source_config(self.env_prefix, self.url, refresh_interval=self.refresh_interval,
+                                     max_stale_minutes=self.max_stale_minutes, jitter=self.refresh_jitter)
+
+    @abc.abstractmethod
+    def pairs(self, data):
+        """
+        Розбирає відповідь API банку.
+
+        Returns:
+            Кортеж (currency_a, currency_b, buy, sell, cross) для кожної пари, де
+            buy/sell - курс купівлі/продажу currency_a в currency_b (None або 0,
+            якщо банк їх не дає), а cross - єдиний крос-курс або None.
+        """
+
+
+class MonobankSource(RateSource):
+    name = 'monobank'
+    title = "Monobank"
+    display_name = "Monobank"
+    env_prefix = "MONOBANK"
+    url = MONOBANK_API_URL
+
+    _reported_codes = set()  # Невідомі коди, про які вже записано в журнал
+
+    def pairs(self, data):
+        pairs = []
+        unknown = set()
+        for row in data or ():
+            code_a, code_b = row.get('currencyCodeA'), row.get('currencyCodeB')
+            currency_a = CURRENCY_NAMES_MONOBANK.get(code_a)
+            currency_b = CURRENCY_NAMES_MONOBANK.get(code_b)
+            if currency_a is None or currency_b is None:
+                # Назву з числа не вигадуємо: такий "код" потрапив би в індекс, клавіатури і /bulk
+                unknown.update(code for code, currency in ((code_a, currency_a), (code_b, currency_b))
+                               if currency is None)
+                continue
+            pairs.append((currency_a, currency_b, row.get('rateBuy'), row.get('rateSell'), row.get('rateCross')))
+        new_codes = unknown - self._reported_codes
+        if new_codes:
+            self._reported_codes.update(new_codes)
+            logger.warning("Monobank: пропущено курси з невідомими кодами валют %s",
+                           ", ".join(sorted(map(str, new_codes))))
+        return tuple(pairs)
+
+
+class PrivatBankSource(RateSource):
+    name = 'privatbank'
+    title = "PrivatBank"
+    display_name = "ПриватБанк"
+    env_prefix = "PRIVATBANK"
+    url = PRIVATBANK_API_URL
+
+    def pairs(self, data):
+        pairs = []
+        for row in data or ():
+            currency_a = row.get('ccy')
+            currency_b = row.get('base_ccy')
+            if not currency_a or not currency_b:
+                continue
+            try:
+                buy = float(row.get('buy') or 0)
+                sell = float(row.get('sale') or 0)
+            except (TypeError, ValueError):
+                continue  # Пропускаємо рядки з некоректними курсами
+            pairs.append((CURRENCY_NAMES_PRIVATBANK.get(currency_a, currency_a),
+                          CURRENCY_NAMES_PRIVATBANK.get(currency_b, currency_b), buy, sell, None))
+        return tuple(pairs)
+
+
+# Зареєстровані джерела курсів у порядку реєстрації (див. register_source)
+SOURCES = {}
+SOURCE_CONFIG = {}  # Налаштування кешу та фонового оновлення для кожного банку
+_breakers = {}
+# Одночасно оновлювати кеш для одного банку може лише один потік (single-flight).
+# Решта потоків отримують застарілі дані, а якщо кеш порожній - чекають на результат.
+_refresh_locks = {}
+refresh_counts = {}  # Кількість запитів до API кожного банку
+
+
+def register_source(source):
+    """
+    Додає джерело курсів (екземпляр RateSource) до реєстру.
+
+    Returns:
+        Те саме джерело, щоб реєстрацію можна було записати одним рядком.
+    """
+    config = source.config
+    SOURCES[source.name] = source
+    SOURCE_CONFIG[source.name] = config
+    _breakers[source.name] = CircuitBreaker(config['circuit_failures'], config['circuit_reset'])
+    _refresh_locks[source.name] = threading.Lock()
+    refresh_counts.setdefault(source.name, 0)
+    with _session_lock:
+        if _session is not None:  # Сесію вже створено - додаємо повтори для нового хоста
+            _mount_retries(_session, config)
+    return source
+
+
+register_source(MonobankSource())
+register_source(PrivatBankSource())
+
+
+def get_source_name(source):
+    """Назва банку для повідомлень (або сам ключ, якщо такого джерела немає)."""
+    adapter = SOURCES.get(source)
+    return adapter.display_name if adapter else source
+
+
+def find_source(title):
+    """Ключ джерела за написом на кнопці вибору банку, або None."""
+    for name, adapter in SOURCES.items():
+        if adapter.title == title:
+            return name
+    return None
+
+
+def _get_session():
+    """Повертає спільну сесію requests, створюючи її при першому зверненні."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def _http_get(source):
+    """Виконує GET-запит до API банку через спільну сесію з тайм-аутами для цього банку."""
+    config = SOURCE_CONFIG[source]
+    started = time.perf_counter()
+    try:
+        response = _get_session().get(config['url'], timeout=(config['connect_timeout'], config['read_timeout']))
+    except requests.exceptions.RequestException as e:
+        metrics.inc("bank_request_errors_total", source=source, code=type(e).__name__)
+        raise
+    finally:
+        metrics.observe("bank_request_seconds", time.perf_counter() - started, source=source)
+    if response.status_code >= 400:
+        metrics.inc("bank_request_errors_total", source=source, code=response.status_code)
+    return response
+
+
+# Фоновий потік, який оновлює кеш заздалегідь (див. start_prefetcher)
+_prefetcher_thread = None
+_prefetcher_stop = threading.Event()
+# Те саме для режиму asyncio (див. start_async_prefetcher)
+_async_prefetch_task = None
+_async_clients = {}  # Джерело -> httpx.AsyncClient з повторами з його конфігурації
+_async_refresh_locks = {}
+
+
+def _background_refresh_active():
+    """Чи оновлює кеш фоновий потік або асинхронна задача."""
+    return _prefetcher_thread is not None or _async_prefetch_task is not None
+
+
+def _is_fresh(source, entry, now):
+    """Чи є запис кешу актуальним."""
+    return entry is not None and (now - entry.get('timestamp', 0)) < SOURCE_CONFIG[source]['cache_lifetime']
+
+
+def _get_from_memory(source):
+    """
+    Повертає дані з кешу без звернення до мережі (коли працює фоновий потік оновлення).
+
+    Застарілі дані віддаються, поки їх вік не перевищить max_stale для банку.
+    """
+    entry = cached_rates.get(source)
+    if entry is None:
+        metrics.inc("rates_cache_requests_total", source=source, result="miss")
+        return None
+    age = time.time() - entry.get('timestamp', 0)
+    if age > SOURCE_CONFIG[source]['max_stale']:
+        logger.warning("Дані %s застаріли на %.0f с, оновлення не вдається", source, age)
+        metrics.inc("rates_cache_requests_total", source=source, result="miss")
+        return None
+    fresh = age < SOURCE_CONFIG[source]['cache_lifetime']
+    metrics.inc("rates_cache_requests_total", source=source, result="hit" if fresh else "stale")
+    return entry['data']
+
+
+def _store_rates(source, data, now, restored=False):
+    """
+    Будує індекс пар, атомарно замінює запис кешу для банку і сповіщає слухачів.
+
+    restored=True позначає курси, відновлені зі знімка в базі, а не отримані від API.
+    """
+    pairs = SOURCES[source].pairs(data)
+    index = build_rate_index(pairs)
+    entry = {'data': data, 'pairs': pairs, 'timestamp': now, 'index': index,
+             'currencies': get_index_currencies(index), 'generation': next(_generations),
+             'restored': restored}
+    cached_rates[source] = entry
+    for listener in _refresh_listeners:
+        try:
+            listener(source, entry)
+        except Exception:  # Помилка слухача не повинна зривати оновлення кешу
+            logger.exception("Помилка обробника оновлення курсів %s", source)
+
+
+def add_refresh_listener(listener):
+    """
+    Реєструє функцію, яка викликається після кожного оновлення кешу курсів.
+
+    Args:
+        listener: Функція listener(source, entry), де entry - новий запис cached_rates
+            (ключі 'data', 'pairs', 'timestamp', 'index', 'currencies', 'generation', 'restored';
+            'restored' істинний для курсів зі знімка, завантаженого при старті).
+            Викликається в потоці, який оновив кеш, тому має працювати швидко.
+    """
+    _refresh_listeners.append(listener)
+
+
+def _save_snapshot(source, data, fetched_at):
+    """Зберігає знімок курсів у базу даних, щоб після перезапуску не йти в API одразу."""
+    try:
+        db.save_rate_snapshot(source, fetched_at, data)
+    except sqlite3.Error as e:
+        logger.warning("Не вдалося зберегти знімок курсів %s: %s", source, e)
+
+
+def load_snapshots():
+    """
+    Заповнює кеш збереженими знімками курсів (викликається при старті бота).
+
+    Знімок зберігає свій час запиту, тому фонове оновлення почнеться лише тоді,
+    коли він застаріє, а до того бот одразу відповідає з пам'яті.
+    """
+    try:
+        snapshots = db.load_rate_snapshots()
+    except sqlite3.Error as e:
+        logger.warning("Не вдалося завантажити знімки курсів: %s", e)
+        return
+    for source, (fetched_at, data) in snapshots.items():
+        if source in SOURCES and source not in cached_rates:
+            _store_rates(source, data, fetched_at, restored=True)
+            logger.info("Завантажено знімок курсів %s (вік %.0f с)", source, time.time() - fetched_at)
+
+
+def _get_single_flight(source, fetch, cached):
+    """
+    Повертає курси з кешу або оновлює їх, гарантуючи, що запит до API банку
+    виконує лише один потік.
+
+    Args:
+        source: Назва банку (ключ у cached_rates).
+        fetch: Функція, яка робить запит до API та повертає дані або None.
+        cached: Чи можна використати актуальні дані з кешу.
+
+    Returns:
+        Дані з API, з кешу (можливо застарілі) або None.
+    """
+    if cached and _background_refresh_active():
+        return _get_from_memory(source)  # Обробники не чекають на мережу - кеш оновлює фоновий потік
+
+    entry = cached_rates.get(source)
+    if cached and _is_fresh(source, entry, time.time()):
+        metrics.inc("rates_cache_requests_total", source=source, result="hit")
+        return entry['data']
+
+    lock = _refresh_locks[source]
+    if lock.acquire(blocking=False):
+        try:
+            # Поки ми брали блокування, інший потік міг уже оновити кеш
+            entry = cached_rates.get(source)
+            if cached and _is_fresh(source, entry, time.time()):
+                metrics.inc("rates_cache_requests_total", source=source, result="hit")
+                return entry['data']
+            metrics.inc("rates_cache_requests_total", source=source, result="miss")
+            if not _request_allowed(source):
+                return entry['data'] if entry else None
+            refresh_counts[source] += 1
+            logger.info("Оновлення курсів %s (запит #%d)", source, refresh_counts[source])
+            data = fetch()
+            if data is not None:
+                now = time.time()
+                _store_rates(source, data, now)
+                _save_snapshot(source, data, now)
+                return data
+            # Запит не вдався - краще віддати застарілі дані, ніж нічого
+            return entry['data'] if entry else None
+        finally:
+            lock.release()
 
-    # Перевірка наявності даних в кеші та їх актуальності
-    if cached and 'monobank' in cached_rates and (now - cached_rates['monobank'].get('timestamp', 0)) < CACHE_LIFETIME:
-        print("Using cached data (Monobank)")  # Повідомлення для налагодження (можна вимкнути)
-        return cached_rates['monobank']['data']  # Повертаємо дані з кешу
+    # Кеш вже оновлює інший потік
+    if cached and entry is not None:
+        logger.debug("Оновлення %s вже виконується, повертаємо застарілі дані", source)
+        metrics.inc("rates_cache_requests_total", source=source, result="stale")
+        return entry['data']
+    metrics.inc("rates_cache_requests_total", source=source, result="miss")
+    with lock:  # Кешу немає - чекаємо, поки інший потік завершить запит
+        pass
+    entry = cached_rates.get(source)
+    return entry['data'] if entry else None
 
-    # Якщо даних в кеші немає або вони застарілі, робимо запит до API
+
+def _request_allowed(source):
+    """Чи дозволяє запобіжник запит до API банку (перевіряється один раз перед кожним запитом)."""
+    if _breakers[source].allow():
+        return True
+    logger.info("API %s тимчасово вимкнено після помилок, використовуємо кеш", SOURCES[source].display_name)
+    metrics.inc("bank_request_errors_total", source=source, code="circuit_open")
+    return False
+
+
+def _fetch(source):
+    """Робить запит до API банку (запобіжник уже перевірено).  Повертає список курсів або None."""
+    name = SOURCES[source].display_name
+    breaker = _breakers[source]
     try:
-        response = requests.get(MONOBANK_API_URL)
+        response = _http_get(source)
         response.raise_for_status()  # Перевірка на HTTP-помилки (4xx, 5xx)
         data = response.json()  # Перетворюємо JSON-відповідь на словник Python
         if not data: # Перевірка, чи API повернув не пусті дані
-            raise ValueError("API Monobank returned empty data.")
-        cached_rates['monobank'] = {'data': data, 'timestamp': now}  # Зберігаємо дані в кеш
+            raise ValueError(f"API {SOURCES[source].title} returned empty data.")
+        breaker.record_success()
         return data  # Повертаємо дані
 
     # Обробка помилок
     except requests.exceptions.RequestException as e:
-        print(f"Помилка запиту до API Monobank: {e}")
+        logger.warning("Помилка запиту до API %s: %s", name, e)
     except (json.JSONDecodeError, ValueError) as e:
-        print(f"Помилка обробки даних від API Monobank: {e}")
+        logger.warning("Помилка обробки даних від API %s: %s", name, e)
+    breaker.record_failure()
     return None  # Повертаємо None у разі будь-якої помилки
+
+
+def get_monobank_rates(cached=True):
+    """Отримує курси валют з API Monobank, використовуючи кеш."""
+    return get_rates('monobank', cached)
+
+
 def get_privatbank_rates(cached=True):
     """Отримує курси валют з API ПриватБанку, використовуючи кеш."""
-    now = time.time()
+    return get_rates('privatbank', cached)
+
 
-    # Перевірка кешу
-    if cached and 'privatbank' in cached_rates and (now - cached_rates['privatbank'].get('timestamp', 0)) < CACHE_LIFETIME:
-        # print("Using cached data (PrivatBank)") # Можна закоментувати, щоб не виводити повідомлення
-        return cached_rates['privatbank']['data']
+def _next_refresh_at(source):
+    """Час наступного фонового оновлення для банку (з випадковим зсувом)."""
+    config = SOURCE_CONFIG[source]
+    entry = cached_rates.get(source)
+    if entry is None:
+        return time.time()  # Даних ще немає - оновлюємо одразу
+    jitter = random.uniform(-config['refresh_jitter'], config['refresh_jitter'])
+    return entry['timestamp'] + config['refresh_interval'] + jitter
+
+
+def _prefetch_loop():
+    """Фоновий цикл: оновлює курси кожного банку до того, як кеш застаріє."""
+    retry_delay = 30  # Пауза перед повтором, якщо запит до банку не вдався
+    next_run = {}
+    while not _prefetcher_stop.is_set():
+        now = time.time()
+        for source in list(SOURCES):
+            if now < next_run.setdefault(source, _next_refresh_at(source)):  # Банк міг з'явитися після старту
+                continue
+            before = cached_rates.get(source)
+            _get_single_flight(source, functools.partial(_fetch, source), cached=False)
+            if cached_rates.get(source) is before:  # Оновлення не вдалося
+                next_run[source] = time.time() + retry_delay
+            else:
+                next_run[source] = _next_refresh_at(source)
+        _prefetcher_stop.wait(max(0.0, min(next_run.values()) - time.time()))
+
+
+def start_prefetcher():
+    """
+    Запускає фоновий потік оновлення курсів.
 
-    # Запит до API
+    Після запуску обробники завжди читають курси лише з пам'яті і ніколи не
+    чекають на відповідь API банку.
+    """
+    global _prefetcher_thread
+    if _prefetcher_thread is not None:
+        return
+    _prefetcher_stop.clear()
+    _prefetcher_thread = threading.Thread(target=_prefetch_loop, name="rates-prefetcher", daemon=True)
+    _prefetcher_thread.start()
+    logger.info("Фонове оновлення курсів запущено")
+
+
+def stop_prefetcher():
+    """Зупиняє фоновий потік оновлення курсів."""
+    global _prefetcher_thread
+    if _prefetcher_thread is None:
+        return
+    _prefetcher_stop.set()
+    _prefetcher_thread.join()
+    _prefetcher_thread = None
+
+
+async def _async_fetch(source):
+    """Асинхронний запит до API банку через httpx (запобіжник уже перевірено).  Повертає список курсів або None."""
+    import httpx  # Потрібен лише в режимі asyncio, тож не сповільнює імпорт модуля
+    config = SOURCE_CONFIG[source]
+    breaker = _breakers[source]
+    client = _async_clients.get(source)
+    if client is None:
+        # Клієнт на кожен банк: пул з'єднань і keep-alive, повтори при помилках з'єднання - з його конфігурації
+        client = _async_clients[source] = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=config['retries']))
+    started = time.perf_counter()
     try:
-        response = requests.get(PRIVATBANK_API_URL)
+        try:
+            response = await client.get(
+                config['url'], timeout=httpx.Timeout(config['read_timeout'], connect=config['connect_timeout']))
+        finally:
+            metrics.observe("bank_request_seconds", time.perf_counter() - started, source=source)
+        if response.status_code >= 400:
+            metrics.inc("bank_request_errors_total", source=source, code=response.status_code)
         response.raise_for_status()
         data = response.json()
-        if not data: # Перевірка на пустий результат
-            raise ValueError("API PrivatBank returned empty data.")
-
-        cached_rates['privatbank'] = {'data': data, 'timestamp': now}  # Зберігаємо в кеш
+        if not data:
+            raise ValueError(f"API {source} returned empty data.")
+        breaker.record_success()
         return data
+    except httpx.HTTPError as e:
+        if not isinstance(e, httpx.HTTPStatusError):
+            metrics.inc("bank_request_errors_total", source=source, code=type(e).__name__)
+        logger.warning("Помилка запиту до API %s: %s", SOURCES[source].display_name, e)
+    except ValueError as e:  # json.JSONDecodeError теж є ValueError
+        logger.warning("Помилка обробки даних від API %s: %s", SOURCES[source].display_name, e)
+    breaker.record_failure()
+    return None
+
+
+async def _async_refresh(source):
+    """
+    Асинхронно оновлює кеш для банку.  Якщо оновлення вже виконує інша
+    корутина, просто чекає на його завершення (single-flight).
+    """
+    lock = _async_refresh_locks.setdefault(source, asyncio.Lock())
+    if lock.locked():
+        async with lock:
+            return
+    async with lock:
+        if not _request_allowed(source):
+            return
+        refresh_counts[source] += 1
+        logger.info("Оновлення курсів %s (запит #%d, asyncio)", source, refresh_counts[source])
+        data = await _async_fetch(source)
+        if data is not None:
+            now = time.time()
+            # Слухачі оновлення (історія курсів, сповіщення) і знімок пишуть у SQLite,
+            # тому виконуємо їх у пулі потоків, щоб не блокувати цикл подій
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, _store_rates, source, data, now)
+            await loop.run_in_executor(None, _save_snapshot, source, data, now)
+
+
+async def _async_prefetch_loop():
+    """Асинхронний аналог _prefetch_loop: оновлює всі банки паралельно, коли настає їх час."""
+    retry_delay = 30
+    next_run = {source: _next_refresh_at(source) for source in SOURCE_CONFIG}
+    while True:
+        now = time.time()
+        due = [source for source, run_at in next_run.items() if now >= run_at]
+        before = {source: cached_rates.get(source) for source in due}
+        await asyncio.gather(*(_async_refresh(source) for source in due))
+        for source in due:
+            if cached_rates.get(source) is before[source]:  # Оновлення не вдалося
+                next_run[source] = time.time() + retry_delay
+            else:
+                next_run[source] = _next_refresh_at(source)
+        await asyncio.sleep(max(0.0, min(next_run.values()) - time.time()))
+
+
+def start_async_prefetcher():
+    """Запускає фонове оновлення курсів як задачу в поточному циклі подій asyncio."""
+    global _async_prefetch_task
+    if _async_prefetch_task is None:
+        _async_prefetch_task = asyncio.get_running_loop().create_task(_async_prefetch_loop())
+        logger.info("Фонове оновлення курсів запущено (asyncio)")
+
+
+async def stop_async_prefetcher():
+    """Зупиняє асинхронне фонове оновлення і закриває HTTP-клієнти."""
+    global _async_prefetch_task
+    if _async_prefetch_task is not None:
+        _async_prefetch_task.cancel()
+        try:
+            await _async_prefetch_task
+        except asyncio.CancelledError:
+            pass
+        _async_prefetch_task = None
+    while _async_clients:
+        _, client = _async_clients.popitem()
+        await client.aclose()
+
 
-    # Обробка помилок
-    except requests.exceptions.RequestException as e:
-        print(f"Помилка запиту до API ПриватБанку: {e}")
-        return None
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"Помилка обробки даних від API ПриватБанку: {e}")
-        return None
 def get_rates(source="monobank", cached=True):
     """
-    Отримує курси валют з вказаного джерела (Monobank або PrivatBank).
+    Отримує курси валют з вказаного джерела (див. SOURCES).
 
     Args:
-        source: Назва джерела ('monobank' або 'privatbank').  За замовчуванням 'monobank'.
+        source: Назва джерела ('monobank', 'privatbank' або інше зареєстроване).  За замовчуванням 'monobank'.
         cached: Чи використовувати кешування (True/False). За замовчуванням True.
 
     Returns:
         Словник з курсами валют або None, якщо сталася помилка, або якщо вказано невірне джерело.
     """
-    if source == "monobank":
-        return get_monobank_rates(cached)  # Викликаємо функцію для Monobank
-    elif source == "privatbank":
-        return get_privatbank_rates(cached)  # Викликаємо функцію для PrivatBank
-    else:
-        return None  # Повертаємо None, якщо джерело не підтримується
\ No newline at end of file
+    if source not in SOURCES:
+        return None  # Повертаємо None, якщо джерело не підтримується
+    return _get_single_flight(source, functools.partial(_fetch, source), cached)
+
+def get_rate_index(source="monobank", cached=True):
+    """
+    Повертає індекс (from, to) -> Quote для вказаного джерела.
+
+    Індекс будується один раз при оновленні кешу і містить як прямі курси банку,
+    так і крос-курси через валюту-посередника, тому пошук курсу для будь-якої
+    пари валют - це один запит до словника.
+
+    Returns:
+        Незмінний словник котирувань, або None, якщо курси отримати не вдалося.
+    """
+    if get_rates(source, cached) is None:
+        return None
+    return cached_rates.get(source, {}).get('index', EMPTY_INDEX)
+
+def get_rates_entry(source="monobank", cached=True):
+    """
+    Повертає запис кешу для джерела: дані разом з номером покоління ('generation').
+
+    Номер покоління змінюється лише при оновленні курсів, тож за ним можна
+    кешувати все, що будується з даних (наприклад, текст /rates).
+    """
+    if get_rates(source, cached) is None:
+        return None
+    return cached_rates.get(source)
+
+def get_supported_currencies(source="monobank", cached=True):
+    """Повертає множину валют, між якими можна конвертувати для вказаного джерела."""
+    if get_rates(source, cached) is None:
+        return frozenset()
+    return cached_rates.get(source, {}).get('currencies', frozenset())
+
+_compare_executor = None  # Пул потоків для паралельних запитів до банків (створюється при першому порівнянні)
+_compare_lock = threading.Lock()
+
+
+def _compare_sources(sources):
+    """Банки для порівняння: усі (або вказані) зареєстровані, крім тих, чий запобіжник зараз спрацював."""
+    sources = list(SOURCES if sources is None else sources)
+    available = [source for source in sources if source in SOURCES and not _breakers[source].is_open()]
+    skipped = [source for source in sources if source not in available]
+    return available, skipped
+
+
+def get_rates_entries(sources=None, deadline=COMPARE_DEADLINE, cached=True):
+    """
+    Отримує записи кешу кількох банків паралельно, чекаючи на них не довше deadline секунд.
+
+    Банки з відкритим запобіжником пропускаються.  Запити, що не встигли до
+    дедлайну, не скасовуються: вони завершаться у фоні й оновлять кеш.
+
+    Returns:
+        Кортеж (entries, missing): entries - словник source -> запис кешу (як
+        get_rates_entry) у порядку реєстрації банків, missing - банки без відповіді.
+    """
+    global _compare_executor
+    available, missing = _compare_sources(sources)
+    now = time.time()
+    # Актуальні курси (або всі, якщо кеш оновлює фоновий потік) читаються з пам'яті без пулу потоків
+    in_memory = [source for source in available
+                 if cached and (_background_refresh_active() or _is_fresh(source, cached_rates.get(source), now))]
+    results = {source: get_rates_entry(source) for source in in_memory}
+    pending = [source for source in available if source not in results]
+    if pending:
+        with _compare_lock:
+            if _compare_executor is None:
+                _compare_executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(SOURCES)),
+                                                       thread_name_prefix="rates-compare")
+        futures = {source: _compare_executor.submit(get_rates_entry, source, cached) for source in pending}
+        wait_futures(futures.values(), timeout=deadline)
+        results.update((source, future.result()) for source, future in futures.items()
+                       if future.done() and future.exception() is None)
+    entries = {}
+    for source in available:
+        if results.get(source):
+            entries[source] = results[source]
+        else:
+            missing.append(source)
+    return entries, missing
+
+
+def compare_rates(from_currency, to_currency, sources=None, deadline=COMPARE_DEADLINE):
+    """
+    Порівнює курс пари в усіх банках (режим порівняння для конвертації).
+
+    Returns:
+        rates.Comparison з банками, які відповіли до дедлайну.
+    """
+    entries, missing = get_rates_entries(sources, deadline)
+    return compare_quotes({source: entry['index'] for source, entry in entries.items()},
+                          from_currency, to_currency, missing)
@@ -0,0 +1,71 @@
+# async_bot.py
+# Асинхронний режим роботи бота (BOT_RUNTIME=async): оновлення отримує AsyncTeleBot,
+# курси оновлює фонова задача asyncio через httpx, а всі запити до Telegram
+# виконуються на одному циклі подій.  Обробники ті самі корутини, що й у режимі
+# потоків (main.py, runtime.py), тож команди, клавіатури й кроки діалогу не
+# розходяться між режимами.  Обробники виконуються прямо в циклі подій і чекають
+# на AsyncTeleBot через await; у пул потоків (asyncio.to_thread) ідуть лише
+# звернення до SQLite і сесій, а курси обробники читають з пам'яті.
+import asyncio
+import logging
+
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+from api import start_async_prefetcher, stop_async_prefetcher
+
+bot = None  # Екземпляр AsyncTeleBot, створюється в create_bot()
+loop = None  # Цикл подій бота
+
+
+class BotBridge:
+    """
+    Синхронний фасад AsyncTeleBot для потоків черги повідомлень (sender.py).
+
+    bridge.send_message(...) запускає корутину bot.send_message(...) в циклі подій
+    бота і чекає на її результат у потоці, що її викликав.
+    """
+
+    def __init__(self, async_bot, event_loop):
+        self._bot = async_bot
+        self._loop = event_loop
+
+    def __getattr__(self, name):
+        method = getattr(self._bot, name)
+
+        def call(*args, **kwargs):
+            return asyncio.run_coroutine_threadsafe(method(*args, **kwargs), self._loop).result()
+        return call
+
+
+def create_bot(token, handlers):
+    """Створює AsyncTeleBot з обробниками handlers (runtime.Handlers з main.py)."""
+    global bot
+    bot = AsyncTeleBot(token)
+    handlers.register(bot)
+    return bot
+
+
+async def run(app):
+    """
+    Запускає бота в режимі asyncio (кеш, історія і сповіщення вже підготовлені в main.run).
+
+    Args:
+        app: Модуль main.py (при запуску python main.py це __main__, а не main).
+    """
+    global loop
+    loop = asyncio.get_running_loop()
+    if app.TELEGRAM_API_URL:
+        asyncio_helper.API_URL = app.TELEGRAM_API_URL  # AsyncTeleBot не використовує apihelper.API_URL
+    create_bot(app.TOKEN, app.handlers)
+    # Обробники чекають на AsyncTeleBot, а SQLite і сесії - в пулі потоків
+    app.telegram = bot
+    app.blocking = asyncio.to_thread
+    # Черга повідомлень (sender.py) працює в окремих потоках і звертається до Telegram через цикл подій
+    app.bot = BotBridge(bot, loop)
+    start_async_prefetcher()
+    logging.info("Бот запущено (asyncio)...")
+    try:
+        await bot.infinity_polling()
+    finally:
+        await stop_async_prefetcher()
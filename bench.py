@@ -0,0 +1,290 @@
+# bench.py
+# Мікробенчмарки гарячих шляхів бота: пошук курсу, таблиця /rates,
+# get_currency_name, розбір inline-запитів, /trend та історія конвертацій у SQLite.
+# Курси беруться зі згенерованих відповідей банків (bench/fixtures): формат як
+# у справжніх API, реальні коди ISO 4217, але курси приблизні, а не записані.
+# Замість TeleBot підставляється заглушка, тож мережа не використовується.
+#
+# Запуск: python bench.py [--rows 10000,1000000,10000000] [--samples 2000]
+#         python bench.py --save-baseline   # зберегти результати як еталон
+# Результати порівнюються з bench/baseline.json (якщо він є): зростання p50
+# більше ніж на --tolerance позначається як REGRESSION.  Еталон у репозиторії
+# немає: час залежить від машини, тож його зберігають на тій, де запускають порівняння.
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_ROWS = "10000,1000000,10000000"
+DEFAULT_DB_DIR = os.path.join(tempfile.gettempdir(), "currency_bot_bench")  # Бази великі - не в репозиторії
+ROWS_PER_CHAT = 100  # Середня кількість записів історії на чат у тестовій базі
+
+INLINE_QUERIES = ["100 USD to UAH", "100 usd", "250.5 EUR to PLN", "1000 uah usd", "42 GBP to",
+                  "7 CHF to JPY", "abc", "100"]
+
+
+def load_fixture(source):
+    """Завантажує згенеровану відповідь API банку з bench/fixtures."""
+    with open(os.path.join(FIXTURES_DIR, f"{source}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def measure(func, samples, batch=1, warmup=50):
+    """
+    Вимірює час виконання func.
+
+    Args:
+        func: Функція без аргументів (один виклик - одна операція).
+        samples: Кількість вимірів.
+        batch: Скільки викликів у одному вимірі (для дуже швидких операцій,
+            щоб час виклику perf_counter не спотворював результат).
+        warmup: Кількість викликів перед вимірюванням.
+
+    Returns:
+        Словник з p50_us, p99_us (мікросекунди на операцію) і ops_per_s.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    started = time.perf_counter()
+    for _ in range(samples):
+        sample_start = time.perf_counter_ns()
+        for _ in range(batch):
+            func()
+        timings.append((time.perf_counter_ns() - sample_start) / batch)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {'p50_us': timings[len(timings) // 2] / 1000,
+            'p99_us': timings[min(len(timings) - 1, int(len(timings) * 0.99))] / 1000,
+            'ops_per_s': samples * batch / elapsed}
+
+
+class StubBot:
+    """Заглушка TeleBot: рахує виклики замість запитів до Telegram."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _record(self, *args, **kwargs):
+        self.calls += 1
+
+    reply_to = send_message = answer_inline_query = answer_callback_query = edit_message_text = _record
+
+
+def _make_message(chat_id, text):
+    from telebot import types
+    return types.Message.de_json({
+        'message_id': 1, 'date': 0, 'text': text,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+    })
+
+
+def _make_inline_query(user_id, query):
+    from telebot import types
+    return types.InlineQuery.de_json({
+        'id': str(user_id), 'query': query, 'offset': '',
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+    })
+
+
+def run_core_benchmarks(samples):
+    """Бенчмарки без великих баз: пошук курсу, рендеринг, назви валют, inline."""
+    os.environ.setdefault("TOKEN", "0:bench")
+    os.environ.setdefault("MONOBANK_API_URL", "http://127.0.0.1:9/bench")  # Не використовується: кеш свіжий
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "core.db")
+    os.environ["SESSION_BACKEND"] = "memory"
+    # Заглушка Telegram не має лімітів: черга відправлення (sender.py) не повинна накопичуватися
+    os.environ.setdefault("SEND_GLOBAL_RATE", "1e9")
+    os.environ.setdefault("SEND_CHAT_RATE", "1e9")
+
+    import api
+    import inline
+    import main
+    import render
+    import runtime
+    import timeseries
+    from utils import get_currency_name
+
+    fixtures = {source: load_fixture(source) for source in ("monobank", "privatbank")}
+    for source, data in fixtures.items():
+        api._store_rates(source, data, time.time())
+    main.bot = StubBot()
+    main.telegram = runtime.SyncTelegram(main.bot)  # Обробники звертаються до Telegram через main.telegram
+
+    results = {}
+    micro = max(1, samples // 10)  # Для швидких операцій - менше вимірів, але пачками
+
+    for source in fixtures:
+        pairs = itertools.cycle(sorted(api.get_rate_index(source)))
+        results[f"rate_lookup[{source}]"] = measure(
+            lambda: api.get_rate_index(source).get(next(pairs)).rate * 100, micro, batch=100)
+
+    chat_id = 1
+    message = _make_message(chat_id, "100")
+    session = main.sessions.get(chat_id)
+    convert_pairs = itertools.cycle([("USD", "UAH"), ("EUR", "USD"), ("PLN", "EUR"), ("GBP", "CHF")])
+
+    def convert():
+        session.from_currency, session.to_currency = next(convert_pairs)
+        session.amount = 100.0
+        runtime.run_sync(main.convert_currency(chat_id, message))
+    results["convert_currency[monobank]"] = measure(convert, samples)
+
+    for source, data in fixtures.items():
+        pairs = api.SOURCES[source].pairs(data)
+        results[f"render_rates[{source}]"] = measure(lambda: render.render_rates_messages(pairs, source), samples)
+
+    rates_message = _make_message(chat_id, "/rates")
+    results["show_rates[monobank]"] = measure(lambda: runtime.run_sync(main.show_rates(rates_message)), samples)
+
+    codes = itertools.cycle([row['currencyCodeA'] for row in fixtures["monobank"]])
+    results["get_currency_name"] = measure(lambda: get_currency_name(next(codes), "monobank"), micro, batch=100)
+
+    queries = itertools.cycle(INLINE_QUERIES)
+    results["inline_parse"] = measure(lambda: inline.parse_query(inline.normalize_query(next(queries))),
+                                      micro, batch=100)
+    entries = {source: api.cached_rates[source] for source in fixtures}
+    parsed = itertools.cycle([p for p in (inline.parse_query(inline.normalize_query(q)) for q in INLINE_QUERIES) if p])
+    results["inline_build"] = measure(lambda: inline.build_inline_results(*next(parsed), entries), samples)
+    results["compare_rates"] = measure(lambda: api.compare_rates("USD", "UAH"), samples)
+    inline_queries = itertools.cycle([_make_inline_query(chat_id, q) for q in INLINE_QUERIES])
+    results["inline_converter"] = measure(lambda: runtime.run_sync(main.inline_converter(next(inline_queries))),
+                                          samples)
+
+    # Історія курсів за 5 років погодинних оновлень (timeseries.py)
+    history = timeseries.RateHistory(save_interval=float("inf"))
+    now = int(time.time())
+    random.seed(0)
+    value = 41.0
+    for timestamp in range(now - 5 * 365 * 86400, now, 3600):
+        value += random.uniform(-0.05, 0.05)
+        history.add("monobank", timestamp, {("USD", "UAH"): value})
+    for label, seconds in (("24h", 86400), ("30d", 30 * 86400), ("5y", 5 * 365 * 86400)):
+        results[f"trend[{label}]"] = measure(lambda: history.trend("monobank", "USD", "UAH", seconds, now=now),
+                                             samples)
+    return results
+
+
+def _fill_database(path, rows):
+    """Доповнює тестову базу до rows записів (база зберігається між запусками)."""
+    conn = sqlite3.connect(path)
+    current = conn.execute("SELECT COALESCE(MAX(id), 0) FROM conversions").fetchone()[0]
+    if current >= rows:
+        conn.close()
+        return
+    chats = max(1, rows // ROWS_PER_CHAT)
+    print(f"Заповнюємо {path}: {current} -> {rows} записів...", file=sys.stderr)
+    conn.execute("PRAGMA synchronous=OFF")
+    chunk = 100000
+    for start in range(current, rows, chunk):
+        conn.executemany(
+            "INSERT INTO conversions (chat_id, amount, from_currency, to_currency, converted_amount, timestamp) "
+            "VALUES (?, ?, 'USD', 'UAH', ?, '2025-01-01 00:00:00')",
+            ((i % chats + 1, float(i % 1000), float(i % 1000) * 41.5) for i in range(start, min(rows, start + chunk))))
+        conn.commit()
+    conn.close()
+
+
+def run_db_benchmarks(rows, samples, db_dir):
+    """Бенчмарки add_conversion/get_history на базі з rows записів (викликається в окремому процесі)."""
+    os.makedirs(db_dir, exist_ok=True)
+    path = os.path.join(db_dir, f"bench_{rows}.db")
+    os.environ["DB_PATH"] = path
+    import db  # Імпортуємо після DB_PATH: модуль читає шлях до бази під час імпорту
+
+    db.init()
+    _fill_database(path, rows)
+    chats = max(1, rows // ROWS_PER_CHAT)
+    random.seed(rows)
+
+    results = {}
+    results[f"add_conversion[{rows}]"] = measure(
+        lambda: db.add_conversion(random.randint(1, chats), 100.0, "USD", "UAH", 4150.0), samples)
+    db.flush()
+
+    # Груповий коміт, який виконує фоновий потік запису (FLUSH_BATCH_SIZE записів за транзакцію)
+    writer_conn = db._connect()
+    batch_rows = [(random.randint(1, chats), 100.0, "USD", "UAH", 4150.0, "2025-01-01 00:00:00")
+                  for _ in range(db.FLUSH_BATCH_SIZE)]
+
+    def group_commit():
+        writer_conn.executemany(db.INSERT_CONVERSION_SQL, batch_rows)
+        writer_conn.commit()
+    results[f"group_commit[{rows}]"] = measure(group_commit, max(1, samples // 10), warmup=5)
+    writer_conn.close()
+
+    results[f"get_history[{rows}]"] = measure(lambda: db.get_history(random.randint(1, chats), limit=10), samples)
+    db.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Друкує таблицю результатів; повертає кількість регресій відносно baseline."""
+    regressions = 0
+    print(f"{'Шлях':36} {'p50, мкс':>10} {'p99, мкс':>10} {'оп/с':>12}  Порівняння з еталоном")
+    for name, stats in results.items():
+        line = f"{name:36} {stats['p50_us']:10.2f} {stats['p99_us']:10.2f} {stats['ops_per_s']:12.0f}"
+        base = baseline.get(name)
+        if base:
+            change = (stats['p50_us'] - base['p50_us']) / base['p50_us']
+            line += f"  {change:+.0%}"
+            if change > tolerance:
+                line += " REGRESSION"
+                regressions += 1
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Мікробенчмарки гарячих шляхів бота")
+    parser.add_argument("--rows", default=DEFAULT_ROWS, help="Розміри баз для історії, через кому")
+    parser.add_argument("--samples", type=int, default=2000, help="Кількість вимірів на шлях")
+    parser.add_argument("--db-dir", default=DEFAULT_DB_DIR, help="Каталог для тестових баз (перевикористовуються)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Файл з еталонними результатами")
+    parser.add_argument("--save-baseline", action="store_true", help="Зберегти результати як еталон")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустиме зростання p50 (0.25 = 25%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Код виходу 1, якщо є регресії")
+    parser.add_argument("--db-worker", type=int, help=argparse.SUPPRESS)  # Внутрішній режим: одна база
+    args = parser.parse_args()
+
+    if args.db_worker:
+        print(json.dumps(run_db_benchmarks(args.db_worker, args.samples, args.db_dir)))
+        return
+
+    # Кожен розмір бази - в окремому процесі: db.py відкриває базу з DB_PATH під час імпорту
+    results = {}
+    for rows in (int(value) for value in args.rows.split(",") if value.strip()):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--db-worker", str(rows),
+                                 "--samples", str(args.samples), "--db-dir", args.db_dir],
+                                check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.update(json.loads(output))
+    results = {**run_core_benchmarks(args.samples), **results}
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Еталон збережено в {args.baseline}")
+    elif regressions:
+        print(f"Регресій: {regressions}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
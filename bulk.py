@@ -0,0 +1,150 @@
+# bulk.py
+# Пакетна конвертація (/bulk): список сум у повідомленні або CSV-файл з рядками
+# "сума, валюта[, цільова валюта]".  Усі рядки рахуються за одним знімком курсів
+# (індекс пар з кешу api береться один раз на весь пакет): рядки групуються за
+# парою валют, курс шукається один раз на пару, а суми множаться одним проходом.
+# Результат повертається CSV-файлом, а в історію пакет записується одним
+# елементом черги запису (db.add_conversions).
+import csv
+import io
+import math
+import os
+import re
+from collections import namedtuple
+
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", 5000))  # Максимум рядків в одному пакеті
+BULK_MAX_FILE_SIZE = int(os.getenv("BULK_MAX_FILE_SIZE", 1024 * 1024))  # Максимальний розмір CSV-файлу (байти)
+BULK_DEFAULT_TARGET = "UAH"  # Цільова валюта, якщо її не вказано ні в команді, ні в рядку
+
+_CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+
+# Один рядок пакета: line - номер рядка у вхідних даних; для рядків, які не вдалося
+# розібрати або сконвертувати, заповнено error, а converted і rate - None
+BulkRow = namedtuple("BulkRow", ["line", "amount", "from_currency", "to_currency", "rate", "converted", "error"],
+                     defaults=[None, None, None])
+
+
+def parse_bulk_command(text):
+    """
+    Розбирає повідомлення з командою /bulk.
+
+    "/bulk EUR" задає цільову валюту, а рядки після першого (якщо є) - це вже
+    сам пакет, щоб його можна було надіслати одним повідомленням.
+
+    Returns:
+        Кортеж (target_currency, body), де body - текст пакета або "".
+    """
+    first_line, _, body = text.partition("\n")
+    target = BULK_DEFAULT_TARGET
+    for part in first_line.upper().split()[1:]:
+        if _CURRENCY_RE.match(part):
+            target = part
+    return target, body.strip()
+
+
+def _split_fields(line):
+    """Ділить рядок на поля: ';' або табуляція, кома (CSV без пробілів) чи пробіли."""
+    if ";" in line or "\t" in line:
+        return [field.strip() for field in re.split(r"[;\t]", line)]
+    if "," in line and len(line.split()) == 1:
+        return line.split(",")
+    return line.split()
+
+
+def parse_rows(text, default_target=BULK_DEFAULT_TARGET):
+    """
+    Розбирає рядки пакета.
+
+    Кожен рядок містить суму і валюту в будь-якому порядку ("100 USD", "USD;100",
+    "100,USD,EUR") і, необов'язково, цільову валюту.  Порожні рядки і заголовок
+    CSV (перший рядок без числа) пропускаються.
+
+    Returns:
+        Список BulkRow; для нерозпізнаних рядків заповнено error.
+    """
+    rows = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip().lstrip("\ufeff")
+        if not line:
+            continue
+        amount = None
+        currencies = []
+        for field in _split_fields(line):
+            field = field.strip().strip('"').upper()
+            if not field:
+                continue
+            if _CURRENCY_RE.match(field):
+                currencies.append(field)
+                continue
+            try:
+                value = float(field.replace(" ", "").replace(",", "."))
+            except ValueError:
+                value = None
+            if value is None or amount is not None:  # Не число або друге число в рядку
+                amount = None
+                break
+            amount = value
+        if amount is None and not rows and line_number == 1:
+            continue  # Заголовок CSV
+        if amount is None or not currencies or len(currencies) > 2:
+            rows.append(BulkRow(line_number, None, None, None, error=f"Не вдалося розібрати: {line[:40]}"))
+        elif not 0 < amount < math.inf:
+            rows.append(BulkRow(line_number, amount, currencies[0], None, error="Сума повинна бути більшою за нуль"))
+        else:
+            to_currency = currencies[1] if len(currencies) > 1 else default_target
+            rows.append(BulkRow(line_number, amount, currencies[0], to_currency))
+    return rows
+
+
+def convert_rows(rows, rate_index):
+    """
+    Конвертує всі рядки за одним індексом курсів (rates.build_rate_index).
+
+    Рядки групуються за парою валют: курс шукається один раз на пару, а суми
+    пари множаться одним проходом.
+
+    Returns:
+        Список BulkRow у тому ж порядку, що й rows, з заповненими rate і converted
+        (або error, якщо для пари немає курсу).
+    """
+    results = list(rows)
+    pairs = {}
+    for position, row in enumerate(rows):
+        if row.error is None:
+            pairs.setdefault((row.from_currency, row.to_currency), []).append(position)
+    for (from_currency, to_currency), positions in pairs.items():
+        if from_currency == to_currency:
+            rate = 1.0
+        else:
+            quote = rate_index.get((from_currency, to_currency))
+            if quote is None:
+                error = f"Немає курсу {from_currency}/{to_currency}"
+                for position in positions:
+                    results[position] = results[position]._replace(error=error)
+                continue
+            rate = quote.rate
+        converted = [rows[position].amount * rate for position in positions]
+        for position, value in zip(positions, converted):
+            results[position] = results[position]._replace(rate=rate, converted=value)
+    return results
+
+
+def render_results_csv(results):
+    """Формує CSV з результатами пакета (UTF-8 з BOM, щоб Excel правильно показав кирилицю)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["line", "amount", "from", "to", "rate", "result", "error"])
+    writer.writerows(
+        (row.line, "" if row.amount is None else f"{row.amount:.2f}", row.from_currency or "", row.to_currency or "",
+         "" if row.rate is None else f"{row.rate:.6f}", "" if row.converted is None else f"{row.converted:.2f}",
+         row.error or "")
+        for row in results)
+    return ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+
+def decode_document(data):
+    """Декодує вміст CSV-файлу: UTF-8 (з BOM або без), інакше Windows-1251."""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1251", errors="replace")
@@ -1,32 +1,331 @@
 # db.py
+import atexit
+import collections
+import json
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+import zlib
 
-# Підключення до бази даних (або її створення)
-conn = sqlite3.connect('currency_bot.db', check_same_thread=False)
-cursor = conn.cursor()
+import metrics
+
+DB_PATH = os.getenv("DB_PATH", 'currency_bot.db')  # Шлях до файлу бази даних
+
+BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", 5))  # Скільки секунд чекати, якщо база зайнята записом
+STATEMENT_CACHE_SIZE = 64  # Скільки підготовлених запитів кожне з'єднання тримає в кеші
+
+logger = logging.getLogger(__name__)
+
+# Доступ до бази розділено на читання і запис:
+#   - кожен потік читає через власне з'єднання (_read_connection), тож потоки не ділять
+#     курсор, а в режимі WAL читання не чекають на коміти;
+#   - конвертації пише лише фоновий потік (_writer_loop) своїм з'єднанням;
+#   - рідкісні службові записи (схема, знімки курсів) йдуть через _write_connection під блокуванням.
+# Тексти запитів винесено в константи: sqlite3 кешує підготовлені запити для кожного
+# з'єднання за текстом, тож кожен потік готує запит один раз і далі використовує повторно.
+_local = threading.local()
+_write_conn = None
+_write_conn_lock = threading.Lock()
+# Таблиці створюються не при імпорті, а при першому зверненні до бази або виклику init()
+_initialized = False
+_init_lock = threading.Lock()
+
+INSERT_CONVERSION_SQL = """
+    INSERT INTO conversions (chat_id, amount, from_currency, to_currency, converted_amount, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+# Історія читається сторінками за ключем (keyset pagination): замість OFFSET беремо записи
+# з id меншим/більшим за межу попередньої сторінки, тож індекс (chat_id, id) дає будь-яку
+# сторінку за однаковий час.
+SELECT_HISTORY_SQL = """
+    SELECT amount, from_currency, to_currency, converted_amount, timestamp, id
+    FROM conversions
+    WHERE chat_id = ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+SELECT_HISTORY_OLDER_SQL = """
+    SELECT amount, from_currency, to_currency, converted_amount, timestamp, id
+    FROM conversions
+    WHERE chat_id = ? AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+SELECT_HISTORY_NEWER_SQL = """
+    SELECT amount, from_currency, to_currency, converted_amount, timestamp, id
+    FROM conversions
+    WHERE chat_id = ? AND id > ?
+    ORDER BY id ASC
+    LIMIT ?
+"""
+
+def _connect():
+    """Відкриває нове з'єднання з базою з тайм-аутом очікування блокування і кешем запитів."""
+    connection = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE,
+                                 check_same_thread=False)
+    connection.execute("PRAGMA synchronous=NORMAL")  # У режимі WAL цього достатньо для надійності
+    return connection
+
+def _read_connection():
+    """Повертає з'єднання для читання, що належить поточному потоку."""
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        init()
+        connection = _local.connection = _connect()
+    return connection
+
+def _write_connection():
+    """Повертає спільне з'єднання для службових записів (використовувати під _write_conn_lock)."""
+    global _write_conn
+    if _write_conn is None:
+        _write_conn = _connect()
+    return _write_conn
+
+# Записи про конвертації не пишуться в базу одразу: вони стають у чергу, і фоновий
+# потік зберігає їх пачками - одна транзакція на FLUSH_BATCH_SIZE записів або на
+# FLUSH_INTERVAL секунд, залежно від того, що настане раніше.
+FLUSH_BATCH_SIZE = int(os.getenv("DB_FLUSH_BATCH_SIZE", 100))
+FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 0.5))
+# Скільки разів повторити груповий коміт, що не вдався (наприклад, база зайнята довше за
+# BUSY_TIMEOUT), і пауза перед першим повтором (далі подвоюється)
+WRITE_RETRIES = int(os.getenv("DB_WRITE_RETRIES", 3))
+WRITE_RETRY_DELAY = float(os.getenv("DB_WRITE_RETRY_DELAY", 0.2))
+
+_write_queue = queue.Queue()
+_STOP = object()  # Сигнал для зупинки фонового потоку запису
+_writer_thread = None
+_writer_lock = threading.Lock()
+# Ще не збережені записи кожного чату - щоб get_history одразу бачив власні конвертації
+_pending = {}
+_pending_lock = threading.Lock()
+# Тримається під час коміту пачки і під час читання першої сторінки історії
+_commit_lock = threading.Lock()
+# Статистика фонового запису (див. get_writer_stats)
+_writer_stats = {'flushes': 0, 'rows': 0, 'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0}
 
 # Створення таблиці (виконується тільки якщо таблиці ще немає)
 def create_tables():
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS conversions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            from_currency TEXT NOT NULL,
-            to_currency TEXT NOT NULL,
-            converted_amount REAL NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
+    with _write_conn_lock:
+        conn = _write_connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                from_currency TEXT NOT NULL,
+                to_currency TEXT NOT NULL,
+                converted_amount REAL NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Знімки останніх курсів кожного банку (для швидкого старту після перезапуску)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_snapshots (
+                source TEXT PRIMARY KEY,
+                fetched_at REAL NOT NULL,
+                payload BLOB NOT NULL
+            )
+        """)
+        # Налаштування чатів, які мають пережити перезапуск (вибраний банк)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_settings (
+                chat_id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL
+            )
+        """)
+        # Історія курсів для /trend: стиснуті стовпці рядів (див. timeseries.py)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_history (
+                source TEXT NOT NULL,
+                pair TEXT NOT NULL,
+                tier TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (source, pair, tier)
+            )
+        """)
+        # Сповіщення про курс (/alert, див. alerts.py)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                from_currency TEXT NOT NULL,
+                to_currency TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                threshold REAL NOT NULL
+            )
+        """)
+        # Міграція: індекс для історії чату (без нього кожен /history - повний перегляд таблиці)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversions_chat_id_id ON conversions (chat_id, id)")
+        conn.commit()
+        # WAL: читання не блокуються записом, а коміти не переписують весь журнал
+        conn.execute("PRAGMA journal_mode=WAL")
+
+def init():
+    """Відкриває базу і створює таблиці (один раз; повторні виклики нічого не роблять)."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if not _initialized:
+            create_tables()
+            _initialized = True
+
+def _forget_pending(batch):
+    """Прибирає записи пачки з _pending (вони найстаріші незбережені записи своїх чатів)."""
+    with _pending_lock:
+        for row in batch:
+            rows = _pending.get(row[0])
+            if rows:
+                rows.popleft()  # Записи кожного чату зберігаються в порядку надходження
+                if not rows:
+                    del _pending[row[0]]
+
+def _write_batch(writer_conn, batch):
+    """
+    Зберігає пачку записів однією транзакцією і прибирає їх з _pending.
+
+    Якщо коміт не вдався, транзакція відкочується і пачка записується знову
+    (до WRITE_RETRIES повторів).  З _pending записи прибираються в будь-якому
+    разі: інакше наступні пачки знімали б звідти чужі записи.
+
+    Коміт і прибирання з _pending виконуються під _commit_lock, тож
+    get_history_page бачить кожен запис або в базі, або в _pending, але не там і там.
+
+    Raises:
+        sqlite3.Error: Якщо пачку не вдалося зберегти після всіх повторів.
+    """
+    for attempt in range(WRITE_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            with _commit_lock:
+                try:
+                    writer_conn.executemany(INSERT_CONVERSION_SQL, batch)
+                    writer_conn.commit()
+                except sqlite3.Error:
+                    try:
+                        writer_conn.rollback()  # Частково вставлена пачка не повинна потрапити в наступний коміт
+                    except sqlite3.Error:
+                        pass
+                    raise
+                _forget_pending(batch)
+            break
+        except sqlite3.Error as e:
+            metrics.inc("sqlite_write_errors_total")
+            if attempt == WRITE_RETRIES:
+                _forget_pending(batch)
+                raise
+            logger.warning("Не вдалося зберегти %d конвертацій (%s), повтор %d", len(batch), e, attempt + 1)
+            time.sleep(WRITE_RETRY_DELAY * 2 ** attempt)  # Чекаємо без _commit_lock: читання історії не стоять
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    _writer_stats['flushes'] += 1
+    _writer_stats['rows'] += len(batch)
+    _writer_stats['last_flush_ms'] = elapsed_ms
+    _writer_stats['total_flush_ms'] += elapsed_ms
+    _writer_stats['max_flush_ms'] = max(_writer_stats['max_flush_ms'], elapsed_ms)
+    metrics.observe("sqlite_commit_seconds", elapsed_ms / 1000)
+    metrics.inc("sqlite_rows_written_total", len(batch))
+    logger.debug("Збережено %d конвертацій за %.1f мс", len(batch), elapsed_ms)
+
+def _writer_loop():
+    """Фоновий потік: збирає записи з черги в пачки і зберігає їх груповими комітами."""
+    init()
+    writer_conn = _connect()
+    stopping = False
+    while not stopping:
+        item = _write_queue.get()
+        if item is _STOP:
+            _write_queue.task_done()
+            break
+        # Елемент черги - один запис (add_conversion) або список записів (add_conversions)
+        batch = list(item) if type(item) is list else [item]
+        items = 1
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < FLUSH_BATCH_SIZE:
+            try:
+                item = _write_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            items += 1
+            if type(item) is list:
+                batch.extend(item)
+            else:
+                batch.append(item)
+        try:
+            _write_batch(writer_conn, batch)
+        except sqlite3.Error as e:
+            print(f"Помилка збереження конвертацій у базу даних ({len(batch)} записів втрачено): {e}")
+        for _ in range(items + stopping):
+            _write_queue.task_done()
+    writer_conn.close()
+
+def _ensure_writer():
+    """Запускає фоновий потік запису при першому записі."""
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _writer_thread.start()
 
 def add_conversion(chat_id, amount, from_currency, to_currency, converted_amount):
-    """Додає запис про конвертацію в базу даних."""
-    cursor.execute("""
-        INSERT INTO conversions (chat_id, amount, from_currency, to_currency, converted_amount, timestamp)
-        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    """, (chat_id, amount, from_currency, to_currency, converted_amount))
-    conn.commit()
+    """Додає запис про конвертацію в чергу на збереження (не чекає на коміт)."""
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())  # Як CURRENT_TIMESTAMP у SQLite (UTC)
+    row = (chat_id, amount, from_currency, to_currency, converted_amount, timestamp)
+    with _pending_lock:
+        _pending.setdefault(chat_id, collections.deque()).append(row)
+    _ensure_writer()
+    _write_queue.put(row)
+
+def add_conversions(chat_id, conversions):
+    """Додає в чергу пакет конвертацій одного чату (/bulk) одним елементом.
+
+    Фоновий потік збереже весь пакет однією транзакцією (executemany), а не
+    окремим записом на кожен рядок.
+
+    Args:
+        chat_id: ID чату.
+        conversions: Список кортежів (amount, from_currency, to_currency, converted_amount).
+    """
+    if not conversions:
+        return
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    rows = [(chat_id, amount, from_currency, to_currency, converted_amount, timestamp)
+            for amount, from_currency, to_currency, converted_amount in conversions]
+    with _pending_lock:
+        _pending.setdefault(chat_id, collections.deque()).extend(rows)
+    _ensure_writer()
+    _write_queue.put(rows)
+
+def flush():
+    """Чекає, поки всі записи з черги будуть збережені в базу."""
+    if _writer_thread is not None:
+        _write_queue.join()
+
+def close():
+    """Зберігає все, що залишилось у черзі, і зупиняє фоновий потік запису."""
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None:
+            return
+        _write_queue.put(_STOP)
+        _writer_thread.join()
+        _writer_thread = None
+
+atexit.register(close)  # При завершенні процесу нічого не губимо
+
+def get_writer_stats():
+    """Повертає глибину черги запису (елементів) і статистику групових комітів (час у мілісекундах)."""
+    stats = dict(_writer_stats)
+    stats['queue_depth'] = _write_queue.qsize()
+    stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+    return stats
 
 def get_history(chat_id, limit=10):
     """Отримує історію конвертацій для заданого chat_id.
@@ -36,17 +335,128 @@ def get_history(chat_id, limit=10):
         limit: Максимальна кількість записів для повернення.
 
     Returns:
-        Список кортежів з даними про конвертації, або порожній список,
-        якщо історія порожня.
+        Список кортежів (amount, from_currency, to_currency, converted_amount, timestamp, id),
+        від найновіших до найстаріших, або порожній список, якщо історія порожня.
+        Для ще не збережених записів id дорівнює None.
+    """
+    return get_history_page(chat_id, limit)[0]
+
+def get_history_page(chat_id, limit=10, before_id=None, after_id=None):
+    """Отримує одну сторінку історії конвертацій.
+
+    Args:
+        chat_id: ID чату.
+        limit: Кількість записів на сторінці.
+        before_id: Повернути записи, старіші за запис з цим id (сторінка "старіші").
+        after_id: Повернути записи, новіші за запис з цим id (сторінка "новіші").
+        Без before_id і after_id повертається перша (найновіша) сторінка.
+
+    Returns:
+        Кортеж (rows, has_older, has_newer, older_bound): записи від найновіших до
+        найстаріших (як у get_history), чи є ще сторінки в кожному напрямку і before_id
+        для сторінки "старіші", якщо на першій сторінці лише незбережені записи
+        (їх id ще невідомі, тож межею стає id найновішого збереженого запису + 1).
+        В інших випадках older_bound дорівнює None.
     """
-    cursor.execute("""
-        SELECT amount, from_currency, to_currency, converted_amount, timestamp
-        FROM conversions
-        WHERE chat_id = ?
-        ORDER BY timestamp DESC
-        LIMIT ?
-    """, (chat_id, limit))  # Використовуємо параметризований запит і для limit
-    return cursor.fetchall()
-
-# При запуску модуля одразу створюємо таблиці, якщо їх немає.
-create_tables()
\ No newline at end of file
+    connection = _read_connection()
+    if after_id is not None:
+        rows = connection.execute(SELECT_HISTORY_NEWER_SQL, (chat_id, after_id, limit + 1)).fetchall()
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return rows, True, has_newer, None
+    if before_id is not None:
+        rows = connection.execute(SELECT_HISTORY_OLDER_SQL, (chat_id, before_id, limit + 1)).fetchall()
+        return rows[:limit], len(rows) > limit, True, None
+
+    # Незбережені записи і SELECT читаємо під _commit_lock: фоновий потік не може
+    # закомітити пачку між ними, тож кожен запис потрапить на сторінку рівно один раз
+    # (навіть якщо дві однакові конвертації зроблено в ту саму секунду)
+    with _commit_lock:
+        with _pending_lock:
+            pending = [row[1:] + (None,) for row in reversed(_pending.get(chat_id, ()))]
+        # Використовуємо параметризований запит і для limit
+        history = connection.execute(SELECT_HISTORY_SQL, (chat_id, limit + 1)).fetchall()
+
+    # Незбережені записи новіші за все, що вже є в базі
+    history = pending + history
+    page = history[:limit]
+    older_bound = None
+    if len(history) > limit and page[-1][5] is None:
+        # Сторінка складається лише з незбережених записів - старіші за них усі записи бази
+        older_bound = next((row[5] + 1 for row in history[limit:] if row[5] is not None), None)
+    return page, len(history) > limit, False, older_bound
+
+def load_user_source(chat_id):
+    """Повертає збережений банк для чату або None."""
+    row = _read_connection().execute("SELECT source FROM user_settings WHERE chat_id = ?", (chat_id,)).fetchone()
+    return row[0] if row else None
+
+def save_user_source(chat_id, source):
+    """Зберігає вибраний банк для чату."""
+    init()
+    with _write_conn_lock:
+        conn = _write_connection()
+        conn.execute("INSERT OR REPLACE INTO user_settings (chat_id, source) VALUES (?, ?)", (chat_id, source))
+        conn.commit()
+
+def save_rate_snapshot(source, fetched_at, data):
+    """Зберігає останню відповідь API банку (стиснутий JSON) разом з часом запиту."""
+    payload = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+    init()
+    with _write_conn_lock:
+        conn = _write_connection()
+        conn.execute("""
+            INSERT OR REPLACE INTO rate_snapshots (source, fetched_at, payload)
+            VALUES (?, ?, ?)
+        """, (source, fetched_at, payload))
+        conn.commit()
+
+def load_rate_snapshots():
+    """Повертає збережені знімки курсів у вигляді {source: (fetched_at, data)}."""
+    snapshots = {}
+    rows = _read_connection().execute("SELECT source, fetched_at, payload FROM rate_snapshots").fetchall()
+    for source, fetched_at, payload in rows:
+        try:
+            snapshots[source] = (fetched_at, json.loads(zlib.decompress(payload)))
+        except (zlib.error, ValueError) as e:
+            print(f"Пошкоджений знімок курсів {source}: {e}")
+    return snapshots
+
+def save_rate_history(rows):
+    """Зберігає ряди історії курсів: rows - список (source, pair, tier, payload)."""
+    init()
+    with _write_conn_lock:
+        conn = _write_connection()
+        conn.executemany("INSERT OR REPLACE INTO rate_history (source, pair, tier, payload) VALUES (?, ?, ?, ?)",
+                         rows)
+        conn.commit()
+
+def load_rate_history():
+    """Повертає всі збережені ряди історії курсів як список (source, pair, tier, payload)."""
+    return _read_connection().execute("SELECT source, pair, tier, payload FROM rate_history").fetchall()
+
+def add_alert(chat_id, source, from_currency, to_currency, direction, threshold):
+    """Зберігає сповіщення про курс і повертає його id."""
+    init()
+    with _write_conn_lock:
+        conn = _write_connection()
+        cursor = conn.execute("""
+            INSERT INTO rate_alerts (chat_id, source, from_currency, to_currency, direction, threshold)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (chat_id, source, from_currency, to_currency, direction, threshold))
+        conn.commit()
+        return cursor.lastrowid
+
+def delete_alerts(alert_ids):
+    """Видаляє сповіщення з переданими id."""
+    init()
+    with _write_conn_lock:
+        conn = _write_connection()
+        conn.executemany("DELETE FROM rate_alerts WHERE id = ?", ((alert_id,) for alert_id in alert_ids))
+        conn.commit()
+
+def load_alerts():
+    """Повертає всі сповіщення як список (id, chat_id, source, from_currency, to_currency, direction, threshold)."""
+    return _read_connection().execute("""
+        SELECT id, chat_id, source, from_currency, to_currency, direction, threshold FROM rate_alerts
+    """).fetchall()
@@ -0,0 +1,152 @@
+# inline.py
+# Кеш відповідей на inline-запити.  Telegram надсилає запит на кожне натискання
+# клавіші, тому готові результати зберігаються за нормалізованим текстом запиту
+# і перебудовуються лише після оновлення курсів (нове покоління кешу api).
+# Запит з цільовою валютою ("100 USD to UAH") порівнює курс у всіх банках,
+# які відповіли вчасно (api.get_rates_entries).
+import os
+import threading
+from collections import OrderedDict
+
+from telebot import types
+
+from api import get_source_name
+from rates import compare_quotes
+from render import render_inline_text
+
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", 2048))  # Скільки різних запитів пам'ятати
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 60))  # Скільки секунд Telegram може кешувати відповідь
+INLINE_TARGETS = ("UAH", "USD", "EUR", "PLN", "GBP")  # Валюти для запиту без цільової валюти ("100 USD")
+INLINE_MAX_TARGETS = 4  # Скільки варіантів показувати для такого запиту
+
+
+def normalize_query(query):
+    """Приводить текст запиту до ключа кешу: "100  usd TO uah " -> "100 USD TO UAH"."""
+    return " ".join(query.split()).upper()
+
+
+def parse_query(normalized):
+    """
+    Розбирає нормалізований inline-запит.
+
+    Підтримуються форми "100 USD to UAH", "100 USD UAH" та "100 USD".
+
+    Returns:
+        Кортеж (amount, from_currency, to_currency), де to_currency - None для
+        запиту без цільової валюти, або None, якщо запит не розпізнано.
+    """
+    parts = normalized.split()
+    if len(parts) < 2:
+        return None
+    try:
+        amount = float(parts[0].replace(",", "."))
+    except ValueError:
+        return None
+    if amount <= 0:
+        return None
+    from_currency = parts[1]
+    if len(parts) == 2 or (len(parts) == 3 and parts[2] == "TO"):
+        return amount, from_currency, None  # Цільову валюту ще не введено
+    if len(parts) >= 4 and parts[2] == "TO":
+        return amount, from_currency, parts[3]
+    if len(parts) == 3:
+        return amount, from_currency, parts[2]
+    return None
+
+
+def build_inline_results(amount, from_currency, to_currency, entries):
+    """
+    Створює список InlineQueryResultArticle для розібраного запиту.
+
+    Якщо цільову валюту вказано, повертає по варіанту на кожен банк з entries
+    (найвигідніший - першим і з позначкою ⭐).  Інакше - кілька варіантів з
+    INLINE_TARGETS за курсом першого банку.
+
+    Args:
+        entries: Словник source -> запис кешу курсів (див. api.get_rates_entries).
+    """
+    if to_currency:
+        comparison = compare_quotes({source: entry['index'] for source, entry in entries.items()},
+                                    from_currency, to_currency)
+        results = []
+        for offer in comparison.offers:
+            name = get_source_name(offer.source)
+            best = " ⭐" if offer.source == comparison.best_buy and len(comparison.offers) > 1 else ""
+            results.append(types.InlineQueryResultArticle(
+                f'{from_currency}-{to_currency}-{offer.source}',
+                f'Convert {amount} {from_currency} to {to_currency} ({name}){best}',
+                types.InputTextMessageContent(render_inline_text(amount, from_currency, to_currency, offer.quote, name))
+            ))
+        return tuple(results)
+
+    rate_index = next(iter(entries.values()))['index']
+    targets = [currency for currency in INLINE_TARGETS if currency != from_currency][:INLINE_MAX_TARGETS]
+    results = []
+    for target in targets:
+        quote = rate_index.get((from_currency, target))
+        if not quote:
+            continue
+        results.append(types.InlineQueryResultArticle(
+            f'{from_currency}-{target}',
+            f'Convert {amount} {from_currency} to {target}',
+            types.InputTextMessageContent(render_inline_text(amount, from_currency, target, quote))
+        ))
+    return tuple(results)
+
+
+class InlineAnswerCache:
+    """
+    LRU-кеш нормалізований запит -> готові результати для answer_inline_query.
+
+    Кожен запис пам'ятає покоління кешу курсів, з якого його побудовано, тому
+    після оновлення курсів старі відповіді не повертаються.  Кешуються і
+    невдалі запити (порожній кортеж), щоб не розбирати їх повторно.
+
+    Args:
+        max_size: Максимальна кількість запитів у кеші.
+    """
+
+    def __init__(self, max_size=INLINE_CACHE_SIZE):
+        self.max_size = max_size
+        self._answers = OrderedDict()  # normalized -> (generations, results)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query, entries):
+        """
+        Повертає кортеж результатів для тексту запиту (порожній, якщо відповісти нічим).
+
+        Args:
+            query: Текст inline-запиту, як його надіслав Telegram.
+            entries: Непорожній словник source -> запис кешу курсів (див. api.get_rates_entries).
+        """
+        key = normalize_query(query)
+        # Відповідь дійсна, поки не змінився набір банків, що відповіли, і їх покоління кешу
+        generations = tuple((source, entry['generation']) for source, entry in entries.items())
+        with self._lock:
+            cached = self._answers.get(key)
+            if cached is not None and cached[0] == generations:
+                self._answers.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        parsed = parse_query(key)
+        results = build_inline_results(*parsed, entries) if parsed else ()
+        with self._lock:
+            self._answers[key] = (generations, results)
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.max_size:
+                self._answers.popitem(last=False)
+        return results
+
+    def invalidate(self, source, entry=None):
+        """Видаляє відповіді, побудовані з курсів джерела (слухач api.add_refresh_listener)."""
+        with self._lock:
+            for key in [key for key, (generations, _) in self._answers.items()
+                        if any(name == source for name, _ in generations)]:
+                del self._answers[key]
+
+    def __len__(self):
+        return len(self._answers)
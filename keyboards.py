@@ -1,6 +1,30 @@
 from telebot import types
 
-def create_main_menu():
+from api import SOURCES
+
+# Клавіатури будуються один раз при імпорті: кожна функція create_* повертає
+# спільний незмінний об'єкт з уже готовим JSON, тож відповідь бота не створює
+# нових об'єктів telebot і не серіалізує клавіатуру повторно.
+
+POPULAR_CURRENCIES = ("USD", "EUR", "UAH", "GBP", "PLN")  # Перші кнопки клавіатури валют
+CURRENCY_ROW_SIZE = 4  # Кількість кнопок у рядку для решти валют
+CURRENCY_PAGE_SIZE = 16  # Скільки решти валют показувати на одній сторінці клавіатури
+MORE_CURRENCIES = "Ще валюти ➡️"  # Кнопка наступної сторінки: "Ще валюти ➡️ 2/9"
+_CURRENCY_KEYBOARDS_MAX = 64  # Скільки клавіатур валют (набір валют і сторінка) тримати в кеші
+
+
+class FrozenMarkup(types.JsonSerializable):
+    """Незмінна клавіатура: JSON розмітки обчислюється один раз і віддається telebot як є."""
+    __slots__ = ('_json',)
+
+    def __init__(self, markup):
+        self._json = markup.to_json()
+
+    def to_json(self):
+        return self._json
+
+
+def _build_main_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     btn_convert = types.KeyboardButton("💱 Конвертувати")  # Змінено емодзі
     btn_rates = types.KeyboardButton("📈 Курси валют")
@@ -10,28 +34,127 @@ def create_main_menu():
     markup.row(btn_convert, btn_rates)
     markup.row(btn_help, btn_history)
     markup.row(btn_source) # Додаємо кнопку в меню
-    return markup
+    return FrozenMarkup(markup)
 
-def create_currency_keyboard(back_button=False):
+def _currency_pages(currencies):
+    """Решта валют (крім популярних), розбита на сторінки; лише літерні коди."""
+    others = sorted(currency for currency in currencies.difference(POPULAR_CURRENCIES) if currency.isalpha())
+    return [others[start:start + CURRENCY_PAGE_SIZE] for start in range(0, len(others), CURRENCY_PAGE_SIZE)] or [[]]
+
+def _build_currency_keyboard(currencies, back_button, page):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    markup.row("USD", "EUR", "UAH")
-    markup.row("GBP", "PLN")
+    popular = [currency for currency in POPULAR_CURRENCIES if currency in currencies]
+    pages = _currency_pages(currencies)
+    others = pages[page]
+    if popular:
+        markup.row(*popular[:3])
+        if popular[3:]:
+            markup.row(*popular[3:])
+    for start in range(0, len(others), CURRENCY_ROW_SIZE):
+        markup.row(*others[start:start + CURRENCY_ROW_SIZE])
+    if len(pages) > 1:  # Остання сторінка веде знову на першу
+        markup.row(f"{MORE_CURRENCIES} {(page + 1) % len(pages) + 1}/{len(pages)}")
     if back_button:
         markup.row("⬅️ Назад")  # Додаємо кнопку "Назад"
-    return markup
+    return FrozenMarkup(markup)
 
-def create_swap_keyboard():
+def _build_swap_keyboard():
     markup = types.InlineKeyboardMarkup()  # Inline-клавіатура
     swap_button = types.InlineKeyboardButton("🔄 Поміняти місцями", callback_data="swap_currencies")
+    compare_button = types.InlineKeyboardButton("🏦 Порівняти банки", callback_data="compare_sources")
     markup.add(swap_button)
-    return markup
+    markup.add(compare_button)
+    return FrozenMarkup(markup)
 
-# Додаємо функцію створення клавіатури вибору джерела
-def create_source_keyboard():
+def _build_source_keyboard(titles):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    btn_monobank = types.KeyboardButton("Monobank")
-    btn_privatbank = types.KeyboardButton("PrivatBank")
+    buttons = [types.KeyboardButton(title) for title in titles]  # Банки з реєстру api.py
     btn_back = types.KeyboardButton("⬅️ Назад")  # Кнопка "Назад"
-    markup.row(btn_monobank, btn_privatbank)
+    for start in range(0, len(buttons), 2):
+        markup.row(*buttons[start:start + 2])
     markup.row(btn_back)
-    return markup
\ No newline at end of file
+    return FrozenMarkup(markup)
+
+def _build_quick_convert_keyboard():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add(types.KeyboardButton("USD/UAH"), types.KeyboardButton("EUR/UAH"))
+    markup.add(types.KeyboardButton("Ввести вручну"))
+    markup.add(types.KeyboardButton("⬅️ Назад"))  # Додаємо кнопку "Назад"
+    return FrozenMarkup(markup)
+
+
+MAIN_MENU = _build_main_menu()
+SWAP_KEYBOARD = _build_swap_keyboard()
+QUICK_CONVERT_KEYBOARD = _build_quick_convert_keyboard()
+REMOVE_KEYBOARD = FrozenMarkup(types.ReplyKeyboardRemove())  # Прибрати клавіатуру користувача
+DEFAULT_CURRENCIES = frozenset(POPULAR_CURRENCIES)
+
+# (набір валют, back_button, сторінка) -> клавіатура.  Набір валют - frozenset з кешу курсів,
+# він змінюється лише при оновленні курсів, а його хеш Python обчислює один раз.
+_currency_keyboards = {}
+# (назви банків, клавіатура).  Банки можна зареєструвати і після імпорту модуля,
+# тож клавіатура перебудовується, коли змінюється набір джерел у api.SOURCES.
+_source_keyboard = (None, None)
+
+
+def create_main_menu():
+    return MAIN_MENU
+
+def create_currency_keyboard(back_button=False, currencies=None, page=0):
+    """
+    Клавіатура вибору валюти для набору currencies (за замовчуванням - популярні валюти).
+
+    Популярні валюти є на кожній сторінці, решта - по CURRENCY_PAGE_SIZE на
+    сторінку (page - номер сторінки з нуля, див. parse_currency_page).
+    """
+    if not currencies:
+        currencies = DEFAULT_CURRENCIES
+    elif not isinstance(currencies, frozenset):
+        currencies = frozenset(currencies)
+    page = page % len(_currency_pages(currencies)) if page else 0
+    key = (currencies, back_button, page)
+    markup = _currency_keyboards.get(key)
+    if markup is None:
+        if len(_currency_keyboards) >= _CURRENCY_KEYBOARDS_MAX:
+            _currency_keyboards.clear()  # Старі набори валют після оновлень курсів більше не потрібні
+        markup = _currency_keyboards[key] = _build_currency_keyboard(currencies, back_button, page)
+    return markup
+
+def parse_currency_page(text):
+    """Номер сторінки (з нуля) з кнопки "Ще валюти ➡️ 2/9" або None, якщо це не ця кнопка."""
+    if not text.startswith(MORE_CURRENCIES):
+        return None
+    try:
+        return int(text[len(MORE_CURRENCIES):].split("/")[0]) - 1
+    except ValueError:
+        return None
+
+def create_swap_keyboard():
+    return SWAP_KEYBOARD
+
+# Додаємо функцію створення клавіатури вибору джерела
+def create_source_keyboard():
+    global _source_keyboard
+    titles = tuple(source.title for source in SOURCES.values())
+    cached_titles, markup = _source_keyboard
+    if titles != cached_titles:
+        markup = _build_source_keyboard(titles)
+        _source_keyboard = (titles, markup)
+    return markup
+
+def create_quick_convert_keyboard():
+    """Клавіатура швидкої конвертації для /convert."""
+    return QUICK_CONVERT_KEYBOARD
+
+# Кнопки гортання історії конвертацій (keyset-пагінація за id запису)
+def create_history_keyboard(older_id=None, newer_id=None):
+    buttons = []
+    if older_id is not None:
+        buttons.append(types.InlineKeyboardButton("⬅️ Старіші", callback_data=f"history:older:{older_id}"))
+    if newer_id is not None:
+        buttons.append(types.InlineKeyboardButton("Новіші ➡️", callback_data=f"history:newer:{newer_id}"))
+    if not buttons:
+        return None
+    markup = types.InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
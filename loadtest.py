@@ -0,0 +1,445 @@
+# loadtest.py
+# Наскрізне навантажувальне тестування: справжній бот з main.py запускається
+# окремим процесом проти локальних замінників - фейкового Telegram Bot API
+# (getUpdates віддає синтетичний трафік) і фейкових API Monobank/ПриватБанку
+# з налаштовуваними затримкою та часткою помилок.
+#
+# Запуск: python loadtest.py [--chats 5000] [--users 100] [--duration 60]
+#                            [--bank-latency 0.2] [--bank-failure-rate 0.1]
+# Звіт: затримка відповіді бота по кроках діалогу, кількість запитів до банків,
+# статистика запису в SQLite і ріст пам'яті та кількості сесій за час прогону.
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "fixtures")
+STATS_PREFIX = "LOADSTAT "  # Рядки зі статистикою процесу бота в його stdout
+
+# Сценарії: послідовність кроків (мітка, тип, текст).  Кожен крок чекає на одну відповідь бота.
+CURRENCIES = ["USD", "EUR", "PLN", "GBP", "UAH", "CHF"]
+
+
+def scenario_convert_manual(rng):
+    from_currency, to_currency = rng.sample(CURRENCIES, 2)
+    return [("/convert", "message", "/convert"), ("choice", "message", "Ввести вручну"),
+            ("amount", "message", str(rng.randint(1, 5000))), ("from", "message", from_currency),
+            ("to", "message", to_currency)]
+
+
+def scenario_convert_quick(rng):
+    return [("/convert", "message", "/convert"), ("choice", "message", rng.choice(["USD/UAH", "EUR/UAH"])),
+            ("amount", "message", str(rng.randint(1, 5000)))]
+
+
+def scenario_history(rng):
+    return [("/history", "message", "/history")]
+
+
+def scenario_inline(rng):
+    query = rng.choice([f"{rng.randint(1, 999)} USD", f"{rng.randint(1, 999)} EUR to PLN"])
+    return [("inline", "inline_query", query)]
+
+
+SCENARIOS = [(scenario_convert_manual, 35), (scenario_convert_quick, 35), (scenario_history, 15),
+             (scenario_inline, 15)]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class FakeTelegram:
+    """Фейковий Bot API: черга оновлень для getUpdates і прийом відповідей бота."""
+
+    def __init__(self):
+        self._updates = []
+        self._cond = threading.Condition()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._waiters = {}  # chat_id або id inline-запиту -> (час надсилання, threading.Event)
+        self._waiters_lock = threading.Lock()
+        self.method_counts = Counter()
+        self.unexpected_replies = 0
+
+    def push(self, update, reply_key):
+        """Додає оновлення в чергу getUpdates і повертає подію, яка спрацює на відповідь."""
+        event = threading.Event()
+        with self._waiters_lock:
+            self._waiters[reply_key] = [time.perf_counter(), event, None]
+        with self._cond:
+            update['update_id'] = next(self._update_ids)
+            self._updates.append(update)
+            self._cond.notify_all()
+        return event
+
+    def take_latency(self, reply_key):
+        with self._waiters_lock:
+            waiter = self._waiters.pop(reply_key, None)
+        return waiter[2] if waiter else None
+
+    def _reply(self, reply_key):
+        now = time.perf_counter()
+        with self._waiters_lock:
+            waiter = self._waiters.get(reply_key)
+            if waiter is None or waiter[2] is not None:
+                self.unexpected_replies += 1  # Зайва відповідь (наприклад, друге повідомлення на крок)
+                return
+            waiter[2] = now - waiter[0]
+        waiter[1].set()
+
+    def get_updates(self, offset, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._updates[:100]
+
+    def call(self, method, params):
+        self.method_counts[method] += 1
+        if method == "getUpdates":
+            return self.get_updates(int(params.get("offset") or 0), min(float(params.get("timeout") or 0), 5))
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            self._reply(chat_id)
+            return {'message_id': next(self._message_ids), 'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get("text", "")}
+        if method == "answerInlineQuery":
+            self._reply(params["inline_query_id"])
+            return True
+        if method == "getMe":
+            return {'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+        return True  # deleteWebhook, answerCallbackQuery тощо
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    def _handle(self):
+        parts = urlsplit(self.path)
+        method = parts.path.rstrip("/").rsplit("/", 1)[-1]
+        params = dict(parse_qsl(parts.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length).decode("utf-8", "replace")
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body))
+        result = self.server.telegram.call(method, params)
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBankHandler(BaseHTTPRequestHandler):
+    """Віддає записані відповіді банків (bench/fixtures) із затримкою та випадковими помилками."""
+
+    def do_GET(self):
+        bank = self.server
+        source = urlsplit(self.path).path.strip("/")
+        payload = bank.payloads.get(source)
+        with bank.lock:
+            bank.calls[source] += 1
+        time.sleep(bank.latency * random.uniform(0.5, 1.5))
+        if payload is None or random.random() < bank.failure_rate:
+            with bank.lock:
+                bank.failures[source] += 1
+            self.send_response(500 if payload is not None else 404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(handler, **attributes):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_bot_process(stats_interval):
+    """Режим дочірнього процесу: запускає бота з main.py і періодично друкує його статистику."""
+    import api
+    import db
+    import main
+
+    def report():
+        while True:
+            rss_kb = 0
+            try:
+                with open("/proc/self/status") as f:
+                    rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            except (OSError, StopIteration):
+                pass  # Не Linux - пам'ять процесу недоступна
+            print(STATS_PREFIX + json.dumps({
+                'time': time.time(), 'rss_kb': rss_kb, 'sessions': main.sessions.stats(),
+                'writer': db.get_writer_stats(), 'write_queue': db._write_queue.qsize(),
+                'refresh_counts': dict(api.refresh_counts)}), flush=True)
+            time.sleep(stats_interval)
+
+    threading.Thread(target=report, daemon=True).start()
+    main.run()
+
+
+class LoadGenerator:
+    """Віртуальні користувачі: кожен бере вільний chat_id, проходить сценарій і повертає чат."""
+
+    def __init__(self, telegram, chats, users, think_time, reply_timeout, seed):
+        self.telegram = telegram
+        self.users = users
+        self.think_time = think_time
+        self.reply_timeout = reply_timeout
+        self.seed = seed
+        self.free_chats = queue.Queue()
+        for chat_id in random.Random(seed).sample(range(100000, 100000 + chats * 10), chats):
+            self.free_chats.put(chat_id)
+        self.stop_event = threading.Event()
+        self.latencies = defaultdict(list)  # мітка кроку -> список затримок (секунди)
+        self.timeouts = Counter()
+        self.flows_completed = Counter()
+        self.conversions = 0
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _step(self, chat_id, kind, text):
+        if kind == "inline_query":
+            reply_key = f"{chat_id}-{next(self._ids)}"
+            update = {'inline_query': {'id': reply_key, 'query': text, 'offset': '',
+                                       'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'}}}
+        else:
+            reply_key = chat_id
+            update = {'message': {'message_id': next(self._ids), 'date': int(time.time()), 'text': text,
+                                  'chat': {'id': chat_id, 'type': 'private'},
+                                  'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'}}}
+        event = self.telegram.push(update, reply_key)
+        event.wait(self.reply_timeout)
+        return self.telegram.take_latency(reply_key)
+
+    def _user_loop(self, number):
+        rng = random.Random(self.seed + number)
+        scenarios, weights = zip(*SCENARIOS)
+        while not self.stop_event.is_set():
+            scenario = rng.choices(scenarios, weights)[0]
+            chat_id = self.free_chats.get()
+            try:
+                for label, kind, text in scenario(rng):
+                    latency = self._step(chat_id, kind, text)
+                    with self.lock:
+                        if latency is None:
+                            self.timeouts[label] += 1
+                        else:
+                            self.latencies[label].append(latency)
+                    if latency is None:
+                        break  # Діалог зламаний - починаємо новий сценарій з іншим чатом
+                    time.sleep(rng.uniform(0, self.think_time))
+                else:
+                    with self.lock:
+                        self.flows_completed[scenario.__name__] += 1
+                        if scenario in (scenario_convert_manual, scenario_convert_quick):
+                            self.conversions += 1
+            finally:
+                self.free_chats.put(chat_id)
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._user_loop, args=(number,), daemon=True)
+                        for number in range(self.users)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(self.reply_timeout + self.think_time + 1)
+
+
+def print_report(args, generator, telegram, bank, samples, elapsed, bot_log, conversions_in_db):
+    print(f"\n=== Навантаження: {args.users} користувачів, {args.chats} чатів, {elapsed:.0f} с ===")
+    print(f"{'Крок':12} {'к-сть':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'max, мс':>9} {'таймаути':>9}")
+    total = []
+    for label in sorted(set(generator.latencies) | set(generator.timeouts)):
+        values = sorted(generator.latencies[label])
+        total.extend(values)
+        print(f"{label:12} {len(values):7} {percentile(values, 0.5) * 1000:9.1f} {percentile(values, 0.95) * 1000:9.1f} "
+              f"{percentile(values, 0.99) * 1000:9.1f} {(values[-1] if values else 0) * 1000:9.1f} "
+              f"{generator.timeouts[label]:9}")
+    total.sort()
+    print(f"{'усього':12} {len(total):7} {percentile(total, 0.5) * 1000:9.1f} {percentile(total, 0.95) * 1000:9.1f} "
+          f"{percentile(total, 0.99) * 1000:9.1f}  ({len(total) / elapsed:.0f} відповідей/с)")
+    print(f"Завершені сценарії: {dict(generator.flows_completed)}; зайві відповіді бота: {telegram.unexpected_replies}")
+    print(f"Виклики Bot API: {dict(telegram.method_counts)}")
+
+    print(f"\nЗапити до банків: {dict(bank.calls)}, з них помилок (штучних): {dict(bank.failures)}")
+    if samples:
+        print(f"Оновлення кешу за даними бота: {samples[-1]['refresh_counts']}")
+
+    if samples:
+        writer = samples[-1]['writer']
+        max_queue = max(sample['write_queue'] for sample in samples)
+        print(f"\nSQLite: {writer['rows']} записів за {writer['flushes']} групових комітів, "
+              f"середній коміт {writer['avg_flush_ms']:.2f} мс, максимальний {writer['max_flush_ms']:.2f} мс, "
+              f"максимальна черга запису {max_queue}")
+    locked = bot_log.count("database is locked")
+    print(f"Помилок 'database is locked': {locked}; трасувань помилок у журналі бота: {bot_log.count('Traceback')}")
+    if conversions_in_db is not None:
+        print(f"Конвертацій у базі після зупинки: {conversions_in_db} (завершено сценаріїв конвертації: "
+              f"{generator.conversions})")
+
+    if samples:
+        print("\nПам'ять і сесії бота:")
+        print(f"{'час, с':>7} {'RSS, МБ':>8} {'сесії':>7} {'у діалозі':>10} {'видалено':>9}")
+        step = max(1, len(samples) // 15)
+        start = samples[0]['time']
+        for sample in samples[::step] + ([samples[-1]] if (len(samples) - 1) % step else []):
+            sessions = sample['sessions']
+            print(f"{sample['time'] - start:7.0f} {sample['rss_kb'] / 1024:8.1f} {sessions['sessions']:7} "
+                  f"{sessions['in_flow']:10} {sessions['evicted']:9}")
+        growth = (samples[-1]['rss_kb'] - samples[0]['rss_kb']) / 1024
+        print(f"Ріст RSS за прогін: {growth:+.1f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Наскрізне навантажувальне тестування бота")
+    parser.add_argument("--chats", type=int, default=5000, help="Кількість різних chat_id")
+    parser.add_argument("--users", type=int, default=100, help="Кількість одночасних віртуальних користувачів")
+    parser.add_argument("--duration", type=float, default=60, help="Тривалість прогону, секунд")
+    parser.add_argument("--think-time", type=float, default=0.2, help="Максимальна пауза між кроками, секунд")
+    parser.add_argument("--reply-timeout", type=float, default=10, help="Скільки чекати на відповідь бота")
+    parser.add_argument("--bank-latency", type=float, default=0.2, help="Середня затримка API банків, секунд")
+    parser.add_argument("--bank-failure-rate", type=float, default=0.1, help="Частка відповідей банків з помилкою")
+    parser.add_argument("--refresh-interval", type=float, default=15, help="Період фонового оновлення курсів у боті")
+    parser.add_argument("--stats-interval", type=float, default=2, help="Як часто бот звітує статистику")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bot-process", action="store_true", help=argparse.SUPPRESS)  # Внутрішній режим
+    args = parser.parse_args()
+
+    if args.bot_process:
+        run_bot_process(args.stats_interval)
+        return
+
+    telegram = FakeTelegram()
+    telegram_server = start_server(FakeTelegramHandler, telegram=telegram)
+    payloads = {}
+    for source in ("monobank", "privatbank"):
+        with open(os.path.join(FIXTURES_DIR, f"{source}.json"), "rb") as f:
+            payloads[source] = f.read()
+    bank = start_server(FakeBankHandler, payloads=payloads, latency=args.bank_latency,
+                        failure_rate=args.bank_failure_rate, calls=Counter(), failures=Counter(),
+                        lock=threading.Lock())
+
+    work_dir = tempfile.mkdtemp(prefix="currency_bot_load_")
+    db_path = os.path.join(work_dir, "load.db")
+    bank_url = f"http://127.0.0.1:{bank.server_address[1]}"
+    env = dict(os.environ,
+               TOKEN="123456:loadtest",
+               TELEGRAM_API_URL=f"http://127.0.0.1:{telegram_server.server_address[1]}/bot{{0}}/{{1}}",
+               MONOBANK_API_URL=f"{bank_url}/monobank",
+               PRIVATBANK_API_URL=f"{bank_url}/privatbank",
+               DB_PATH=db_path,
+               BOT_MODE="polling",
+               PYTHONUNBUFFERED="1")
+    for prefix in ("MONOBANK", "PRIVATBANK"):
+        env.setdefault(f"{prefix}_REFRESH_INTERVAL", str(args.refresh_interval))
+        env.setdefault(f"{prefix}_CACHE_LIFETIME", str(args.refresh_interval * 1.5))
+        env.setdefault(f"{prefix}_REFRESH_JITTER", "1")
+        env.setdefault(f"{prefix}_CIRCUIT_RESET", "5")
+    # Імітатор Telegram не має лімітів, а користувачі навантаження пишуть частіше за 1 раз на секунду:
+    # без цього затримки показували б лише паузи планувальника sender.py (задайте SEND_* явно, щоб їх виміряти)
+    env.setdefault("SEND_GLOBAL_RATE", "100000")
+    env.setdefault("SEND_CHAT_RATE", "100000")
+
+    bot_log_path = os.path.join(work_dir, "bot.log")
+    bot_log = open(bot_log_path, "w")
+    bot = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--bot-process",
+                            "--stats-interval", str(args.stats_interval)],
+                           env=env, stdout=subprocess.PIPE, stderr=bot_log, text=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+    samples = []
+
+    def read_stats():
+        for line in bot.stdout:
+            if line.startswith(STATS_PREFIX):
+                samples.append(json.loads(line[len(STATS_PREFIX):]))
+
+    reader = threading.Thread(target=read_stats, daemon=True)
+    reader.start()
+
+    # Чекаємо, поки бот почне опитувати getUpdates
+    deadline = time.monotonic() + 30
+    while telegram.method_counts["getUpdates"] == 0:
+        if bot.poll() is not None or time.monotonic() > deadline:
+            bot_log.close()
+            with open(bot_log_path) as f:
+                print(f.read()[-3000:])
+            sys.exit("Бот не запустився")
+        time.sleep(0.1)
+
+    print(f"Бот запущено (pid {bot.pid}), журнал: {bot_log_path}")
+    generator = LoadGenerator(telegram, args.chats, args.users, args.think_time, args.reply_timeout, args.seed)
+    started = time.perf_counter()
+    generator.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    generator.stop()
+    elapsed = time.perf_counter() - started
+
+    time.sleep(args.stats_interval)  # Останній знімок статистики після навантаження
+    bot.send_signal(signal.SIGTERM)  # Бот зберігає чергу конвертацій під час зупинки
+    try:
+        bot.wait(30)
+    except subprocess.TimeoutExpired:
+        bot.kill()
+    reader.join(5)
+    bot_log.close()
+    with open(bot_log_path) as f:
+        log_text = f.read()
+
+    conversions_in_db = None
+    try:
+        with sqlite3.connect(db_path) as conn:
+            conversions_in_db = conn.execute("SELECT COUNT(*) FROM conversions").fetchone()[0]
+    except sqlite3.Error:
+        pass
+    print_report(args, generator, telegram, bank, samples, elapsed, log_text, conversions_in_db)
+    telegram_server.shutdown()
+    bank.shutdown()
+
+
+if __name__ == "__main__":
+    main()
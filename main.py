@@ -1,14 +1,28 @@
 import telebot
+import io
 import logging
 import os
+import signal
+import sys
 from dotenv import load_dotenv
-from telebot import types
 
 # from api import get_monobank_rates, get_privatbank_rates  # Більше не потрібно напряму
-from api import get_rates #Імпортуємо загальну функцію
-from db import add_conversion, get_history
-from utils import get_currency_name
-from keyboards import create_main_menu, create_currency_keyboard, create_swap_keyboard, create_source_keyboard
+from api import get_rates_entry, get_rate_index, get_supported_currencies, load_snapshots, start_prefetcher, add_refresh_listener #Імпортуємо загальну функцію та індекс пар
+from api import get_rates_entries, compare_rates, get_source_name, find_source, SOURCES  # Реєстр банків і режим порівняння
+from db import add_conversion, add_conversions, get_history_page, get_writer_stats, init as init_db
+from render import HELP_TEXT, get_rates_messages, warm_rates_messages, render_history_text, history_page_bounds, render_trend_text, render_alert_text, render_alert_list, ALERT_DIRECTION_TEXT, render_bulk_summary, BULK_HELP_TEXT, render_compare_text
+from sessions import create_session_store
+from router import Router
+from inline import InlineAnswerCache, INLINE_CACHE_TIME
+from timeseries import RateHistory, parse_trend_args
+from alerts import AlertIndex, parse_alert_args, is_triggered, ALERTS_PER_CHAT
+from sender import SendScheduler, BACKGROUND
+from bulk import (parse_bulk_command, parse_rows, convert_rows, render_results_csv, decode_document, BULK_MAX_ROWS,
+                  BULK_MAX_FILE_SIZE)
+from metrics import timed, register_gauge, start as start_metrics
+from runtime import Handlers, SyncTelegram, run_inline, sync_handler
+from keyboards import (create_main_menu, create_currency_keyboard, create_swap_keyboard, create_source_keyboard,
+                       create_history_keyboard, create_quick_convert_keyboard, parse_currency_page, REMOVE_KEYBOARD)
 
 # Завантажуємо .env, якщо використовується (якщо config.py, цей рядок не потрібен)
 load_dotenv()
@@ -20,196 +34,192 @@ TOKEN = os.getenv("TOKEN")  # Якщо використовуєш .env
 if TOKEN is None:
     raise ValueError(".env файл не знайдено, або не вказано TOKEN, або немає змінної TOKEN у config.py")
 
-bot = telebot.TeleBot(TOKEN)
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # 'polling' або 'webhook' (див. Procfile)
+
+# Інша адреса Bot API (власний сервер Bot API або тестовий стенд loadtest.py),
+# формат як у telebot: "http://host:port/bot{0}/{1}".  Режим asyncio застосовує її в async_bot.run
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL
+
+# У режимі webhook обробники виконує пул потоків webhook.py, тому власний пул TeleBot не потрібен
+bot = telebot.TeleBot(TOKEN, threaded=BOT_MODE != "webhook")
+# Обробники - корутини (runtime.py): до Telegram вони звертаються через telegram, а до
+# SQLite - через blocking.  У режимі asyncio async_bot.run підміняє їх на AsyncTeleBot
+# і asyncio.to_thread, у режимі потоків обидва виконуються одразу в потоці обробника
+telegram = SyncTelegram(bot)
+blocking = run_inline
+handlers = Handlers()  # Реєструються на TeleBot або AsyncTeleBot у run()
 
 # Налаштовуємо логування
 logging.basicConfig(level=logging.INFO)
 
-user_data = {}  # Словник для тимчасового зберігання даних користувача
 DEFAULT_SOURCE = "monobank" #Банк за замовчуванням
-# Обробник команди /start
-@bot.message_handler(commands=['start'])
-def send_welcome(message):
-    show_main_menu(message)
-
-# Обробник натискання на кнопки головного меню (і команда /start)
-@bot.message_handler(func=lambda message: message.text in ["💱 Конвертувати", "📈 Курси валют", "ℹ️ Допомога", "📜 Історія", "🏦 Змінити банк", "Старт"])
-def handle_main_menu(message):
-    if message.text == "💱 Конвертувати" or message.text == "/convert":
-        start_convert(message)
-    elif message.text == "📈 Курси валют" or message.text == "/rates":
-        show_rates(message)
-    elif message.text == "ℹ️ Допомога" or message.text == "/help":
-        send_help(message)
-    elif message.text == "📜 Історія" or message.text == "/history":
-        show_history(message)
-    elif message.text == "🏦 Змінити банк":
-        select_source(message)
-    elif message.text == "Старт":  # Додаткова обробка кнопки "Старт"
-        send_welcome(message)
-
-
-def show_main_menu(message):
+sessions = create_session_store(DEFAULT_SOURCE)  # Сесії користувачів з TTL і лімітом (sessions.py)
+inline_answers = InlineAnswerCache()  # Готові відповіді на inline-запити
+rate_history = RateHistory()  # Історія курсів для /trend (timeseries.py)
+# Усі повідомлення бота йдуть через планувальник з лімітами Telegram (sender.py):
+# обробник лише ставить відповідь у чергу і не чекає на запит до Telegram
+outbox = SendScheduler(lambda method, chat_id, text, **kwargs: getattr(bot, method)(chat_id, text, **kwargs))
+reply = outbox.reply  # Замість bot.reply_to
+# Сповіщення про курс (/alert) - фонові повідомлення, відповіді користувачам надсилаються раніше
+alerts = AlertIndex(notify=lambda alert, rate: outbox.put(alert.chat_id, render_alert_text(alert, rate, get_source_name(alert.source)), BACKGROUND))
+HISTORY_PAGE_SIZE = 10  # Кількість записів на сторінці /history
+router = Router(sessions)  # Команди, кнопки меню і кроки діалогу (router.py)
+
+
+async def get_session(chat_id):
+    """Сесія чату.  Якщо її немає в пам'яті, вибраний банк читається з бази через blocking."""
+    session = sessions.touch(chat_id)
+    if session is None:
+        session = await blocking(sessions.get, chat_id)
+    return session
+
+# Усі текстові повідомлення проходять через таблиці маршрутів замість фільтрів
+# telebot і register_next_step_handler: крок діалогу зберігається в сесії
+@handlers.message_handler(content_types=['text'])
+async def dispatch_message(message):
+    handler = router.resolve(message)
+    if handler is not None:
+        await handler(message)
+
+# Обробник команди /start (і кнопки "Старт")
+@router.command("start")
+@router.button("Старт")
+@timed("send_welcome")
+async def send_welcome(message):
+    await show_main_menu(message)
+
+
+async def show_main_menu(message):
     markup = create_main_menu()  # Використовуємо функцію з keyboards.py
     user_name = message.from_user.first_name  # Отримуємо ім'я користувача
     chat_id = message.chat.id  # Отримуємо chat_id
-    source = user_data.get(chat_id, {}).get('source', DEFAULT_SOURCE)  # Отримуємо джерело
-    source_name = "Monobank" if source == "monobank" else "ПриватБанк"  # Назва для повідомлення
-    bot.reply_to(message, f"👋 Привіт, {user_name}! Я бот-конвертер валют!\n\n"
-                          f"Я допоможу тобі швидко конвертувати валюти за курсом {source_name}. 🏦\n\n"  # Повідомлення з назвою банку
-                          "Вибери дію:", reply_markup=markup)   # Показуємо головне меню
+    source = (await get_session(chat_id)).source  # Отримуємо джерело
+    source_name = get_source_name(source)  # Назва для повідомлення
+    reply(message, f"👋 Привіт, {user_name}! Я бот-конвертер валют!\n\n"
+                   f"Я допоможу тобі швидко конвертувати валюти за курсом {source_name}. 🏦\n\n"  # Повідомлення з назвою банку
+                   "Вибери дію:", reply_markup=markup)   # Показуємо головне меню
 
 # Обробник команди /help
-@bot.message_handler(commands=['help'])
-def send_help(message):
-    help_text = """
-Я можу допомогти тобі конвертувати валюти за курсом Monobank або ПриватБанку.
-
-Доступні команди:
-/start - Почати роботу з ботом (показує головне меню).
-/help - Показати це повідомлення.
-/convert - Конвертувати валюту.
-/rates - Показати курси валют.
-/history - Показати історію конвертацій.
-/source - Змінити джерело курсів валют (Monobank/Privatbank).
-
-Ви також можете використовувати мене в inline-режимі. Введіть в будь-якому чаті:
-`@Converter_tutorial1_bot <сума> <валюта> to <валюта>`
-Наприклад: `@Converter_tutorial1_bot 100 USD to UAH`
-    """
-    bot.reply_to(message, help_text, parse_mode="Markdown")  # parse_mode для Markdown
+@router.command("help")
+@router.button("ℹ️ Допомога")
+@timed("send_help")
+async def send_help(message):
+    reply(message, HELP_TEXT, parse_mode="Markdown")  # parse_mode для Markdown
 # Обробник команди /rates (показує курси валют)
-@bot.message_handler(commands=['rates'])
-def show_rates(message):
+@router.command("rates")
+@router.button("📈 Курси валют")
+@timed("show_rates")
+async def show_rates(message):
     chat_id = message.chat.id
-    source = user_data.get(chat_id, {}).get('source', DEFAULT_SOURCE) # Отримуємо джерело з user_data
-    rates = get_rates(source)  # Використовуємо функцію get_rates з api.py
-    if rates:
-        if source == "monobank":
-            response_text = f"*Курси валют {source}:*\n```\n"  # Markdown (жирний і моноширинний)
-            response_text += "Валюта | Купівля | Продаж\n"
-            response_text += "------- | -------- | --------\n"
-            for rate in rates:
-                currency_a = get_currency_name(rate.get('currencyCodeA'), source)  # utils.get_...
-                currency_b = get_currency_name(rate.get('currencyCodeB'), source)
-                rate_buy = rate.get('rateBuy')
-                rate_sell = rate.get('rateSell')
-
-                if rate_buy is not None and rate_sell is not None:
-                    response_text += f"{currency_a}/{currency_b}    | {rate_buy:8.4f} | {rate_sell:8.4f}\n"
-            response_text += "```"
-            bot.reply_to(message, response_text, parse_mode="Markdown")  # Вказуємо parse_mode
-
-        elif source == "privatbank":
-            response_text = f"*Курси валют {source}:*\n```\n"
-            response_text += "Валюта | Купівля | Продаж\n"
-            response_text += "------- | -------- | --------\n"
-            for rate in rates:
-                currency_a = rate.get('ccy')  # Використовуємо 'ccy' для ПриватБанку
-                currency_b = rate.get('base_ccy')
-                rate_buy = rate.get('buy')
-                rate_sell = rate.get('sale')
-                if currency_a and currency_b and rate_buy and rate_sell:
-                    response_text += f"{currency_a}/{currency_b}    | {float(rate_buy):8.4f} | {float(rate_sell):8.4f}\n"
-            response_text += "```"
-            bot.reply_to(message, response_text, parse_mode="Markdown")
+    source = (await get_session(chat_id)).source # Отримуємо джерело з сесії
+    entry = get_rates_entry(source)  # Курси разом з номером покоління кешу (api.py)
+    if entry:
+        messages = get_rates_messages(entry, source)  # Готова таблиця курсів, розбита на повідомлення (render.py)
+        if messages:
+            for response_text in messages:
+                reply(message, response_text, parse_mode="Markdown")  # Вказуємо parse_mode
         else:
-            bot.reply_to(message, f"Невідоме джерело курсів: {source}")
+            reply(message, f"Невідоме джерело курсів: {source}")
 
     else:
-        bot.reply_to(message, f"Не вдалося отримати курси валют з {source}.")
+        reply(message, f"Не вдалося отримати курси валют з {source}.")
 # Додаємо обробник команди /source та функцію select_source
-@bot.message_handler(commands=['source'])
-def select_source(message):
+@router.command("source")
+@router.button("🏦 Змінити банк")
+@timed("select_source")
+async def select_source(message):
     markup = create_source_keyboard() # Клавіатура з вибором банків
-    bot.reply_to(message, "Виберіть джерело курсів валют:", reply_markup=markup)
-    bot.register_next_step_handler(message, process_source_selection)
+    (await get_session(message.chat.id)).state = 'awaiting_source'
+    reply(message, "Виберіть джерело курсів валют:", reply_markup=markup)
 
-def process_source_selection(message):
+@router.state('awaiting_source')
+@timed("process_source_selection")
+async def process_source_selection(message):
     chat_id = message.chat.id
     markup = create_source_keyboard()
     if message.text == "⬅️ Назад": #назад в головне меню
-        show_main_menu(message)
+        sessions.reset_state(chat_id)
+        await show_main_menu(message)
         return
-    if message.text not in ["Monobank", "PrivatBank"]:
-        bot.reply_to(message, "Будь ласка, виберіть джерело зі списку.", reply_markup=markup)
-        bot.register_next_step_handler(message, process_source_selection)
+    source = find_source(message.text)  # Ключ банку за написом на кнопці (реєстр api.py)
+    if source is None:
+        reply(message, "Будь ласка, виберіть джерело зі списку.", reply_markup=markup)  # Стан не змінюється
         return
 
-    source = message.text.lower()  # Приводимо до нижнього регістра
-    if source == "privatbank":
-        source = "privatbank"  # Уніфікуємо назву
-
-    # Зберігаємо вибір користувача в user_data
-    if chat_id not in user_data:
-      user_data[chat_id] = {} #Створюємо, якщо немає
-    user_data[chat_id]['source'] = source
-    bot.reply_to(message, f"Вибрано джерело курсів: {message.text}", reply_markup=types.ReplyKeyboardRemove())
-    show_main_menu(message)  # Повертаємось в головне меню
+    # Зберігаємо вибір користувача в сесії (і в базі, щоб пережив перезапуск)
+    await blocking(sessions.set_source, chat_id, source)
+    sessions.reset_state(chat_id)
+    reply(message, f"Вибрано джерело курсів: {message.text}", reply_markup=REMOVE_KEYBOARD)
+    await show_main_menu(message)  # Повертаємось в головне меню
 # Обробник команди /convert (початок процесу конвертації)
-@bot.message_handler(commands=['convert'])
-def start_convert(message):
+@router.command("convert")
+@router.button("💱 Конвертувати")
+@timed("start_convert")
+async def start_convert(message):
     chat_id = message.chat.id
-    user_data[chat_id] = user_data.get(chat_id, {}) #Створюємо пустий словник, або беремо існуючий
-    user_data[chat_id]['state'] = 'awaiting_choice'  # Початковий стан
+    session = await get_session(chat_id)
+    session.clear_conversion()  # Нова конвертація - забуваємо попередні валюти і суму
+    session.state = 'awaiting_choice'  # Початковий стан
 
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    markup.add(types.KeyboardButton("USD/UAH"), types.KeyboardButton("EUR/UAH"))
-    markup.add(types.KeyboardButton("Ввести вручну"))
-    markup.add(types.KeyboardButton("⬅️ Назад"))  # Додаємо кнопку "Назад"
+    markup = create_quick_convert_keyboard()  # Готова клавіатура швидкої конвертації (keyboards.py)
 
-    msg = bot.reply_to(message, "Виберіть швидку конвертацію або введіть дані вручну:", reply_markup=markup)
-    bot.register_next_step_handler(msg, process_choice)  # Переходимо до вибору типу конвертації
+    reply(message, "Виберіть швидку конвертацію або введіть дані вручну:", reply_markup=markup)
 
 # Обробник вибору типу конвертації (швидка/ручна)
-def process_choice(message):
+@router.state('awaiting_choice')
+@timed("process_choice")
+async def process_choice(message):
     chat_id = message.chat.id
+    session = await get_session(chat_id)
 
     if message.text == "⬅️ Назад":
-        show_main_menu(message)  # Повернення в головне меню
+        session.state = None
+        await show_main_menu(message)  # Повернення в головне меню
         return
 
     if message.text == "USD/UAH":
-        user_data[chat_id]['from_currency'] = "USD"
-        user_data[chat_id]['to_currency'] = "UAH"
-        user_data[chat_id]['state'] = 'awaiting_amount'
-        bot.reply_to(message, "Введіть суму в USD:", reply_markup=types.ReplyKeyboardRemove()) #Клавіатуру прибираємо
-        bot.register_next_step_handler(message, process_amount) #Переходимо до process_amount
+        session.from_currency = "USD"
+        session.to_currency = "UAH"
+        session.state = 'awaiting_amount'
+        reply(message, "Введіть суму в USD:", reply_markup=REMOVE_KEYBOARD) #Клавіатуру прибираємо
 
     elif message.text == "EUR/UAH":
-        user_data[chat_id]['from_currency'] = "EUR"
-        user_data[chat_id]['to_currency'] = "UAH"
-        user_data[chat_id]['state'] = 'awaiting_amount'
-        bot.reply_to(message, "Введіть суму в EUR:", reply_markup=types.ReplyKeyboardRemove())
-        bot.register_next_step_handler(message, process_amount) #Переходимо до process_amount
+        session.from_currency = "EUR"
+        session.to_currency = "UAH"
+        session.state = 'awaiting_amount'
+        reply(message, "Введіть суму в EUR:", reply_markup=REMOVE_KEYBOARD)
 
     elif message.text == "Ввести вручну":
-        user_data[chat_id]['state'] = 'awaiting_amount'
-        bot.reply_to(message, "Введіть суму:", reply_markup=types.ReplyKeyboardRemove()) #Прибираємо клавіатуру
-        bot.register_next_step_handler(message, process_amount) #Передаємо process_amount
+        session.state = 'awaiting_amount'
+        reply(message, "Введіть суму:", reply_markup=REMOVE_KEYBOARD) #Прибираємо клавіатуру
     else:
-        bot.reply_to(message, "Невірний вибір.")
-        start_convert(message)  # Починаємо спочатку
+        reply(message, "Невірний вибір.")
+        await start_convert(message)  # Починаємо спочатку
 # Обробник введення суми (об'єднаний для швидкої та ручної конвертації)
-def process_amount(message):
+@router.state('awaiting_amount')
+@timed("process_amount")
+async def process_amount(message):
     """
     Обробляє введення суми для конвертації.  Працює як для швидкої конвертації,
     так і для ручного введення валют.  Перевіряє коректність введених даних.
     """
     chat_id = message.chat.id
-    markup = create_currency_keyboard(back_button=True)  # Створюємо клавіатуру вибору валют з кнопкою "Назад"
+    session = await get_session(chat_id)
+    # Клавіатура валют, для яких банк дає курс, з кнопкою "Назад"
+    markup = create_currency_keyboard(back_button=True, currencies=get_supported_currencies(session.source))
 
     if message.text == "⬅️ Назад":
-        start_convert(message)  # Повертаємось до початку (вибір швидкої/ручної конвертації)
+        await start_convert(message)  # Повертаємось до початку (вибір швидкої/ручної конвертації)
         return
 
     # Перевірка стану.  Якщо стан не 'awaiting_amount', то щось пішло не так.
     # (наприклад, користувач ввів команду /start під час конвертації).
-    if chat_id not in user_data or user_data[chat_id].get('state') != 'awaiting_amount':
-        bot.reply_to(message, "Сталася помилка. Почніть конвертацію знову.", reply_markup=types.ReplyKeyboardRemove())
-        if chat_id in user_data:  # Видаляємо дані, якщо вони є, щоб не було конфліктів
-            del user_data[chat_id]
-        show_main_menu(message)  # Повертаємо в головне меню
+    if session.state != 'awaiting_amount':
+        reply(message, "Сталася помилка. Почніть конвертацію знову.", reply_markup=REMOVE_KEYBOARD)
+        session.clear_conversion()  # Видаляємо дані конвертації, щоб не було конфліктів
+        await show_main_menu(message)  # Повертаємо в головне меню
         return  # Виходимо з функції
 
     try:
@@ -219,261 +229,333 @@ def process_amount(message):
             # Якщо сума менша або дорівнює нулю, генеруємо виняток
             raise ValueError("Сума повинна бути більшою за нуль")
 
-        # Якщо все добре (сума - коректне число), зберігаємо її в user_data
-        user_data[chat_id]['amount'] = amount
-        user_data[chat_id]['state'] = 'awaiting_from_currency'  # Змінюємо стан на "очікування вихідної валюти"
+        # Якщо все добре (сума - коректне число), зберігаємо її в сесії
+        session.amount = amount
+        session.state = 'awaiting_from_currency'  # Змінюємо стан на "очікування вихідної валюти"
 
         # Якщо це швидка конвертація (валюти вже визначені), одразу переходимо до конвертації
-        if 'from_currency' in user_data[chat_id] and 'to_currency' in user_data[chat_id]:
-             user_data[chat_id]['state'] = None  # Скидаємо стан
-             convert_currency(chat_id, message)
+        if session.from_currency and session.to_currency:
+             session.state = None  # Скидаємо стан
+             await convert_currency(chat_id, message)
              return
         # Якщо ручне введення, переходимо до вибору валюти
-        msg = bot.reply_to(message, "Виберіть вихідну валюту:", reply_markup=markup)
-        bot.register_next_step_handler(msg, process_from_currency_step)
+        reply(message, "Виберіть вихідну валюту:", reply_markup=markup)
 
 
     except ValueError as e:
         # Якщо виникла помилка (некоректне число), повідомляємо про це користувача
-        bot.reply_to(message, f"Будь ласка, введіть додатнє числове значення. Помилка: {e}", reply_markup=types.ReplyKeyboardRemove())
-        # Повторно запитуємо суму
-        msg = bot.reply_to(message, "Введіть суму:")
-        bot.register_next_step_handler(msg, process_amount)
+        reply(message, f"Будь ласка, введіть додатнє числове значення. Помилка: {e}", reply_markup=REMOVE_KEYBOARD)
+        # Повторно запитуємо суму (стан залишається 'awaiting_amount')
+        reply(message, "Введіть суму:")
 # Обробник вибору вихідної валюти
-def process_from_currency_step(message):
+@router.state('awaiting_from_currency')
+@timed("process_from_currency_step")
+async def process_from_currency_step(message):
     chat_id = message.chat.id
-    markup = create_currency_keyboard(back_button=True)  # Клавіатура з кнопкою "Назад"
+    session = await get_session(chat_id)
+    markup = create_currency_keyboard(back_button=True, currencies=get_supported_currencies(session.source))
     if message.text == "⬅️ Назад":
         # Повертаємось до введення суми.  Змінюємо стан.
-        user_data[chat_id]['state'] = 'awaiting_amount'
-        msg = bot.reply_to(message, "Введіть суму:", reply_markup=types.ReplyKeyboardRemove()) #Прибираємо стару клавіатуру
-        bot.register_next_step_handler(msg, process_amount)
+        session.state = 'awaiting_amount'
+        reply(message, "Введіть суму:", reply_markup=REMOVE_KEYBOARD) #Прибираємо стару клавіатуру
+        return
+
+    page = parse_currency_page(message.text)
+    if page is not None:  # Наступна сторінка клавіатури валют, крок не змінюється
+        reply(message, "Виберіть вихідну валюту:", reply_markup=create_currency_keyboard(
+            back_button=True, currencies=get_supported_currencies(session.source), page=page))
         return
 
-    from_currency = message.text  # Отримуємо текст повідомлення (назву валюти)
+    from_currency = message.text.strip().upper()  # Отримуємо текст повідомлення (назву валюти)
 
-    # Перевіряємо, чи є вибрана валюта в списку дозволених
-    if from_currency not in ["USD", "EUR", "UAH", "GBP", "PLN"]:
-        bot.reply_to(message, "Невірна валюта.", reply_markup=markup)
-        msg = bot.reply_to(message, "Виберіть вихідну валюту:", reply_markup=markup)
-        bot.register_next_step_handler(msg, process_from_currency_step)  # Знову викликаємо цю ж функцію
+    # Перевіряємо, чи є вибрана валюта серед валют, для яких банк дає курс
+    if from_currency not in get_supported_currencies(session.source):
+        reply(message, "Невірна валюта.", reply_markup=markup)
+        reply(message, "Виберіть вихідну валюту:", reply_markup=markup)  # Стан не змінюється
         return
 
-    # Якщо валюта коректна, зберігаємо її в user_data
-    user_data[chat_id]['from_currency'] = from_currency
-    user_data[chat_id]['state'] = 'awaiting_to_currency'  # Змінюємо стан на "очікування цільової валюти"
-    msg = bot.reply_to(message, "Виберіть цільову валюту:", reply_markup=markup)
-    bot.register_next_step_handler(msg, process_to_currency_step)  # Переходимо до вибору цільової валюти
+    # Якщо валюта коректна, зберігаємо її в сесії
+    session.from_currency = from_currency
+    session.state = 'awaiting_to_currency'  # Змінюємо стан на "очікування цільової валюти"
+    reply(message, "Виберіть цільову валюту:", reply_markup=markup)  # Далі - process_to_currency_step
 
 # Обробник вибору цільової валюти
-def process_to_currency_step(message):
+@router.state('awaiting_to_currency')
+@timed("process_to_currency_step")
+async def process_to_currency_step(message):
     chat_id = message.chat.id
-    markup = create_currency_keyboard(back_button=True)  # Клавіатура з кнопкою "Назад"
+    session = await get_session(chat_id)
+    markup = create_currency_keyboard(back_button=True, currencies=get_supported_currencies(session.source))
 
     if message.text == "⬅️ Назад":
         # Повертаємось до вибору *вихідної* валюти, змінюємо стан
-        user_data[chat_id]['state'] = 'awaiting_from_currency'
-        msg = bot.reply_to(message, "Виберіть вихідну валюту:", reply_markup=markup) #Показуємо стару клавіатуру
-        bot.register_next_step_handler(msg, process_from_currency_step)
+        session.state = 'awaiting_from_currency'
+        reply(message, "Виберіть вихідну валюту:", reply_markup=markup) #Показуємо стару клавіатуру
         return
 
-    to_currency = message.text  # Отримуємо текст повідомлення (назву цільової валюти)
+    page = parse_currency_page(message.text)
+    if page is not None:  # Наступна сторінка клавіатури валют, крок не змінюється
+        reply(message, "Виберіть цільову валюту:", reply_markup=create_currency_keyboard(
+            back_button=True, currencies=get_supported_currencies(session.source), page=page))
+        return
+
+    to_currency = message.text.strip().upper()  # Отримуємо текст повідомлення (назву цільової валюти)
 
-    # Перевірка, чи валюта є в списку дозволених
-    if to_currency not in ["USD", "EUR", "UAH", "GBP", "PLN"]:
-        bot.reply_to(message, "Невірна валюта.", reply_markup=markup)
-        msg = bot.reply_to(message, "Виберіть цільову валюту:", reply_markup=markup)
-        bot.register_next_step_handler(msg, process_to_currency_step)  # Знову викликаємо цю ж функцію
+    # Перевірка, чи валюта є серед валют, для яких банк дає курс
+    if to_currency not in get_supported_currencies(session.source):
+        reply(message, "Невірна валюта.", reply_markup=markup)
+        reply(message, "Виберіть цільову валюту:", reply_markup=markup)  # Стан не змінюється
         return
 
-    # Якщо все добре, зберігаємо цільову валюту в user_data
-    user_data[chat_id]['to_currency'] = to_currency
-    user_data[chat_id]['state'] = None  # Скидаємо стан (конвертація завершена/готова до конвертації)
+    # Якщо все добре, зберігаємо цільову валюту в сесії
+    session.to_currency = to_currency
+    session.state = None  # Скидаємо стан (конвертація завершена/готова до конвертації)
 
     # Додаємо кнопку "Поміняти місцями"
     markup = create_swap_keyboard()  # Використовуємо функцію з keyboards.py
-    convert_currency(chat_id, message, markup)  # Переходимо до функції конвертації
-def convert_currency(chat_id, message, reply_markup=None):
+    await convert_currency(chat_id, message, markup)  # Переходимо до функції конвертації
+@timed("convert_currency")
+async def convert_currency(chat_id, message, reply_markup=None, compare=False):
     """
-    Виконує конвертацію валюти на основі даних в user_data,
-    і надсилає результат.
+    Виконує конвертацію валюти на основі даних у сесії,
+    і надсилає результат.  Валюти і сума залишаються в сесії, щоб кнопки
+    "Поміняти місцями" і "Порівняти банки" могли повторити конвертацію.
+
+    Args:
+        compare: Режим порівняння - курс пари у всіх банках замість вибраного.
     """
-    source = user_data.get(chat_id, {}).get('source', DEFAULT_SOURCE)
-    rates = get_rates(source)
-
-    if not rates:
-        bot.reply_to(message, "Не вдалося отримати курси валют.", reply_markup=types.ReplyKeyboardRemove())
-        if chat_id in user_data:
-            del user_data[chat_id]
-        show_main_menu(message)
+    session = await get_session(chat_id)
+    if compare:
+        comparison = compare_rates(session.from_currency, session.to_currency)  # Банки опитуються паралельно
+        names = {source: get_source_name(source) for source in SOURCES}
+        reply(message, render_compare_text(session.amount, session.from_currency, session.to_currency,
+                                           comparison, names), reply_markup=reply_markup)
         return
+    rate_index = get_rate_index(session.source)  # Індекс пар будується один раз при оновленні кешу
 
-    rate = None
-    for r in rates:
-        if source == "monobank":
-            if get_currency_name(r.get('currencyCodeA')) == user_data[chat_id]['from_currency'] and \
-                get_currency_name(r.get('currencyCodeB')) == user_data[chat_id]['to_currency']:
-                rate = r
-                break
-            if get_currency_name(r.get('currencyCodeB')) == user_data[chat_id]['from_currency'] and \
-                get_currency_name(r.get('currencyCodeA')) == user_data[chat_id]['to_currency']:
-                rate = r
-                break
-        elif source == "privatbank":
-            if r.get('ccy') == user_data[chat_id]['from_currency'] and r.get('base_ccy') == user_data[chat_id]['to_currency']:
-                rate = r
-                break
-
-    if not rate:
-        bot.reply_to(message, "Не вдалося знайти курс для цієї пари валют.", reply_markup=types.ReplyKeyboardRemove())
-        if chat_id in user_data:
-            del user_data[chat_id]
-        show_main_menu(message)
+    if not rate_index:
+        reply(message, "Не вдалося отримати курси валют.", reply_markup=REMOVE_KEYBOARD)
+        session.clear_conversion()
+        await show_main_menu(message)
         return
 
-    if source == "monobank":
-        if 'rateBuy' in rate and 'rateSell' in rate:
-            if user_data[chat_id]['from_currency'] == 'UAH':
-                converted_amount = user_data[chat_id]['amount'] / rate['rateSell']
-            elif user_data[chat_id]['to_currency'] == 'UAH':
-                    converted_amount = user_data[chat_id]['amount'] * rate['rateBuy']
-            else:  # Між іноземними
-                if 'rateCross' in rate:
-                        converted_amount = user_data[chat_id]['amount'] * rate['rateCross']
-                else:
-                    bot.reply_to(message, "Не вдалося знайти крос-курс.", reply_markup=types.ReplyKeyboardRemove())
-                    if chat_id in user_data:
-                        del user_data[chat_id]
-                    show_main_menu(message)
-                    return
-        else:
-            bot.reply_to(message, "Відсутні необхідні курси (купівлі/продажу).", reply_markup=types.ReplyKeyboardRemove())
-            if chat_id in user_data:
-                del user_data[chat_id]
-            show_main_menu(message)
-            return
+    quote = rate_index.get((session.from_currency, session.to_currency))
 
-    elif source == "privatbank":
-        if 'buy' in rate and 'sale' in rate:
-            if user_data[chat_id]['from_currency'] == "UAH":
-                converted_amount = user_data[chat_id]['amount'] / float(rate['sale'])  # Не забуваємо про float
-            else:
-                converted_amount = user_data[chat_id]['amount'] * float(rate['buy']) # Не забуваємо про float
-        else:
-                bot.reply_to(message, "Відсутні необхідні курси (купівлі/продажу).", reply_markup=types.ReplyKeyboardRemove())
-                if chat_id in user_data:
-                    del user_data[chat_id]
-                show_main_menu(message)
-                return
+    if not quote:
+        reply(message, "Не вдалося знайти курс для цієї пари валют.", reply_markup=REMOVE_KEYBOARD)
+        session.clear_conversion()
+        await show_main_menu(message)
+        return
 
+    converted_amount = session.amount * quote.rate
 
     formatted_amount = "{:.2f}".format(converted_amount)
-    bot.reply_to(message, f"Результат: {formatted_amount} {user_data[chat_id]['to_currency']}", reply_markup=reply_markup)
+    cross_note = f" (крос-курс через {quote.via})" if quote.via else ""
+    reply(message, f"Результат: {formatted_amount} {session.to_currency}{cross_note}", reply_markup=reply_markup)
 
-    add_conversion(chat_id, user_data[chat_id]['amount'], user_data[chat_id]['from_currency'],
-                    user_data[chat_id]['to_currency'], converted_amount)
-    if chat_id in user_data:
-        del user_data[chat_id]
+    add_conversion(chat_id, session.amount, session.from_currency,
+                    session.to_currency, converted_amount)
 # Обробник натискання на кнопку "Поміняти місцями"
-@bot.callback_query_handler(func=lambda call: call.data == "swap_currencies")
-def handle_swap_currencies(call):
+@handlers.callback_query_handler(func=lambda call: call.data == "swap_currencies")
+@timed("handle_swap_currencies")
+async def handle_swap_currencies(call):
     chat_id = call.message.chat.id
-    if chat_id in user_data:
+    session = sessions.peek(chat_id)  # Сесія могла бути видалена за TTL
+    if session and session.from_currency and session.to_currency and session.amount:
         # Міняємо місцями from_currency і to_currency
-        user_data[chat_id]['from_currency'], user_data[chat_id]['to_currency'] = \
-            user_data[chat_id]['to_currency'], user_data[chat_id]['from_currency']
+        session.from_currency, session.to_currency = session.to_currency, session.from_currency
 
         # Повторно викликаємо функцію convert_currency, передаючи *НОВУ* клавіатуру
         markup = create_swap_keyboard()  # Створюємо нову клавіатуру
-        convert_currency(chat_id, call.message, markup)  # Викликаємо функцію конвертації
-        bot.answer_callback_query(call.id)  # Закриваємо callback
+        await convert_currency(chat_id, call.message, markup)  # Викликаємо функцію конвертації
+        await telegram.answer_callback_query(call.id)  # Закриваємо callback
+
+    else:
+        await telegram.answer_callback_query(call.id, "Дані про конвертацію застаріли. Почніть спочатку.")
+        await show_main_menu(call.message)
 
+
+# Обробник натискання на кнопку "Порівняти банки"
+@handlers.callback_query_handler(func=lambda call: call.data == "compare_sources")
+@timed("handle_compare_sources")
+async def handle_compare_sources(call):
+    chat_id = call.message.chat.id
+    session = sessions.peek(chat_id)  # Сесія могла бути видалена за TTL
+    if session and session.from_currency and session.to_currency and session.amount:
+        await convert_currency(chat_id, call.message, compare=True)
+        await telegram.answer_callback_query(call.id)
     else:
-        bot.answer_callback_query(call.id, "Дані про конвертацію застаріли. Почніть спочатку.")
-        show_main_menu(call.message)
+        await telegram.answer_callback_query(call.id, "Дані про конвертацію застаріли. Почніть спочатку.")
+        await show_main_menu(call.message)
 
 
 # Обробник команди /history (показує історію конвертацій)
-@bot.message_handler(commands=['history'])
-def show_history(message):
+@router.command("history")
+@router.button("📜 Історія")
+@timed("show_history")
+async def show_history(message):
     chat_id = message.chat.id
-    history = get_history(chat_id)  # Використовуємо функцію з db.py
+    history, has_older, has_newer, older_bound = await blocking(get_history_page, chat_id, HISTORY_PAGE_SIZE)  # Перша сторінка (db.py)
     if history:
-        response_text = "*Історія конвертацій:*\n```\n"  # Markdown (жирний і моноширинний шрифт)
-        response_text += "Сума | Звідки | Куди | Результат | Час\n"
-        response_text += "------|-------|------|-----------|-----\n"
-        for row in history:
-            amount, from_currency, to_currency, converted_amount, timestamp = row
-            response_text += f"{amount:5.2f} | {from_currency:5} | {to_currency:4} | {converted_amount:9.2f} | {timestamp}\n"
-        response_text += "```"
-        bot.reply_to(message, response_text, parse_mode="Markdown")  # parse_mode='Markdown'
+        response_text = render_history_text(history)  # Таблиця історії (render.py)
+        markup = create_history_keyboard(*history_page_bounds(history, has_older, has_newer, older_bound))
+        reply(message, response_text, parse_mode="Markdown", reply_markup=markup)  # parse_mode='Markdown'
+    else:
+        reply(message, "Історія конвертацій порожня.")
+
+# Обробник кнопок "Старіші"/"Новіші" під історією
+@handlers.callback_query_handler(func=lambda call: call.data.startswith("history:"))
+@timed("handle_history_page")
+async def handle_history_page(call):
+    chat_id = call.message.chat.id
+    _, direction, row_id = call.data.split(":")
+    if direction == "older":
+        history, has_older, has_newer, _ = await blocking(get_history_page, chat_id, HISTORY_PAGE_SIZE, before_id=int(row_id))
     else:
-        bot.reply_to(message, "Історія конвертацій порожня.")
+        history, has_older, has_newer, _ = await blocking(get_history_page, chat_id, HISTORY_PAGE_SIZE, after_id=int(row_id))
+    if not history:
+        await telegram.answer_callback_query(call.id, "Більше записів немає.")
+        return
+    markup = create_history_keyboard(*history_page_bounds(history, has_older, has_newer))
+    await telegram.edit_message_text(render_history_text(history), chat_id, call.message.message_id,
+                                     parse_mode="Markdown", reply_markup=markup)
+    await telegram.answer_callback_query(call.id)
+
+# Обробник команди /trend (динаміка курсу пари за період)
+@router.command("trend")
+@timed("show_trend")
+async def show_trend(message):
+    args = parse_trend_args(message.text)
+    if args is None:
+        reply(message, "Формат: /trend USD UAH 30d (період: h, d, w, m або y).")
+        return
+    from_currency, to_currency, seconds, range_label = args
+    source = (await get_session(message.chat.id)).source
+    trend = rate_history.trend(source, from_currency, to_currency, seconds)
+    if trend is None:
+        reply(message, f"Немає історії курсу {from_currency}/{to_currency} за {range_label}.")
+        return
+    reply(message, render_trend_text(from_currency, to_currency, range_label, source, trend),
+          parse_mode="Markdown")
+
+# Обробник команди /alert (сповіщення про курс)
+@router.command("alert")
+@timed("manage_alerts")
+async def manage_alerts(message):
+    chat_id = message.chat.id
+    args = parse_alert_args(message.text)
+    if args is None:
+        reply(message, "Формат: /alert USD UAH > 42.5 (або < 40), /alert del <номер>, /alert clear.")
+        return
+    action = args[0]
+    if action == 'list':
+        reply(message, render_alert_list(alerts.chat_alerts(chat_id), {source: get_source_name(source) for source in SOURCES}))
+        return
+    if action == 'delete':
+        removed = await blocking(alerts.remove, chat_id, args[1])
+        reply(message, "Сповіщення видалено." if removed else "Сповіщення з таким номером немає.")
+        return
+    if action == 'clear':
+        removed = await blocking(alerts.clear, chat_id)
+        reply(message, f"Видалено сповіщень: {removed}")
+        return
+
+    _, from_currency, to_currency, direction, threshold = args
+    source = (await get_session(chat_id)).source
+    rate_index = get_rate_index(source)
+    if not rate_index:
+        reply(message, "Не вдалося отримати курси валют.")
+        return
+    quote = rate_index.get((from_currency, to_currency))
+    if quote is None:
+        reply(message, f"Не вдалося отримати курс {from_currency}/{to_currency} ({get_source_name(source)}).")
+    elif is_triggered(direction, threshold, quote.rate):
+        reply(message, f"Курс {from_currency}/{to_currency} уже {quote.rate:.4f} - "
+                       "сповіщення спрацювало б одразу.")
+    else:
+        alert = await blocking(alerts.add, chat_id, source, from_currency, to_currency, direction, threshold)
+        if alert is None:
+            reply(message, f"Можна мати не більше {ALERTS_PER_CHAT} сповіщень.")
+        else:
+            reply(message, f"Сповіщення {alert.id}: {from_currency}/{to_currency} "
+                           f"{ALERT_DIRECTION_TEXT[direction]} {threshold:.4f} ({get_source_name(source)}). "
+                           f"Поточний курс: {quote.rate:.4f}.")
+
+# Обробник команди /bulk (пакетна конвертація списку або CSV-файлу)
+@router.command("bulk")
+@timed("start_bulk")
+async def start_bulk(message):
+    target, body = parse_bulk_command(message.text)
+    if body:  # Пакет надіслано в тому ж повідомленні, що й команду
+        await run_bulk(message, body, target)
+        return
+    session = await get_session(message.chat.id)
+    session.clear_conversion()
+    session.to_currency = target  # Цільова валюта чекає на пакет разом зі станом
+    session.state = 'awaiting_bulk'
+    reply(message, BULK_HELP_TEXT.format(target=target), parse_mode="Markdown", reply_markup=REMOVE_KEYBOARD)
+
+@router.state('awaiting_bulk')
+@timed("process_bulk_text")
+async def process_bulk_text(message):
+    await run_bulk(message, message.text, (await get_session(message.chat.id)).to_currency)
+
+# CSV-файл для /bulk (документи не проходять через router: він маршрутизує лише текст)
+@handlers.message_handler(content_types=['document'])
+@timed("process_bulk_document")
+async def process_bulk_document(message):
+    chat_id = message.chat.id
+    if sessions.current_state(chat_id) != 'awaiting_bulk':
+        reply(message, "Щоб сконвертувати CSV-файл, спочатку надішліть /bulk.")
+        return
+    document = message.document
+    if document.file_size and document.file_size > BULK_MAX_FILE_SIZE:
+        reply(message, f"Файл завеликий (максимум {BULK_MAX_FILE_SIZE // 1024} КБ).")
+        return
+    file_info = await telegram.get_file(document.file_id)
+    data = await telegram.download_file(file_info.file_path)
+    await run_bulk(message, decode_document(data), (await get_session(chat_id)).to_currency)
+
+async def run_bulk(message, text, target):
+    """Конвертує пакет за одним знімком курсів, надсилає CSV з результатами і пише пакет в історію."""
+    chat_id = message.chat.id
+    session = await get_session(chat_id)
+    session.clear_conversion()
+    rows = parse_rows(text, target)
+    if not rows:
+        reply(message, "Не знайдено жодного рядка для конвертації.")
+        return
+    if len(rows) > BULK_MAX_ROWS:
+        reply(message, f"Забагато рядків: {len(rows)} (максимум {BULK_MAX_ROWS}).")
+        return
+    rate_index = get_rate_index(session.source)  # Один знімок курсів на весь пакет
+    if not rate_index:
+        reply(message, "Не вдалося отримати курси валют.")
+        return
+    results = convert_rows(rows, rate_index)
+    add_conversions(chat_id, [(row.amount, row.from_currency, row.to_currency, row.converted)
+                              for row in results if row.converted is not None])
+    document = telebot.types.InputFile(io.BytesIO(render_results_csv(results)), file_name="conversion.csv")
+    reply(message, document, method="send_document",
+          caption=render_bulk_summary(results, target, get_source_name(session.source)))
 
 # Обробник inline-запитів
-@bot.inline_handler(lambda query: True)
-def inline_converter(inline_query):
+@handlers.inline_handler(lambda query: True)
+@timed("inline_converter")
+async def inline_converter(inline_query):
     """
     Обробляє inline-запити
     """
     try:
-        parts = inline_query.query.split()
-        if len(parts) >= 4 and parts[2].lower() == "to":
-            amount = float(parts[0])
-            from_currency = parts[1].upper()
-            to_currency = parts[3].upper()
-
-            if from_currency not in ["USD", "EUR", "UAH", "GBP", "PLN"] or to_currency not in ["USD", "EUR", "UAH", "GBP", "PLN"]:
-                raise ValueError("Invalid currency")
-
-            rates = get_rates("monobank")  # Тільки Monobank для inline
-            if rates:
-                rate = None
-                for r in rates:
-                    if get_currency_name(r.get('currencyCodeA')) == from_currency and \
-                       get_currency_name(r.get('currencyCodeB')) == to_currency:
-                        rate = r
-                        break
-                    if get_currency_name(r.get('currencyCodeB')) == from_currency and \
-                       get_currency_name(r.get('currencyCodeA')) == to_currency:
-                        rate = r
-                        break
-
-                if rate:
-                    if rate.get('rateBuy') is not None and rate.get('rateSell') is not None:
-                        if from_currency == 'UAH':
-                            converted_amount = amount / rate.get('rateSell')
-                        else:
-                            converted_amount = amount * rate.get('rateBuy')
-                    elif rate.get('rateCross') is not None:
-                        converted_amount = amount * rate.get('rateCross')
-                    else:
-                        raise ValueError("Currency rate not found")
-
-                    result = "{:.2f}".format(converted_amount)
-                    rate_text = ""
-                    if rate.get('rateBuy') and rate.get('rateSell'):
-                       if from_currency == "UAH":
-                         rate_text = f"Курс: 1 {to_currency} = {rate.get('rateSell'):.4f} {from_currency}"
-                       else:
-                          rate_text = f"Курс: 1 {from_currency} = {rate.get('rateBuy'):.4f} {to_currency}"
-                    elif rate.get('rateCross'):
-                       rate_text = f"Курс: 1 {from_currency} = {rate.get('rateCross'):.4f} {to_currency}"
-
-                    r = types.InlineQueryResultArticle(
-                        '1',
-                        f'Convert {amount} {from_currency} to {to_currency}',
-                        types.InputTextMessageContent(f"{amount} {from_currency} = {result} {to_currency}\n{rate_text}")
-                    )
-                    bot.answer_inline_query(inline_query.id, [r])
-
-                else:
-                  raise ValueError("Currency rate not found")
-            else:
-              raise ValueError("Could not retrieve currency rates")
+        entries, _ = get_rates_entries()  # Усі банки паралельно, не довше COMPARE_DEADLINE
+        if not entries:
+            raise ValueError("Could not retrieve currency rates")
 
-        else:
+        results = inline_answers.get(inline_query.query, entries)  # Готові результати з кешу (inline.py)
+        if not results:
             return
+        # Результати однакові для всіх користувачів, тому Telegram може кешувати їх сам
+        await telegram.answer_inline_query(inline_query.id, results, cache_time=INLINE_CACHE_TIME, is_personal=False)
 
     except ValueError as e:
         print(f"Inline query error: {e}")
@@ -482,6 +564,51 @@ def inline_converter(inline_query):
         print(f"Inline query error: {e}")
         return
 
+def run():
+    """Запускає бота в режимі, заданому BOT_RUNTIME і BOT_MODE."""
+    # Платформа зупиняє процес сигналом SIGTERM: перетворюємо його на звичайний вихід,
+    # щоб спрацювали atexit-обробники (db.close зберігає чергу конвертацій)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    init_db()  # Таблиці створюються тут, а не при імпорті db.py (помилки бази - одразу при старті)
+
+    # Показники стану для метрик (metrics.py; без METRICS_* змінних нічого не збирається)
+    register_gauge("bot_sessions", lambda: sessions.stats()['sessions'])
+    register_gauge("bot_sessions_in_flow", lambda: sessions.stats()['in_flow'])
+    register_gauge("bot_expired_flows", lambda: sessions.stats()['expired_flows'])
+    register_gauge("sqlite_write_queue_rows", lambda: get_writer_stats()['queue_depth'])
+    register_gauge("bot_alerts", lambda: len(alerts))
+    register_gauge("send_queue_depth", lambda: len(outbox))
+    register_gauge("send_queue_interactive_p99_seconds", lambda: outbox.stats()['interactive_p99'])
+    register_gauge("send_queue_background_p99_seconds", lambda: outbox.stats()['background_p99'])
+    start_metrics()
+
+    add_refresh_listener(warm_rates_messages)  # Таблиця /rates рендериться одразу після оновлення курсів
+    add_refresh_listener(inline_answers.invalidate)  # Старі inline-відповіді більше не потрібні
+    rate_history.load()  # Історія курсів зберігається в базі між перезапусками
+    add_refresh_listener(rate_history.record)  # Кожне оновлення курсів дописується в історію
+    alerts.load()
+    add_refresh_listener(alerts.check)  # Після оновлення курсів перевіряємо пороги сповіщень
+    load_snapshots()  # Відновлюємо курси з останнього знімка, щоб не чекати на API після перезапуску
+
+    if os.getenv("BOT_RUNTIME", "threads") == "async":
+        # Режим asyncio: ті самі корутини-обробники на AsyncTeleBot, курси оновлює задача asyncio (async_bot.py)
+        import asyncio
+        import async_bot
+        asyncio.run(async_bot.run(sys.modules[__name__]))
+    else:
+        handlers.register(bot, sync_handler)  # Корутини-обробники виконуються в потоках TeleBot
+        start_prefetcher()  # Курси оновлюються у фоні, обробники читають їх з пам'яті
+        if BOT_MODE == "webhook":
+            # Оновлення приходять POST-запитами на вбудований HTTP-сервер (webhook.py)
+            from webhook import run_webhook
+            logging.info("Бот запущено (webhook)...")
+            run_webhook(bot)
+        else:
+            logging.info("Бот запущено...")
+            bot.remove_webhook()  # getUpdates не працює, поки встановлено webhook
+            bot.infinity_polling()
+
+
 # Запуск бота
-logging.info("Бот запущено...")
-bot.infinity_polling()
\ No newline at end of file
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,208 @@
+# metrics.py
+# Метрики бота: лічильники, гістограми затримок і показники стану (gauges).
+# Вмикаються змінними оточення:
+#   METRICS_PORT=9108         - HTTP-ендпоінт /metrics у форматі Prometheus
+#   METRICS_LOG_INTERVAL=60   - періодичний запис метрик у журнал одним JSON-рядком
+# Якщо жодна не задана, усі функції модуля одразу повертаються, а декоратор
+# timed() повертає функцію без обгортки, тож вимкнені метрики нічого не коштують.
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # 0 - без HTTP-ендпоінта
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", 0))  # 0 - без запису в журнал
+ENABLED = bool(METRICS_PORT or METRICS_LOG_INTERVAL or os.getenv("METRICS_ENABLED") == "1")
+
+# Межі кошиків гістограм (секунди): від 1 мс до 10 с
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> значення
+_histograms = {}  # (name, labels) -> [лічильники кошиків..., +Inf], сума, кількість, максимум
+_gauges = {}  # name -> функція без аргументів, що повертає поточне значення
+_started = False
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Збільшує лічильник name з мітками labels."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Додає вимір тривалості (секунди) до гістограми name."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0, 0.0]
+        buckets = histogram[0]
+        for position, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                buckets[position] += 1
+                break
+        else:
+            buckets[-1] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+        histogram[3] = max(histogram[3], seconds)
+
+
+def register_gauge(name, func):
+    """Реєструє показник стану: func() викликається під час кожного збору метрик."""
+    if ENABLED:
+        _gauges[name] = func
+
+
+def timed(name, histogram="bot_handler_seconds"):
+    """
+    Декоратор: вимірює тривалість виклику функції (або корутини) і рахує винятки.
+
+    Args:
+        name: Значення мітки handler.
+        histogram: Назва гістограми.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    inc("bot_handler_errors_total", handler=name)
+                    raise
+                finally:
+                    observe(histogram, time.perf_counter() - started, handler=name)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                inc("bot_handler_errors_total", handler=name)
+                raise
+            finally:
+                observe(histogram, time.perf_counter() - started, handler=name)
+        return wrapper
+    return decorator
+
+
+def _read_gauges():
+    values = {}
+    for name, func in list(_gauges.items()):
+        try:
+            values[name] = func()
+        except Exception as e:  # Показник не повинен зривати збір решти метрик
+            logger.debug("Не вдалося прочитати показник %s: %s", name, e)
+    return values
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in pairs) + "}"
+
+
+def render_prometheus():
+    """Повертає всі метрики у текстовому форматі Prometheus."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(value[0]), value[1], value[2]) for key, value in _histograms.items()}
+    lines = []
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + ("+Inf",), buckets):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    for name, value in sorted(_read_gauges().items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """Повертає метрики у вигляді словника (для журналу та тестів)."""
+    with _lock:
+        counters = {_flat_name(key): value for key, value in _counters.items()}
+        histograms = {_flat_name(key): {'count': value[2], 'avg_ms': value[1] / value[2] * 1000 if value[2] else 0.0,
+                                        'max_ms': value[3] * 1000}
+                      for key, value in _histograms.items()}
+    return {'counters': counters, 'histograms': histograms, 'gauges': _read_gauges()}
+
+
+def _flat_name(key):
+    name, labels = key
+    return name + _format_labels(labels).replace('"', "")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _log_loop():
+    while True:
+        time.sleep(METRICS_LOG_INTERVAL)
+        logger.info("metrics %s", json.dumps(snapshot(), ensure_ascii=False, sort_keys=True))
+
+
+def start():
+    """Запускає HTTP-ендпоінт і/або періодичний запис у журнал (якщо метрики ввімкнені)."""
+    global _started
+    if not ENABLED or _started:
+        return
+    _started = True
+    if METRICS_PORT:
+        server = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), _MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Метрики доступні на http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+    if METRICS_LOG_INTERVAL:
+        threading.Thread(target=_log_loop, name="metrics-log", daemon=True).start()
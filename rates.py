@@ -0,0 +1,114 @@
+# rates.py
+from collections import namedtuple
+from types import MappingProxyType
+
+# Котирування для пари (from, to):
+#   rate       - множник: сума_в_to = сума_в_from * rate
+#   shown_rate - курс у тому вигляді, як його публікує банк (для відображення)
+#   inverted   - True, якщо shown_rate означає "1 to = shown_rate from"
+#   via        - валюта-посередник для крос-курсу (None, якщо банк публікує пару напряму)
+Quote = namedtuple("Quote", ["rate", "shown_rate", "inverted", "via"], defaults=[None])
+
+EMPTY_INDEX = MappingProxyType({})
+
+# Курс пари в одному банку для режиму порівняння (див. compare_quotes):
+#   buy  - скільки to дає банк за 1 from (курс конвертації from -> to)
+#   sell - скільки to треба заплатити банку за 1 from (зворотна конвертація), або None
+#   quote - котирування from -> to з індексу банку
+Offer = namedtuple("Offer", ["source", "buy", "sell", "quote"])
+
+# Результат порівняння банків: offers - пропозиції за спаданням курсу buy,
+# best_buy/best_sell - джерела з найвигіднішою купівлею/продажем,
+# missing - банки, які не відповіли вчасно або не мають курсу для пари
+Comparison = namedtuple("Comparison", ["offers", "best_buy", "best_sell", "missing"])
+
+
+def _add_pair(index, currency_a, currency_b, buy, sell, cross=None):
+    """Додає в індекс обидва напрямки для пари currency_a/currency_b."""
+    if buy and sell:
+        index[(currency_a, currency_b)] = Quote(buy, buy, False)
+        index[(currency_b, currency_a)] = Quote(1 / sell, sell, True)
+    elif cross:
+        index[(currency_a, currency_b)] = Quote(cross, cross, False)
+        index[(currency_b, currency_a)] = Quote(1 / cross, cross, True)
+
+
+def build_rate_index(pairs):
+    """Будує незмінний індекс (from, to) -> Quote з розібраної відповіді API банку.
+
+    Індекс будується один раз після кожного запиту до API, тож обробники
+    отримують курс за один пошук у словнику замість перебору всього списку.
+    Пари, яких банк не публікує, розраховуються через валюту-посередника.
+
+    Args:
+        pairs: Кортежі (currency_a, currency_b, buy, sell, cross), як їх повертає
+            адаптер банку (api.RateSource.pairs).
+
+    Returns:
+        MappingProxyType з котируваннями для обох напрямків кожної пари
+        та крос-курсами між усіма валютами, що мають спільного посередника.
+    """
+    index = {}
+    for currency_a, currency_b, buy, sell, cross in pairs:
+        _add_pair(index, currency_a, currency_b, buy, sell, cross)
+    _add_cross_rates(index)
+    return MappingProxyType(index)
+
+
+def _add_cross_rates(index):
+    """Доповнює індекс крос-курсами для пар, яких банк не публікує напряму.
+
+    Для кожної такої пари перебираються всі валюти-посередники (зазвичай UAH)
+    і береться найвигідніший для користувача шлях.  Прямі курси банку завжди
+    мають пріоритет над розрахованими.
+    """
+    neighbours = {}
+    for (currency_from, currency_to), quote in index.items():
+        neighbours.setdefault(currency_from, {})[currency_to] = quote.rate
+
+    cross = {}
+    for currency_from, first_leg in neighbours.items():
+        for pivot, first_rate in first_leg.items():
+            for currency_to, second_rate in neighbours.get(pivot, {}).items():
+                if currency_to == currency_from or (currency_from, currency_to) in index:
+                    continue
+                rate = first_rate * second_rate
+                best = cross.get((currency_from, currency_to))
+                if best is None or rate > best.rate:
+                    cross[(currency_from, currency_to)] = Quote(rate, rate, False, pivot)
+    index.update(cross)
+
+
+def get_index_currencies(index):
+    """Повертає множину всіх валют, для яких в індексі є хоча б один курс."""
+    return frozenset(currency for pair in index for currency in pair)
+
+
+def compare_quotes(indexes, from_currency, to_currency, missing=()):
+    """Порівнює курс пари from/to у кількох банках.
+
+    Обидва курси приводяться до вигляду "1 from = X to", тож найкраща купівля -
+    найбільший buy (за from дають найбільше), а найкращий продаж - найменший
+    sell (from коштує найдешевше).
+
+    Args:
+        indexes: Словник source -> індекс пар банку.
+        missing: Банки, які вже відомо що не відповіли (додаються до Comparison.missing).
+
+    Returns:
+        Comparison; offers порожній, якщо жоден банк не має курсу для пари.
+    """
+    offers = []
+    missing = list(missing)
+    for source, index in indexes.items():
+        quote = index.get((from_currency, to_currency))
+        if quote is None:
+            missing.append(source)
+            continue
+        back = index.get((to_currency, from_currency))
+        offers.append(Offer(source, quote.rate, 1 / back.rate if back else None, quote))
+    offers.sort(key=lambda offer: -offer.buy)
+    best_buy = offers[0].source if offers else None
+    sells = [offer for offer in offers if offer.sell is not None]
+    best_sell = min(sells, key=lambda offer: offer.sell).source if sells else None
+    return Comparison(tuple(offers), best_buy, best_sell, tuple(missing))
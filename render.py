@@ -0,0 +1,238 @@
+# render.py
+import time
+
+HELP_TEXT = """
+Я можу допомогти тобі конвертувати валюти за курсом Monobank або ПриватБанку.
+
+Доступні команди:
+/start - Почати роботу з ботом (показує головне меню).
+/help - Показати це повідомлення.
+/convert - Конвертувати валюту.
+/rates - Показати курси валют.
+/history - Показати історію конвертацій.
+/source - Змінити джерело курсів валют (Monobank/Privatbank).
+/trend - Динаміка курсу, наприклад `/trend USD UAH 30d` (h, d, w, m, y).
+/alert - Сповіщення про курс, наприклад `/alert USD UAH > 42.5` (список - `/alert`, видалити - `/alert del 1`).
+/bulk - Пакетна конвертація списку сум або CSV-файлу, наприклад `/bulk UAH`.
+
+Ви також можете використовувати мене в inline-режимі. Введіть в будь-якому чаті:
+`@Converter_tutorial1_bot <сума> <валюта> to <валюта>`
+Наприклад: `@Converter_tutorial1_bot 100 USD to UAH`
+Або лише `@Converter_tutorial1_bot 100 USD` - покажу суму в кількох валютах.
+    """
+
+
+MAX_MESSAGE_LENGTH = 4096  # Обмеження Telegram на довжину одного повідомлення
+
+# Готові повідомлення /rates: source -> (generation, tuple повідомлень).
+# Таблиця перебудовується лише тоді, коли в кеші api з'являються нові курси.
+_rates_messages_cache = {}
+
+
+def _rates_rows(pairs):
+    """Повертає рядки таблиці курсів для пар, де банк дає і купівлю, і продаж."""
+    return [f"{currency_a}/{currency_b}    | {buy:8.4f} | {sell:8.4f}\n"
+            for currency_a, currency_b, buy, sell, _ in pairs if buy and sell]
+
+
+def render_rates_messages(pairs, source, max_length=MAX_MESSAGE_LENGTH):
+    """Формує Markdown-таблицю курсів для команди /rates, розбиту на повідомлення.
+
+    Кожне повідомлення - окремий блок коду з заголовком колонок, не довший
+    за max_length символів.
+
+    Args:
+        pairs: Розібрані курси банку (api.RateSource.pairs, ключ 'pairs' запису кешу).
+        source: Джерело даних ('monobank', 'privatbank', ...).
+        max_length: Максимальна довжина одного повідомлення.
+
+    Returns:
+        Кортеж текстів повідомлень.
+    """
+    rows = _rates_rows(pairs)
+    title = f"*Курси валют {source}:*\n"  # Markdown (жирний і моноширинний)
+    table_header = "```\nВалюта | Купівля | Продаж\n------- | -------- | --------\n"
+    footer = "```"
+
+    messages = []
+    current = title + table_header
+    has_rows = False
+    for row in rows:
+        if has_rows and len(current) + len(row) + len(footer) > max_length:
+            messages.append(current + footer)
+            current = table_header
+            has_rows = False
+        current += row
+        has_rows = True
+    messages.append(current + footer)
+    return tuple(messages)
+
+
+def render_rates_text(pairs, source):
+    """Формує Markdown-таблицю курсів для команди /rates одним текстом."""
+    return render_rates_messages(pairs, source, max_length=float("inf"))[0]
+
+
+def get_rates_messages(entry, source):
+    """Повертає готові повідомлення /rates для запису кешу курсів (див. api.get_rates_entry).
+
+    Таблиця рендериться один раз на покоління кешу; наступні виклики
+    повертають той самий кортеж рядків.
+    """
+    generation = entry['generation']
+    cached = _rates_messages_cache.get(source)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    messages = render_rates_messages(entry['pairs'], source)
+    if messages is not None:
+        _rates_messages_cache[source] = (generation, messages)
+    return messages
+
+
+def warm_rates_messages(source, entry):
+    """Слухач оновлення кешу (api.add_refresh_listener): рендерить /rates одразу після оновлення."""
+    get_rates_messages(entry, source)
+
+
+def render_history_text(history):
+    """Формує Markdown-таблицю історії конвертацій для команди /history."""
+    response_text = "*Історія конвертацій:*\n```\n"  # Markdown (жирний і моноширинний шрифт)
+    response_text += "Сума | Звідки | Куди | Результат | Час\n"
+    response_text += "------|-------|------|-----------|-----\n"
+    for row in history:
+        amount, from_currency, to_currency, converted_amount, timestamp = row[:5]
+        response_text += f"{amount:5.2f} | {from_currency:5} | {to_currency:4} | {converted_amount:9.2f} | {timestamp}\n"
+    response_text += "```"
+    return response_text
+
+
+def history_page_bounds(history, has_older, has_newer, older_bound=None):
+    """
+    Повертає id для кнопок "старіші"/"новіші" сторінки історії (None - кнопки немає).
+
+    older_bound - межа з get_history_page для сторінки без збережених записів.
+    """
+    saved_ids = [row[5] for row in history if row[5] is not None]  # Незбережені записи мають id None
+    older_id = saved_ids[-1] if saved_ids else older_bound
+    older_id = older_id if has_older else None
+    newer_id = saved_ids[0] if has_newer and saved_ids else None
+    return older_id, newer_id
+
+
+def render_inline_text(amount, from_currency, to_currency, quote, source_name=None):
+    """Формує текст відповіді на inline-запит для котирування quote (source_name - назва банку)."""
+    result = "{:.2f}".format(amount * quote.rate)
+    if quote.inverted:
+        rate_text = f"Курс: 1 {to_currency} = {quote.shown_rate:.4f} {from_currency}"
+    else:
+        rate_text = f"Курс: 1 {from_currency} = {quote.shown_rate:.4f} {to_currency}"
+    if quote.via:
+        rate_text += f" (через {quote.via})"
+    if source_name:
+        rate_text += f", {source_name}"
+    return f"{amount} {from_currency} = {result} {to_currency}\n{rate_text}"
+
+
+def render_compare_text(amount, from_currency, to_currency, comparison, source_names):
+    """Порівняння банків для конвертації (comparison - rates.Comparison).
+
+    Args:
+        source_names: Словник source -> назва банку для повідомлення.
+    """
+    if not comparison.offers:
+        return f"Жоден банк не дав курс {from_currency}/{to_currency}."
+    lines = [f"Порівняння банків: {amount:.2f} {from_currency} -> {to_currency}"]
+    for offer in comparison.offers:
+        name = source_names.get(offer.source, offer.source)
+        best = " ⭐" if offer.source == comparison.best_buy and len(comparison.offers) > 1 else ""
+        lines.append(f"\n{name}: {amount * offer.buy:.2f} {to_currency}{best}")
+        digits = 4 if offer.buy >= 1 else 6  # Для зворотних пар (UAH/USD) потрібно більше знаків
+        rate_text = f"купівля {offer.buy:.{digits}f}"
+        if offer.sell is not None:
+            best_sell = " ⭐" if offer.source == comparison.best_sell and len(comparison.offers) > 1 else ""
+            rate_text += f" / продаж {offer.sell:.{digits}f}{best_sell}"
+        rate_text += f" {to_currency} за 1 {from_currency}"
+        if offer.quote.via:
+            rate_text += f" (через {offer.quote.via})"
+        lines.append(rate_text)
+    if comparison.missing:
+        lines.append("\nБез курсу: " + ", ".join(source_names.get(source, source) for source in comparison.missing))
+    lines.append("⭐ - найвигідніший курс")
+    return "\n".join(lines)
+
+
+SPARKLINE_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def render_sparkline(values, width=24):
+    """Малює ряд значень одним рядком символів ▁..█ (не довшим за width)."""
+    if not values:
+        return ""
+    if len(values) > width:
+        # Стискаємо ряд до width символів: кожен символ - середнє свого відрізка
+        step = len(values) / width
+        values = [sum(chunk) / len(chunk) for chunk in
+                  (values[int(i * step):max(int((i + 1) * step), int(i * step) + 1)] for i in range(width))]
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARKLINE_CHARS[len(SPARKLINE_CHARS) // 2] * len(values)
+    scale = (len(SPARKLINE_CHARS) - 1) / (high - low)
+    return "".join(SPARKLINE_CHARS[round((value - low) * scale)] for value in values)
+
+
+def render_trend_text(from_currency, to_currency, range_label, source, trend, width=24):
+    """Формує Markdown-відповідь на /trend для результату timeseries.RateHistory.trend."""
+    change = trend.last - trend.first
+    change_percent = change / trend.first * 100 if trend.first else 0.0
+    start = time.strftime('%Y-%m-%d %H:%M', time.gmtime(trend.start))
+    end = time.strftime('%Y-%m-%d %H:%M', time.gmtime(trend.end))
+    digits = 4 if trend.high >= 1 else 6  # Для зворотних пар (UAH/USD) потрібно більше знаків
+    return (f"*{from_currency}/{to_currency}* за {range_label} ({source})\n"
+            f"`{render_sparkline(trend.points, width)}`\n"
+            f"```\n"
+            f"Мін:      {trend.low:12.{digits}f}\n"
+            f"Макс:     {trend.high:12.{digits}f}\n"
+            f"Середнє:  {trend.mean:12.{digits}f}\n"
+            f"Зміна:    {change:+12.{digits}f} ({change_percent:+.2f}%)\n"
+            f"```\n"
+            f"{start} - {end} UTC, точок: {len(trend.points)}")
+
+
+ALERT_DIRECTION_TEXT = {'above': "вище", 'below': "нижче"}
+
+
+def render_alert_text(alert, rate, source_name):
+    """Текст сповіщення, що спрацювало (alert - alerts.Alert, source_name - назва банку)."""
+    return (f"🔔 {alert.from_currency}/{alert.to_currency}: курс {rate:.4f} "
+            f"{ALERT_DIRECTION_TEXT[alert.direction]} за поріг {alert.threshold:.4f} ({source_name})")
+
+
+def render_alert_list(alerts, source_names):
+    """Список активних сповіщень чату для /alert (source_names - словник source -> назва банку)."""
+    if not alerts:
+        return "Активних сповіщень немає.\nДодати: /alert USD UAH > 42.5"
+    lines = ["Активні сповіщення:"]
+    for alert in alerts:
+        lines.append(f"{alert.id}. {alert.from_currency}/{alert.to_currency} "
+                     f"{ALERT_DIRECTION_TEXT[alert.direction]} {alert.threshold:.4f} "
+                     f"({source_names.get(alert.source, alert.source)})")
+    lines.append("Видалити: /alert del <номер>")
+    return "\n".join(lines)
+
+
+BULK_HELP_TEXT = ("Надішліть список сум, по одній на рядок (наприклад `100 USD` або `250,5;EUR;PLN`), "
+                  "або CSV-файл з колонками сума, валюта і, необов'язково, цільова валюта.\n"
+                  "Цільова валюта за замовчуванням: {target}.")
+
+
+def render_bulk_summary(results, target, source_name):
+    """Підсумок пакетної конвертації (підпис до CSV-файлу з результатами)."""
+    converted = [row for row in results if row.converted is not None]
+    lines = [f"Рядків: {len(results)}, сконвертовано: {len(converted)}, помилок: {len(results) - len(converted)}."]
+    totals = {}
+    for row in converted:
+        totals[row.to_currency] = totals.get(row.to_currency, 0.0) + row.converted
+    for currency, total in sorted(totals.items(), key=lambda item: item[0] != target)[:10]:  # Підпис - до 1024 символів
+        lines.append(f"Разом: {total:.2f} {currency}")
+    lines.append(f"Курси: {source_name}, один знімок на весь пакет.")
+    return "\n".join(lines)
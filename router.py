@@ -0,0 +1,72 @@
+# router.py
+# Маршрутизація текстових повідомлень через таблиці замість ланцюжка фільтрів
+# telebot і register_next_step_handler.  Команда або кнопка меню знаходиться
+# одним пошуком у словнику; інакше повідомлення йде обробнику кроку діалогу,
+# на якому зараз знаходиться чат (стан зберігається в сесії, див. sessions.py).
+
+
+def command_name(text):
+    """'/convert@my_bot 100' -> 'convert' (так само, як telebot.util.extract_command)."""
+    return text.split(maxsplit=1)[0].split("@", 1)[0][1:]
+
+
+class Router:
+    """
+    Таблиці маршрутів: команда -> обробник, текст кнопки -> обробник,
+    стан сесії -> обробник кроку.
+
+    Команди й кнопки мають пріоритет і перервуть незавершений діалог;
+    решта повідомлень потрапляє до обробника поточного кроку.  Обробники
+    можуть бути як звичайними функціями, так і корутинами - Router лише
+    знаходить потрібний, а викликає його код бота.
+
+    Args:
+        sessions: Сховище сесій (SessionStore), де зберігається стан діалогу.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.commands = {}
+        self.buttons = {}
+        self.states = {}
+
+    def command(self, *names):
+        """Декоратор: реєструє обробник для команд names (без '/')."""
+        def decorator(handler):
+            for name in names:
+                self.commands[name] = handler
+            return handler
+        return decorator
+
+    def button(self, *texts):
+        """Декоратор: реєструє обробник для кнопок меню з текстом texts."""
+        def decorator(handler):
+            for text in texts:
+                self.buttons[text] = handler
+            return handler
+        return decorator
+
+    def state(self, *states):
+        """Декоратор: реєструє обробник кроку діалогу для станів states."""
+        def decorator(handler):
+            for state in states:
+                self.states[state] = handler
+            return handler
+        return decorator
+
+    def resolve(self, message):
+        """Повертає обробник для повідомлення або None, якщо повідомлення ніхто не чекає."""
+        text = message.text
+        if not text:
+            return None
+        if text[0] == "/":
+            handler = self.commands.get(command_name(text))
+        else:
+            handler = self.buttons.get(text)
+        if handler is not None:
+            self.sessions.reset_state(message.chat.id)  # Команда чи кнопка меню перериває діалог
+            return handler
+        state = self.sessions.current_state(message.chat.id)
+        if state is None:
+            return None
+        return self.states.get(state)
@@ -0,0 +1,100 @@
+# runtime.py
+# Обробники main.py - корутини, спільні для обох режимів роботи бота.
+# У режимі asyncio (async_bot.py) їх виконує цикл подій AsyncTeleBot: запити до
+# Telegram обробник чекає через await, а звернення до SQLite (сесії, історія,
+# сповіщення) йдуть у пул потоків через asyncio.to_thread.
+# У режимі потоків (TeleBot, webhook.py) ті самі корутини виконуються синхронно
+# в потоці обробника: SyncTelegram і run_inline нічого не чекають, тож корутина
+# завершується за один крок без циклу подій.
+
+
+class SyncTelegram:
+    """
+    Асинхронний фасад TeleBot для режиму потоків: await telegram.answer_callback_query(...)
+    виконує звичайний синхронний запит у потоці обробника.
+    """
+
+    def __init__(self, bot):
+        self._bot = bot
+
+    def __getattr__(self, name):
+        method = getattr(self._bot, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+async def run_inline(func, *args, **kwargs):
+    """Аналог asyncio.to_thread для режиму потоків: обробник і так виконується в окремому потоці."""
+    return func(*args, **kwargs)
+
+
+def run_sync(coro):
+    """
+    Виконує корутину обробника в поточному потоці (режим потоків).
+
+    Raises:
+        RuntimeError: Якщо корутина чекає на цикл подій (у режимі потоків його немає).
+    """
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("Обробник чекає на цикл подій, а бот працює в режимі потоків")
+
+
+def sync_handler(handler):
+    """Обгортає корутину-обробник у функцію для TeleBot."""
+    def wrapper(update):
+        return run_sync(handler(update))
+    return wrapper
+
+
+class Handlers:
+    """
+    Обробники оновлень з фільтрами telebot.  Декоратори повторюють
+    TeleBot.message_handler/callback_query_handler/inline_handler, але лише
+    запам'ятовують обробники: register() додає їх до TeleBot або AsyncTeleBot,
+    залежно від режиму, в якому запускається бот.
+    """
+
+    def __init__(self):
+        self.message_handlers = []  # (обробник, фільтри register_message_handler)
+        self.callback_query_handlers = []
+        self.inline_handlers = []
+
+    def message_handler(self, **filters):
+        def decorator(handler):
+            self.message_handlers.append((handler, filters))
+            return handler
+        return decorator
+
+    def callback_query_handler(self, func):
+        def decorator(handler):
+            self.callback_query_handlers.append((handler, {'func': func}))
+            return handler
+        return decorator
+
+    def inline_handler(self, func):
+        def decorator(handler):
+            self.inline_handlers.append((handler, {'func': func}))
+            return handler
+        return decorator
+
+    def register(self, bot, wrap=None):
+        """
+        Реєструє обробники на боті.
+
+        Args:
+            bot: TeleBot або AsyncTeleBot.
+            wrap: Обгортка для кожного обробника (sync_handler для TeleBot) або None.
+        """
+        wrap = wrap or (lambda handler: handler)
+        for handler, filters in self.message_handlers:
+            bot.register_message_handler(wrap(handler), **filters)
+        for handler, filters in self.callback_query_handlers:
+            bot.register_callback_query_handler(wrap(handler), **filters)
+        for handler, filters in self.inline_handlers:
+            bot.register_inline_handler(wrap(handler), **filters)
@@ -0,0 +1,335 @@
+# sender.py
+# Планувальник вихідних повідомлень.  Обробники не викликають Telegram напряму,
+# а ставлять відповідь у чергу; потоки-відправники надсилають повідомлення з
+# урахуванням лімітів Telegram: спільний token bucket на бота (~30 повідомлень
+# за секунду) і окремий bucket для кожного чату (~1 повідомлення за секунду).
+# Відповіді на дії користувача мають пріоритет над фоновими сповіщеннями,
+# кілька повідомлень, що чекають у черзі одного чату, надсилаються одним, а
+# відповідь 429 ставить на паузу лише цей чат замість блокування обробника.
+import atexit
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+from telebot import types
+
+import metrics
+from render import MAX_MESSAGE_LENGTH
+
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))  # Повідомлень на секунду для всього бота
+# Скільки повідомлень можна надіслати одразу після паузи.  1 - рівномірно, тож у будь-якій секунді
+# не більше SEND_GLOBAL_RATE повідомлень (більший сплеск Telegram може сприйняти як flood)
+SEND_GLOBAL_BURST = float(os.getenv("SEND_GLOBAL_BURST", 1))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))  # Повідомлень на секунду в один чат
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", 3))  # Короткий сплеск для одного чату (кілька відповідей поспіль)
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", 4))  # Потоки, що виконують запити до Telegram
+
+INTERACTIVE = 0  # Відповідь на повідомлення користувача
+BACKGROUND = 1  # Сповіщення та інші повідомлення, яких користувач не чекає зараз
+PRIORITY_NAMES = ("interactive", "background")
+
+COALESCE_SEPARATOR = "\n\n"
+_LATENCY_WINDOW = 1024  # Скільки останніх затримок черги враховувати в stats()
+_SWEEP_EVERY = 1024  # Як часто (у надісланих повідомленнях) прибирати неактивні чати
+
+
+class TokenBucket:
+    """Token bucket: rate токенів на секунду, не більше capacity; одне повідомлення - один токен."""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        """Скільки секунд чекати до наступного токена (0 - можна надсилати зараз)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Outgoing:
+    """
+    Повідомлення в черзі: method - метод TeleBot (send_message, send_document, ...),
+    text - його другий аргумент (текст або файл), kwargs - решта параметрів.
+    """
+    __slots__ = ('method', 'text', 'kwargs', 'enqueued_at', 'count')
+
+    def __init__(self, method, text, kwargs, enqueued_at, count=1):
+        self.method = method
+        self.text = text
+        self.kwargs = kwargs
+        self.enqueued_at = enqueued_at
+        self.count = count  # Скільки повідомлень об'єднано в це
+
+
+class _Chat:
+    """Черги і bucket одного чату."""
+    __slots__ = ('chat_id', 'queues', 'bucket', 'busy', 'paused_until', 'version')
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.queues = (deque(), deque())  # За пріоритетом: INTERACTIVE, BACKGROUND
+        self.bucket = bucket
+        self.busy = False  # Повідомлення цього чату зараз надсилається
+        self.paused_until = 0.0  # Пауза після відповіді 429
+        self.version = 0  # Записи в купах зі старою версією ігноруються
+
+    def head_priority(self):
+        for priority, pending in enumerate(self.queues):
+            if pending:
+                return priority
+        return None
+
+
+def _can_join(first, second):
+    """Чи можна надіслати second в одному повідомленні з first (first стоїть у черзі раніше)."""
+    if first.method != "send_message" or second.method != "send_message":
+        return False  # Об'єднуються лише текстові повідомлення
+    if 'reply_markup' in first.kwargs:
+        return False  # Клавіатура може бути лише в останнього повідомлення
+    if {key: value for key, value in first.kwargs.items() if key != 'reply_parameters'} != \
+            {key: value for key, value in second.kwargs.items() if key not in ('reply_markup', 'reply_parameters')}:
+        return False
+    return len(first.text) + len(COALESCE_SEPARATOR) + len(second.text) <= MAX_MESSAGE_LENGTH
+
+
+def _rewind(value):
+    """Перемотує файл (telebot InputFile) на початок, щоб повторний запит надіслав його повністю."""
+    stream = getattr(value, 'file', None)
+    if hasattr(stream, 'seek'):
+        stream.seek(0)
+
+
+class SendScheduler:
+    """
+    Черга вихідних повідомлень з token bucket на бота і на кожен чат.
+
+    Чати, що мають повідомлення і вільний токен, лежать у купі за пріоритетом
+    і часом постановки в чергу найстарішого повідомлення; чати, які чекають на
+    свій токен або паузу після 429, - в окремій купі за часом готовності.  Тож
+    вибір наступного повідомлення коштує O(log n) незалежно від кількості чатів.
+    Для одного чату одночасно виконується лише один запит, тому порядок
+    повідомлень у чаті зберігається.
+
+    Args:
+        send: Функція send(method, chat_id, text, **kwargs), яка викликає метод
+            TeleBot method (наприклад, send_message) з цими аргументами.
+        global_rate, global_burst: Ліміт бота (повідомлень на секунду і сплеск).
+        chat_rate, chat_burst: Ліміт одного чату.
+        workers: Кількість потоків-відправників.
+    """
+
+    def __init__(self, send, global_rate=SEND_GLOBAL_RATE, global_burst=SEND_GLOBAL_BURST,
+                 chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST, workers=SEND_WORKERS):
+        self._send = send
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._workers = workers
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._chats = {}  # chat_id -> _Chat
+        self._ready = []  # (priority, enqueued_at, seq, chat_id, version): можна надсилати зараз
+        self._delayed = []  # (ready_at, seq, chat_id, version): чекають на токен чату або паузу
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pending = 0
+        self._in_flight = 0
+        self._latencies = (deque(maxlen=_LATENCY_WINDOW), deque(maxlen=_LATENCY_WINDOW))
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    def __len__(self):
+        return self._pending
+
+    def put(self, chat_id, text, priority=INTERACTIVE, method="send_message", **kwargs):
+        """
+        Ставить повідомлення в чергу (не чекає на надсилання).
+
+        Для інших методів TeleBot text - їхній другий аргумент, наприклад
+        put(chat_id, document, method="send_document", caption=...).
+        """
+        now = time.monotonic()
+        with self._cond:
+            if not self._threads:
+                self._start()
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(chat_id, TokenBucket(self._chat_rate, self._chat_burst, now))
+            previous = chat.head_priority()
+            chat.queues[priority].append(_Outgoing(method, text, kwargs, now))
+            self._pending += 1
+            # Чат ще не в купі (або стоїть там з нижчим пріоритетом) - ставимо заново
+            if not chat.busy and (previous is None or priority < previous) and self._schedule(chat, now):
+                self._cond.notify()
+
+    def reply(self, message, text, priority=INTERACTIVE, method="send_message", **kwargs):
+        """Аналог bot.reply_to через чергу: відповідь на повідомлення message."""
+        kwargs.setdefault('reply_parameters',
+                          types.ReplyParameters(message.message_id, allow_sending_without_reply=True))
+        self.put(message.chat.id, text, priority, method, **kwargs)
+
+    def _start(self):
+        for number in range(self._workers):
+            thread = threading.Thread(target=self._loop, name=f"sender-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.flush)
+
+    def _schedule(self, chat, now):
+        """
+        Кладе чат з повідомленнями в потрібну купу (під self._cond).
+
+        Returns:
+            True, якщо відправників треба розбудити: чат готовий зараз або став
+            першим у черзі очікування.
+        """
+        chat.version += 1
+        ready_at = max(now + chat.bucket.wait_time(now), chat.paused_until)
+        if ready_at <= now:
+            priority = chat.head_priority()
+            enqueued_at = chat.queues[priority][0].enqueued_at
+            heapq.heappush(self._ready, (priority, enqueued_at, next(self._seq), chat.chat_id, chat.version))
+            return True
+        entry = (ready_at, next(self._seq), chat.chat_id, chat.version)
+        heapq.heappush(self._delayed, entry)
+        return self._delayed[0] is entry
+
+    def _take(self):
+        """Чекає, поки якийсь чат зможе надіслати повідомлення; повертає (chat, priority, batch)."""
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, chat_id, version = heapq.heappop(self._delayed)
+                chat = self._chats.get(chat_id)
+                if chat is not None and chat.version == version:
+                    self._schedule(chat, now)
+            while self._ready:
+                chat = self._chats.get(self._ready[0][3])
+                if chat is not None and chat.version == self._ready[0][4] and not chat.busy:
+                    break
+                heapq.heappop(self._ready)  # Застарілий запис
+            if self._ready:
+                global_wait = self._global.wait_time(now)
+                if global_wait <= 0:
+                    priority, _, _, chat_id, _ = heapq.heappop(self._ready)
+                    chat = self._chats[chat_id]
+                    chat.version += 1
+                    chat.busy = True
+                    chat.bucket.take(now)
+                    self._global.take(now)
+                    return chat, priority, self._coalesce(chat.queues[priority])
+                timeout = global_wait
+            elif self._delayed:
+                timeout = self._delayed[0][0] - now
+            else:
+                timeout = None
+            self._cond.wait(timeout)
+
+    def _coalesce(self, pending):
+        """Забирає з черги чату перше повідомлення разом з тими, що можна до нього приєднати."""
+        batch = pending.popleft()
+        while pending and _can_join(batch, pending[0]):
+            following = pending.popleft()
+            kwargs = dict(following.kwargs)
+            if 'reply_parameters' in batch.kwargs:
+                kwargs['reply_parameters'] = batch.kwargs['reply_parameters']  # Відповідь на перше повідомлення
+            batch = _Outgoing(batch.method, batch.text + COALESCE_SEPARATOR + following.text, kwargs,
+                              batch.enqueued_at, batch.count + following.count)
+        return batch
+
+    def _loop(self):
+        sweep = itertools.count(1)
+        while True:
+            with self._cond:
+                chat, priority, batch = self._take()
+                self._in_flight += 1
+            latency = time.monotonic() - batch.enqueued_at
+            retry_after = None
+            failed = False
+            try:
+                self._send(batch.method, chat.chat_id, batch.text, **batch.kwargs)
+            except Exception as e:
+                if getattr(e, 'error_code', None) == 429:  # Flood control: Telegram каже, скільки чекати
+                    parameters = (getattr(e, 'result_json', None) or {}).get('parameters') or {}
+                    retry_after = float(parameters.get('retry_after', 1))
+                else:  # Наприклад, користувач заблокував бота
+                    print(f"Не вдалося надіслати повідомлення в чат {chat.chat_id}: {e}")
+                    failed = True
+            with self._cond:
+                self._in_flight -= 1
+                chat.busy = False
+                now = time.monotonic()
+                if retry_after is not None:
+                    self.rate_limited += 1
+                    _rewind(batch.text)
+                    chat.queues[priority].appendleft(batch)  # Повторимо після паузи
+                    chat.paused_until = now + retry_after
+                elif failed:
+                    self._pending -= batch.count
+                    self.failed += 1
+                else:
+                    self._pending -= batch.count
+                    if batch.count > 1:
+                        self.coalesced += batch.count - 1
+                    self.sent += 1
+                    self._latencies[priority].append(latency)
+                if chat.head_priority() is not None:
+                    self._schedule(chat, now)
+                if next(sweep) % _SWEEP_EVERY == 0:
+                    self._sweep(now)
+                self._cond.notify_all()
+            if retry_after is not None:
+                metrics.inc("send_rate_limited_total")
+            elif failed:
+                metrics.inc("send_errors_total")
+            else:
+                metrics.observe("send_queue_seconds", latency, priority=PRIORITY_NAMES[priority])
+                metrics.inc("messages_sent_total", batch.count, priority=PRIORITY_NAMES[priority])
+
+    def _sweep(self, now):
+        """Видаляє чати без повідомлень, чий bucket уже повністю відновився (під self._cond)."""
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if not chat.busy and chat.head_priority() is None and chat.bucket.is_full(now)]:
+            del self._chats[chat_id]
+
+    def flush(self, timeout=5.0):
+        """Чекає (не довше timeout секунд), поки черга спорожніє; повертає True, якщо встигла."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        """Стан черги: розмір, лічильники і затримка в черзі (секунди) за останні повідомлення."""
+        with self._cond:
+            stats = {'queue_depth': self._pending, 'chats': len(self._chats), 'sent': self.sent,
+                     'coalesced': self.coalesced, 'rate_limited': self.rate_limited, 'failed': self.failed}
+            for priority, name in enumerate(PRIORITY_NAMES):
+                latencies = sorted(self._latencies[priority])
+                stats[f'{name}_p50'] = latencies[len(latencies) // 2] if latencies else 0.0
+                stats[f'{name}_p99'] = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] if latencies else 0.0
+        return stats
@@ -0,0 +1,175 @@
+# sessions.py
+# Сховище сесій користувачів замість необмеженого словника user_data.
+# Сесія - компактний об'єкт з __slots__; сховище видаляє сесії, які давно не
+# використовувались (TTL), і найстаріші сесії, якщо їх забагато (LRU).
+# Вибраний банк можна зберігати в SQLite, щоб він переживав перезапуск бота.
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", 3600))  # Через скільки секунд неактивності сесія видаляється
+SESSION_MAX = int(os.getenv("SESSION_MAX", 50000))  # Максимальна кількість сесій у пам'яті
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # 'sqlite' або 'memory'
+SESSION_FLOW_TIMEOUT = float(os.getenv("SESSION_FLOW_TIMEOUT", 900))  # Через скільки секунд покинутий діалог скидається
+
+
+class Session:
+    """Дані одного чату: вибраний банк і стан діалогу конвертації."""
+    __slots__ = ('chat_id', 'source', 'state', 'from_currency', 'to_currency', 'amount', 'last_seen')
+
+    def __init__(self, chat_id, source):
+        self.chat_id = chat_id
+        self.source = source
+        self.state = None  # Крок діалогу ('awaiting_amount' тощо) або None
+        self.from_currency = None
+        self.to_currency = None
+        self.amount = None
+        self.last_seen = time.monotonic()
+
+    def clear_conversion(self):
+        """Скидає дані конвертації (вибраний банк залишається)."""
+        self.state = None
+        self.from_currency = None
+        self.to_currency = None
+        self.amount = None
+
+
+class SqliteSessionBackend:
+    """Зберігає вибраний банк кожного чату в таблиці user_settings (db.py)."""
+
+    def load_source(self, chat_id):
+        try:
+            return db.load_user_source(chat_id)
+        except sqlite3.Error as e:
+            logger.warning("Не вдалося прочитати налаштування чату %s: %s", chat_id, e)
+            return None
+
+    def save_source(self, chat_id, source):
+        try:
+            db.save_user_source(chat_id, source)
+        except sqlite3.Error as e:
+            logger.warning("Не вдалося зберегти налаштування чату %s: %s", chat_id, e)
+
+
+class SessionStore:
+    """
+    Потокобезпечне сховище сесій з TTL та LRU-витісненням.
+
+    Args:
+        default_source: Банк для нових користувачів.
+        ttl: Час неактивності (секунди), після якого сесія видаляється.
+        max_sessions: Максимальна кількість сесій у пам'яті.
+        backend: Необов'язкове постійне сховище вибраного банку (див. SqliteSessionBackend).
+        flow_timeout: Час неактивності (секунди), після якого незавершений діалог скидається.
+    """
+
+    def __init__(self, default_source, ttl=SESSION_TTL, max_sessions=SESSION_MAX, backend=None,
+                 flow_timeout=SESSION_FLOW_TIMEOUT):
+        self.default_source = default_source
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.backend = backend
+        self.flow_timeout = flow_timeout
+        self._sessions = OrderedDict()  # chat_id -> Session, від найдавніше до найнедавніше використаної
+        self._lock = threading.Lock()
+        self.evicted = 0  # Скільки сесій видалено за TTL або лімітом
+        self.expired_flows = 0  # Скільки покинутих діалогів скинуто за flow_timeout
+
+    def _evict(self, now):
+        """Видаляє прострочені сесії і найстаріші понад ліміт (викликати під блокуванням)."""
+        sessions = self._sessions
+        while sessions:
+            oldest = next(iter(sessions.values()))
+            if now - oldest.last_seen < self.ttl and len(sessions) <= self.max_sessions:
+                break
+            sessions.popitem(last=False)
+            self.evicted += 1
+
+    def touch(self, chat_id):
+        """Повертає сесію чату, якщо вона є в пам'яті (як get, але без звернення до backend), інакше None."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is not None:
+                session.last_seen = now
+                self._sessions.move_to_end(chat_id)
+                self._evict(now)
+            return session
+
+    def get(self, chat_id):
+        """Повертає сесію чату, створюючи її за потреби (банк підтягується з backend)."""
+        session = self.touch(chat_id)
+        if session is not None:
+            return session
+
+        now = time.monotonic()
+        source = self.backend.load_source(chat_id) if self.backend else None
+        with self._lock:
+            session = self._sessions.get(chat_id)  # Інший потік міг створити сесію, поки ми читали backend
+            if session is None:
+                session = Session(chat_id, source or self.default_source)
+                self._sessions[chat_id] = session
+            session.last_seen = now
+            self._sessions.move_to_end(chat_id)
+            self._evict(now)
+            return session
+
+    def peek(self, chat_id):
+        """Повертає сесію чату, якщо вона є в пам'яті, не створюючи нової."""
+        with self._lock:
+            return self._sessions.get(chat_id)
+
+    def current_state(self, chat_id):
+        """
+        Крок діалогу, на якому знаходиться чат, або None.
+
+        Якщо користувач покинув діалог і не писав довше за flow_timeout,
+        дані конвертації скидаються, і повідомлення обробляється як звичайне.
+        """
+        session = self.peek(chat_id)
+        if session is None or session.state is None:
+            return None
+        if time.monotonic() - session.last_seen > self.flow_timeout:
+            session.clear_conversion()
+            self.expired_flows += 1
+            return None
+        return session.state
+
+    def reset_state(self, chat_id):
+        """Перериває поточний діалог чату (якщо він є)."""
+        session = self.peek(chat_id)
+        if session is not None:
+            session.state = None
+
+    def get_source(self, chat_id):
+        """Вибраний банк чату."""
+        return self.get(chat_id).source
+
+    def set_source(self, chat_id, source):
+        """Запам'ятовує вибраний банк (і зберігає його в backend, якщо він є)."""
+        self.get(chat_id).source = source
+        if self.backend:
+            self.backend.save_source(chat_id, source)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        """Кількість активних сесій, чати, що зараз у діалозі, і скільки сесій та діалогів видалено."""
+        with self._lock:
+            in_flow = sum(1 for session in self._sessions.values() if session.state is not None)
+            return {'sessions': len(self._sessions), 'in_flow': in_flow, 'evicted': self.evicted,
+                    'expired_flows': self.expired_flows}
+
+
+def create_session_store(default_source):
+    """Створює сховище сесій відповідно до SESSION_BACKEND."""
+    backend = SqliteSessionBackend() if SESSION_BACKEND == "sqlite" else None
+    return SessionStore(default_source, backend=backend)
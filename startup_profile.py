@@ -0,0 +1,114 @@
+# startup_profile.py
+# Профіль холодного старту бота: скільки часу займає імпорт кожного модуля
+# (python -X importtime) і скільки проходить від запуску процесу до моменту,
+# коли бот готовий отримувати оновлення (імпорт main, створення таблиць,
+# відновлення курсів зі знімка).  Кожен запуск - новий процес з новою базою.
+# Запити до Telegram і банків не виконуються.
+#
+# Запуск: python startup_profile.py [--runs 5] [--top 15] [--budget-ms 500]
+#         python startup_profile.py --fail-over-budget   # код виходу 1, якщо бюджет перевищено
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 500))  # Бюджет холодного старту (мілісекунди)
+
+# Код дочірнього процесу: ті самі кроки, що й main.run() до початку polling
+CHILD_CODE = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.init_db()
+db_ready = time.perf_counter()
+main.load_snapshots()
+ready = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'db_init_ms': (db_ready - imported) * 1000,
+                  'snapshots_ms': (ready - db_ready) * 1000}), flush=True)
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Розбирає вивід python -X importtime.
+
+    Returns:
+        Список кортежів (name, depth, self_us, cumulative_us) у порядку виводу.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip()
+        modules.append((stripped, (len(name) - len(stripped) - 1) // 2, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def profile_once():
+    """Запускає один холодний старт у новому процесі з новою базою."""
+    env = dict(os.environ)
+    env.setdefault("TOKEN", "0:startup-profile")
+    env["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "startup.db")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-c", CHILD_CODE], cwd=ROOT, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    total_ms = (time.perf_counter() - started) * 1000  # Від запуску процесу до готовності
+    _, stderr = process.communicate()
+    if process.returncode != 0 or not line:
+        raise RuntimeError(f"Дочірній процес завершився з кодом {process.returncode}:\n{stderr}")
+    phases = json.loads(line)
+    phases['total_ms'] = total_ms
+    return phases, parse_importtime(stderr)
+
+
+def print_report(runs, modules, top):
+    """Друкує медіани фаз старту і найдорожчі імпорти останнього запуску."""
+    print(f"Холодний старт, медіана з {len(runs)} запусків:")
+    for phase, title in (('import_ms', "import main"), ('db_init_ms', "db.init()"),
+                         ('snapshots_ms', "load_snapshots()"), ('total_ms', "від запуску процесу до готовності")):
+        print(f"  {title:36} {statistics.median(run[phase] for run in runs):8.1f} мс")
+
+    print("\nМодулі, які імпортує main (кумулятивно):")
+    direct = [module for module in modules if module[1] == 1]
+    for name, _, _, cumulative_us in sorted(direct, key=lambda module: -module[3])[:top]:
+        print(f"  {name:36} {cumulative_us / 1000:8.1f} мс")
+
+    print("\nНайдорожчі модулі (власний час імпорту):")
+    for name, _, self_us, _ in sorted(modules, key=lambda module: -module[2])[:top]:
+        print(f"  {name:36} {self_us / 1000:8.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Профіль імпорту і холодного старту бота")
+    parser.add_argument("--runs", type=int, default=5, help="Кількість холодних стартів")
+    parser.add_argument("--top", type=int, default=15, help="Скільки модулів показати")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Бюджет холодного старту в мілісекундах (медіана)")
+    parser.add_argument("--fail-over-budget", action="store_true", help="Код виходу 1, якщо бюджет перевищено")
+    args = parser.parse_args()
+
+    runs = []
+    modules = []
+    for _ in range(args.runs):
+        phases, modules = profile_once()
+        runs.append(phases)
+    print_report(runs, modules, args.top)
+
+    total = statistics.median(run['total_ms'] for run in runs)
+    verdict = "OK" if total <= args.budget_ms else "OVER BUDGET"
+    print(f"\nБюджет холодного старту: {total:.0f} / {args.budget_ms:.0f} мс - {verdict}")
+    if total > args.budget_ms and args.fail_over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# stress_db.py
+# Навантажувальна перевірка db.py: багато потоків одночасно викликають
+# add_conversion і get_history, як це робить пул потоків TeleBot.
+#
+# Запуск: python stress_db.py [--threads 32] [--ops 500]
+# Скрипт працює з тимчасовою базою і не чіпає currency_bot.db.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стрес-тест доступу до SQLite з багатьох потоків")
+    parser.add_argument("--threads", type=int, default=32, help="Кількість потоків (чатів)")
+    parser.add_argument("--ops", type=int, default=500, help="Кількість конвертацій на потік")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["DB_PATH"] = os.path.join(tmp_dir, "stress.db")
+    import db  # Імпортуємо після DB_PATH, щоб модуль відкрив тимчасову базу
+
+    errors = []
+    barrier = threading.Barrier(args.threads)
+
+    def worker(chat_id):
+        barrier.wait()  # Стартуємо всі потоки одночасно
+        try:
+            for i in range(args.ops):
+                # Сума кодує chat_id, щоб перевірити, що потік бачить лише свої записи
+                db.add_conversion(chat_id, chat_id + i / 10000, "USD", "UAH", float(i))
+                history = db.get_history(chat_id, limit=10)
+                if not history:
+                    errors.append(f"chat {chat_id}: порожня історія після add_conversion")
+                    return
+                if history[0][3] != float(i):
+                    errors.append(f"chat {chat_id}: останній запис {history[0]}, очікувався {i}; {history}")
+                    return
+                foreign = [row for row in history if int(row[0]) != chat_id]
+                if foreign:
+                    errors.append(f"chat {chat_id}: чужі записи в історії {foreign[:3]}")
+                    return
+        except Exception as e:  # Будь-яка помилка SQLite - це провал тесту
+            errors.append(f"chat {chat_id}: {type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(chat_id,)) for chat_id in range(1, args.threads + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.flush()
+    elapsed = time.perf_counter() - started
+
+    total = db._read_connection().execute("SELECT COUNT(*) FROM conversions").fetchone()[0]
+    expected = args.threads * args.ops
+    if total != expected:
+        errors.append(f"у базі {total} записів, очікувалось {expected}")
+
+    stats = db.get_writer_stats()
+    print(f"{expected} конвертацій і {expected} запитів історії з {args.threads} потоків за {elapsed:.2f} с "
+          f"({2 * expected / elapsed:.0f} оп/с)")
+    print(f"Групових комітів: {stats['flushes']}, середній час коміту {stats['avg_flush_ms']:.2f} мс, "
+          f"максимальний {stats['max_flush_ms']:.2f} мс")
+    if errors:
+        print(f"ПОМИЛКИ ({len(errors)}):")
+        for error in errors[:20]:
+            print("  " + error)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
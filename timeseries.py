@@ -0,0 +1,322 @@
+# timeseries.py
+# Історія курсів для команди /trend.  Після кожного оновлення кешу api курс
+# кожної пари, яку банк публікує напряму, дописується в компактні ряди:
+#   - стовпці зберігаються в array (8 байт на значення), а не в списках об'єктів;
+#   - час зберігається різницями з попереднім записом (array('I'), 4 байти);
+#   - три рівні деталізації з власним терміном зберігання: кожне оновлення (raw),
+#     агрегати за годину і за добу (мінімум, максимум, середнє, кількість).
+# Агрегати оновлюються одразу при додаванні, тож запит за роки читає лише
+# кілька тисяч денних точок.  Ряди зберігаються в SQLite (таблиця rate_history)
+# раз на TIMESERIES_SAVE_INTERVAL секунд і при зупинці бота.
+import atexit
+import bisect
+import itertools
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+import db
+
+DAY = 86400
+RAW_RETENTION = float(os.getenv("TIMESERIES_RAW_DAYS", 2)) * DAY  # Кожне оновлення курсів
+HOURLY_RETENTION = float(os.getenv("TIMESERIES_HOURLY_DAYS", 60)) * DAY  # Погодинні агрегати
+DAILY_RETENTION = float(os.getenv("TIMESERIES_DAILY_DAYS", 3650)) * DAY  # Щоденні агрегати
+SAVE_INTERVAL = float(os.getenv("TIMESERIES_SAVE_INTERVAL", 3600))  # Як часто зберігати ряди в базу (секунди)
+
+# (назва, крок агрегації в секундах, термін зберігання); 0 - без агрегації
+TIERS = (("raw", 0, RAW_RETENTION), ("hourly", 3600, HOURLY_RETENTION), ("daily", DAY, DAILY_RETENTION))
+
+DEFAULT_TREND_PAIR = ("USD", "UAH")
+DEFAULT_TREND_RANGE = "7d"
+RANGE_UNITS = {'h': 3600, 'd': DAY, 'w': 7 * DAY, 'm': 30 * DAY, 'y': 365 * DAY}
+_RANGE_RE = re.compile(r"^(\d{1,4})([hdwmy])$")
+_CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+_HEADER = struct.Struct("<qI")  # Час першого запису, кількість записів
+TRIM_SLACK = 0.1  # Старі записи видаляються, коли їх набирається на 10% терміну зберігання
+
+logger = logging.getLogger(__name__)
+
+# Результат запиту /trend: значення points - для спарклайна (по одному на точку ряду)
+Trend = namedtuple("Trend", ["first", "last", "low", "high", "mean", "points", "tier", "start", "end"])
+
+
+class _Tier:
+    """
+    Один рівень деталізації ряду.  Для агрегованого рівня кожен запис - кошик
+    тривалістю step секунд; для raw (step=0) - окреме оновлення курсу, і
+    стовпці lows/highs/counts не зберігаються.
+    """
+    __slots__ = ('step', 'retention', 'start', 'last', 'deltas', 'means', 'lows', 'highs', 'counts')
+
+    def __init__(self, step, retention):
+        self.step = step
+        self.retention = retention
+        self.clear()
+
+    def clear(self):
+        self.start = None  # Час першого запису; deltas[0] завжди 0
+        self.last = None  # Час останнього запису
+        self.deltas = array('I')
+        self.means = array('d')
+        self.lows = array('d') if self.step else None
+        self.highs = array('d') if self.step else None
+        self.counts = array('I') if self.step else None
+
+    def add(self, timestamp, value):
+        if self.step:
+            timestamp -= timestamp % self.step  # Початок кошика
+            if timestamp == self.last:
+                count = self.counts[-1] + 1
+                self.counts[-1] = count
+                self.means[-1] += (value - self.means[-1]) / count
+                self.lows[-1] = min(self.lows[-1], value)
+                self.highs[-1] = max(self.highs[-1], value)
+                return
+        if self.last is not None and timestamp <= self.last:
+            return  # Старіші записи (наприклад, знімок після перезапуску) не додаємо
+        if self.start is None:
+            self.start = timestamp
+        self.deltas.append(timestamp - self.last if self.last is not None else 0)
+        self.last = timestamp
+        self.means.append(value)
+        if self.step:
+            self.lows.append(value)
+            self.highs.append(value)
+            self.counts.append(1)
+
+    def timestamps(self):
+        return list(itertools.accumulate(self.deltas, initial=self.start))[1:]
+
+    def trim(self, now):
+        """Видаляє записи, старіші за термін зберігання (пачкою, а не по одному)."""
+        if self.start is None or self.start >= now - self.retention * (1 + TRIM_SLACK):
+            return
+        timestamps = self.timestamps()
+        drop = bisect.bisect_left(timestamps, now - self.retention)
+        if drop == len(timestamps):
+            self.clear()
+            return
+        for column in (self.deltas, self.means, self.lows, self.highs, self.counts):
+            if column is not None:
+                del column[:drop]
+        self.start = timestamps[drop]
+        self.deltas[0] = 0
+
+    def query(self, begin, end):
+        """
+        Повертає (timestamps, means, lows, highs, counts) для записів з begin <= час <= end.
+        Для raw lows і highs збігаються з means, а counts - None.
+        """
+        if self.start is None:
+            return [], [], [], [], None
+        timestamps = self.timestamps()
+        lo = bisect.bisect_left(timestamps, begin)
+        hi = bisect.bisect_right(timestamps, end)
+        means = self.means[lo:hi]
+        if not self.step:
+            return timestamps[lo:hi], means, means, means, None
+        return timestamps[lo:hi], means, self.lows[lo:hi], self.highs[lo:hi], self.counts[lo:hi]
+
+    def dump(self):
+        """Серіалізує рівень у байти (заголовок і стовпці array у порядку байтів платформи)."""
+        columns = [self.deltas, self.means]
+        if self.step:
+            columns += [self.lows, self.highs, self.counts]
+        body = b"".join(column.tobytes() for column in columns)
+        return zlib.compress(_HEADER.pack(self.start or 0, len(self.deltas)) + body)
+
+    def restore(self, payload):
+        raw = zlib.decompress(payload)
+        start, length = _HEADER.unpack_from(raw)
+        offset = _HEADER.size
+        columns = [self.deltas, self.means]
+        if self.step:
+            columns += [self.lows, self.highs, self.counts]
+        for column in columns:
+            size = length * column.itemsize
+            column.frombytes(raw[offset:offset + size])
+            offset += size
+        if length:
+            self.start = start
+            self.last = start + sum(self.deltas)
+
+
+class _PairSeries:
+    """Усі рівні деталізації для однієї пари валют."""
+    __slots__ = ('tiers',)
+
+    def __init__(self):
+        self.tiers = {name: _Tier(step, retention) for name, step, retention in TIERS}
+
+    def add(self, timestamp, value):
+        for tier in self.tiers.values():
+            tier.add(timestamp, value)
+            tier.trim(timestamp)
+
+
+def direct_pairs(index):
+    """
+    Пари, які банк публікує напряму, з середнім курсом (купівля + продаж) / 2.
+
+    Args:
+        index: Індекс пар з rates.build_rate_index.
+
+    Returns:
+        Словник (from, to) -> середній курс "1 from = x to".
+    """
+    pairs = {}
+    for (currency_from, currency_to), quote in index.items():
+        if quote.via is None and not quote.inverted:
+            reverse = index.get((currency_to, currency_from))
+            value = (quote.shown_rate + reverse.shown_rate) / 2 if reverse else quote.shown_rate
+            pairs[(currency_from, currency_to)] = value
+    return pairs
+
+
+class RateHistory:
+    """
+    Сховище рядів курсів: (source, from, to) -> ряди raw/hourly/daily.
+
+    Метод record підключається як слухач оновлень кешу api
+    (api.add_refresh_listener), а trend відповідає на запит /trend.
+    """
+
+    def __init__(self, save_interval=SAVE_INTERVAL):
+        self.save_interval = save_interval
+        self._series = {}
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self._atexit_registered = False
+
+    def __len__(self):
+        return len(self._series)
+
+    def record(self, source, entry):
+        """Слухач оновлення кешу: дописує курси з нового запису кешу в ряди."""
+        self.add(source, int(entry['timestamp']), direct_pairs(entry['index']))
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def add(self, source, timestamp, pairs):
+        """Додає курси pairs ({(from, to): курс}) з часом timestamp (секунди)."""
+        with self._lock:
+            for (currency_from, currency_to), value in pairs.items():
+                key = (source, currency_from, currency_to)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = _PairSeries()
+                series.add(timestamp, value)
+
+    def trend(self, source, currency_from, currency_to, seconds, now=None):
+        """
+        Статистика курсу пари за останні seconds секунд.
+
+        Використовується найдетальніший рівень, термін зберігання якого
+        покриває весь діапазон.  Для пари, яку банк публікує у зворотному
+        напрямку (UAH/USD), курси перераховуються.
+
+        Returns:
+            Trend або None, якщо для пари немає записів у діапазоні.
+        """
+        now = time.time() if now is None else now
+        begin = now - seconds
+        inverted = False
+        with self._lock:
+            series = self._series.get((source, currency_from, currency_to))
+            if series is None:
+                series = self._series.get((source, currency_to, currency_from))
+                inverted = True
+            if series is None:
+                return None
+            for name, _, retention in TIERS:
+                if retention >= seconds:
+                    break  # Інакше - найгрубіший рівень (останній у TIERS)
+            timestamps, means, lows, highs, weights = series.tiers[name].query(begin, now)
+        if not timestamps:
+            return None
+
+        if inverted:
+            means = [1 / value for value in means]
+            lows, highs = [1 / value for value in highs], [1 / value for value in lows]
+        if weights:
+            mean = sum(value * weight for value, weight in zip(means, weights)) / sum(weights)
+        else:
+            mean = sum(means) / len(means)
+        return Trend(first=means[0], last=means[-1], low=min(lows), high=max(highs), mean=mean,
+                     points=list(means), tier=name, start=timestamps[0], end=timestamps[-1])
+
+    def save(self):
+        """Зберігає всі ряди в базу однією транзакцією."""
+        with self._lock:
+            rows = [(source, f"{currency_from}/{currency_to}", name, tier.dump())
+                    for (source, currency_from, currency_to), series in self._series.items()
+                    for name, tier in series.tiers.items()]
+            self._last_save = time.monotonic()
+        try:
+            db.save_rate_history(rows)
+        except sqlite3.Error as e:
+            logger.warning("Не вдалося зберегти історію курсів: %s", e)
+
+    def load(self):
+        """Завантажує збережені ряди (при старті бота) і вмикає збереження при зупинці."""
+        try:
+            rows = db.load_rate_history()
+        except sqlite3.Error as e:
+            logger.warning("Не вдалося завантажити історію курсів: %s", e)
+            rows = []
+        with self._lock:
+            for source, pair, name, payload in rows:
+                currency_from, _, currency_to = pair.partition("/")
+                series = self._series.setdefault((source, currency_from, currency_to), _PairSeries())
+                tier = series.tiers.get(name)
+                if tier is None:
+                    continue  # Рівень, якого вже немає в TIERS
+                try:
+                    tier.restore(payload)
+                except (zlib.error, struct.error) as e:
+                    logger.warning("Пошкоджений ряд %s %s %s: %s", source, pair, name, e)
+                    series.tiers[name] = _Tier(tier.step, tier.retention)
+        if not self._atexit_registered:
+            atexit.register(self.save)
+            self._atexit_registered = True
+        logger.info("Завантажено історію курсів: %d пар", len(rows) // len(TIERS))
+
+
+def parse_trend_args(text):
+    """
+    Розбирає аргументи команди /trend.
+
+    Підтримуються форми "/trend", "/trend USD", "/trend USD UAH 30d" та
+    "/trend USD/UAH 1y".  Діапазон: число з одиницею h, d, w, m (30 днів) або y.
+
+    Returns:
+        Кортеж (from_currency, to_currency, seconds, label) або None, якщо
+        аргументи не розпізнано.
+    """
+    currencies = []
+    range_label = DEFAULT_TREND_RANGE
+    for part in text.upper().replace("/", " ").split()[1:]:
+        if _CURRENCY_RE.match(part):
+            currencies.append(part)
+        elif _RANGE_RE.match(part.lower()):
+            range_label = part.lower()
+        else:
+            return None
+    if len(currencies) > 2:
+        return None
+    if not currencies:
+        currencies = list(DEFAULT_TREND_PAIR)
+    elif len(currencies) == 1:
+        currencies.append("UAH" if currencies[0] != "UAH" else "USD")
+    number, unit = _RANGE_RE.match(range_label).groups()
+    seconds = int(number) * RANGE_UNITS[unit]
+    if not seconds:
+        return None
+    return currencies[0], currencies[1], seconds, range_label
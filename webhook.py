@@ -0,0 +1,209 @@
+# webhook.py
+# Режим webhook (BOT_MODE=webhook): Telegram сам надсилає оновлення POST-запитами
+# на вбудований HTTP-сервер замість довгого опитування getUpdates.
+# Сервер лише перевіряє секретний токен і кладе оновлення в обмежені черги;
+# обробники виконує фіксований пул потоків.  Оновлення одного чату завжди
+# потрапляють в одну чергу, тому обробляються по порядку.  Якщо черга
+# заповнена, сервер відповідає 503 і Telegram повторить доставку пізніше.
+#
+# Локальна перевірка: BOT_MODE=webhook python main.py, потім
+#   curl -X POST -H "Content-Type: application/json" \
+#        -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \
+#        --data @update.json http://localhost:8080/webhook
+import hmac
+import json
+import logging
+import os
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", os.getenv("WEBHOOK_PORT", 8080)))  # PORT задає платформа (Heroku)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публічна адреса сервера; якщо не задана, setWebhook не викликається
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Значення заголовка X-Telegram-Bot-Api-Secret-Token (обов'язкове)
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))  # Кількість потоків-обробників
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 256))  # Скільки оновлень може чекати в чергах разом
+MAX_BODY_SIZE = 1024 * 1024  # Оновлення Telegram значно менші; більше тіло - помилка клієнта
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+logger = logging.getLogger(__name__)
+
+
+def update_routing_key(update):
+    """
+    Повертає ключ для вибору черги: id чату, інакше id користувача, інакше update_id.
+
+    Args:
+        update: Оновлення у вигляді словника JSON, як його надсилає Telegram.
+    """
+    for field, payload in update.items():
+        if field == 'update_id' or not isinstance(payload, dict):
+            continue
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat and 'id' in chat:
+            return chat['id']
+        sender = payload.get('from') or payload.get('user')
+        if sender and 'id' in sender:
+            return sender['id']
+    return update.get('update_id', 0)
+
+
+class UpdateDispatcher:
+    """
+    Фіксований пул потоків з обмеженою чергою на кожен потік.
+
+    Args:
+        process_update: Функція, яка обробляє одне оновлення (telebot.types.Update).
+        workers: Кількість потоків-обробників.
+        queue_size: Загальна місткість черг; при переповненні submit() повертає False.
+    """
+
+    def __init__(self, process_update, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE):
+        self.process_update = process_update
+        per_worker = max(1, queue_size // max(1, workers))
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(max(1, workers))]
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        for number, updates in enumerate(self._queues):
+            thread = threading.Thread(target=self._worker_loop, args=(updates,),
+                                      name=f"webhook-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, update):
+        """Ставить оновлення (словник JSON) в чергу; False, якщо черга заповнена."""
+        updates = self._queues[hash(update_routing_key(update)) % len(self._queues)]
+        try:
+            updates.put_nowait(update)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+
+    def _worker_loop(self, updates):
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                self.process_update(types.Update.de_json(update))
+                with self._stats_lock:
+                    self.processed += 1
+            except Exception:  # Помилка одного оновлення не повинна зупиняти потік
+                logger.exception("Помилка обробки оновлення %s", update.get('update_id'))
+                with self._stats_lock:
+                    self.failed += 1
+
+    def stop(self, timeout=5):
+        """Дочікується обробки вже прийнятих оновлень і зупиняє потоки."""
+        for updates in self._queues:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        """Кількість оновлень у чергах, оброблених, відхилених через переповнення та з помилкою."""
+        with self._stats_lock:
+            return {'queued': sum(updates.qsize() for updates in self._queues), 'processed': self.processed,
+                    'rejected': self.rejected, 'failed': self.failed}
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Приймає POST з оновленням, перевіряє секрет і передає оновлення диспетчеру."""
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Перевірка стану для балансувальника навантаження
+        if self.path == "/health":
+            body = json.dumps(self.server.dispatcher.stats()).encode()
+            self._reply(200, body, {"Content-Type": "application/json"})
+        else:
+            self._reply(404)
+
+    def do_POST(self):
+        if self.path != self.server.webhook_path:
+            self._reply(404)
+            return
+        secret = self.server.secret_token
+        # Без секрету будь-хто, хто знає адресу, міг би надсилати боту підроблені оновлення
+        if not secret or not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), secret):
+            self._reply(403)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self._reply(413 if length > MAX_BODY_SIZE else 400)
+            return
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+        if not isinstance(update, dict) or 'update_id' not in update:
+            self._reply(400)
+            return
+        if self.server.dispatcher.submit(update):
+            self._reply(200)
+        else:
+            self._reply(503, headers={"Retry-After": "1"})  # Черга заповнена - Telegram повторить пізніше
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def create_webhook_server(dispatcher, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                          secret_token=WEBHOOK_SECRET):
+    """Створює HTTP-сервер webhook (ще не запущений)."""
+    server = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+    server.dispatcher = dispatcher
+    server.webhook_path = path
+    server.secret_token = secret_token
+    return server
+
+
+def run_webhook(bot):
+    """
+    Запускає прийом оновлень через webhook для TeleBot (блокує потік до зупинки).
+
+    Бот має бути створений з threaded=False: обробники виконуються в потоках
+    UpdateDispatcher, а не у власному пулі TeleBot.
+
+    Raises:
+        ValueError: Якщо не задано WEBHOOK_SECRET.
+    """
+    if not WEBHOOK_SECRET:
+        raise ValueError("Для BOT_MODE=webhook потрібно задати WEBHOOK_SECRET")
+    dispatcher = UpdateDispatcher(lambda update: bot.process_new_updates([update]))
+    dispatcher.start()
+    server = create_webhook_server(dispatcher)
+    if WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                        max_connections=max(1, WEBHOOK_WORKERS * 2))
+    logger.info("Webhook слухає %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        dispatcher.stop()